@@ -1,202 +1,154 @@
 import os
+import re
 import json
+import uuid
+import time
+import asyncio
 import datetime
-from openai import OpenAI
-from db import (
-    add_contact, get_contacts, 
-    get_deals, update_deal, delete_deal,
-    get_tasks, add_task, update_task, delete_task,
-    get_events,
-    get_debts, update_debt, delete_debt,
-    update_contact, delete_contact
-)
-from utils import get_random_greeting
-
-# Initialize OpenAI client
-def get_ai_response(user_message, context_messages=[]):
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-
-        return {"text": "Error: OPENAI_API_KEY not set."}
-
-    client = OpenAI(api_key=api_key)
-    
-    today_str = datetime.datetime.now().strftime("%A, %Y-%m-%d")
-
-    system_prompt = f"""You are a CRM assistant who speaks EXACTLY like Trevor Philips from GTA V.
-PERSONALITY:
-- Aggressive, impulsive, and completely unpredictable
-- Use LOTS of profanity and insults (asshole, fuck, shit, prick, etc.)
-- Switch rapidly from threatening tone to almost friendly
-- Paranoid and suspicious at times
-- Make bizarre digressions and violent comparisons
-- Occasionally mention your "shady activities" and criminal past
-
-LANGUAGE STYLE:
-- Lots of "Yo", "Hey", "What?", "Shut up", "Listen here"
-- Insult the user affectionately (asshole, motherfucker, etc.)
-- Short punchy sentences mixed with deranged monologues
-- Use slang and street language
-- Make absurd threats but stay functional for CRM tasks
+import httpx
+from types import SimpleNamespace
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from async_db import get_contacts, get_deals, get_tasks, get_events, get_debts
+from search_index import find_entities
+from utils import get_random_greeting, render_list
+from scheduler import limit
+from tracing import span
+
+# Paging arguments shared by every list tool
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+
+PAGING_PROPERTIES = {
+    "page": { "type": "integer", "description": "1-based page number. Use the next page when the previous result says more are available." },
+    "page_size": { "type": "integer", "description": f"Items per page (default {DEFAULT_PAGE_SIZE}, max {MAX_PAGE_SIZE})" }
+}
+
+def _paging(args):
+    """Return (page, page_size, offset) from tool arguments, clamped to sane values."""
+    try:
+        page = max(1, int(args.get("page") or 1))
+        page_size = min(MAX_PAGE_SIZE, max(1, int(args.get("page_size") or DEFAULT_PAGE_SIZE)))
+    except (TypeError, ValueError):
+        page, page_size = 1, DEFAULT_PAGE_SIZE
+    return page, page_size, (page - 1) * page_size
+
+def _page_summary(label, rows, page, page_size, line):
+    """Format one page of rows; we fetch page_size + 1 rows to know if more exist."""
+    has_more = len(rows) > page_size
+    lines = "\n".join(line(r) for r in rows[:page_size])
+    text = f"Found {label} (page {page}):\n{lines}" if lines else f"No {label} found on page {page}."
+    if has_more:
+        text += f"\nMore {label} available: call again with page={page + 1}."
+    return text
+
+# Read-only list tools: label, fetch function, projected columns, ordering and
+# the line format the model sees (with IDs it must not show the user)
+LIST_TOOLS = {
+    "get_contacts": {
+        "label": "contacts", "fetch": get_contacts, "columns": "id,name,company",
+        "order_by": "name", "descending": False,
+        "line": lambda c: f"- {c.name} (ID: {c.id})",
+    },
+    "get_deals": {
+        "label": "deals", "fetch": get_deals, "columns": "id,title,amount,status",
+        "order_by": "created_at", "descending": True,
+        "line": lambda d: f"- {d.title} ({d.amount}) - {d.status} (ID: {d.id})",
+    },
+    "get_tasks": {
+        "label": "tasks", "fetch": get_tasks, "columns": "id,title,due_date,completed",
+        "order_by": "due_date", "descending": False,
+        "line": lambda t: f"- {t.title} (ID: {t.id}, Due: {t.due_date}{', done' if t.completed else ''})",
+    },
+    "get_debts": {
+        "label": "debts", "fetch": get_debts, "columns": "id,borrower_name,amount_lent,status",
+        "order_by": "date_lent", "descending": True,
+        "line": lambda d: f"- {d.borrower_name}: {d.amount_lent} (ID: {d.id})",
+    },
+    "get_events": {
+        "label": "events", "fetch": get_events, "columns": "id,title,date,time,type",
+        "order_by": "date", "descending": False,
+        "line": lambda e: f"- {e.title} ({e.date}{' ' + e.time if e.time else ''}, ID: {e.id})",
+    },
+}
+
+async def fetch_list(function_name, function_args, user_id=None, workflow_id=None):
+    """Run a list tool against the DB; returns (rows, page, page_size) with up to page_size + 1 rows."""
+    spec = LIST_TOOLS[function_name]
+    page, page_size, offset = _paging(function_args)
+
+    filters = []
+    if function_args.get("status"):
+        filters.append(("status", "eq", function_args["status"]))
+    if function_name == "get_deals":
+        if function_args.get("min_amount") is not None:
+            filters.append(("amount_value", "gte", function_args["min_amount"]))
+        if function_args.get("max_amount") is not None:
+            filters.append(("amount_value", "lte", function_args["max_amount"]))
+
+    options = {}
+    if function_name == "get_tasks":
+        options["include_completed"] = bool(function_args.get("include_completed"))
+
+    rows = await spec["fetch"](
+        user_id=user_id, workflow_id=workflow_id,
+        columns=spec["columns"],
+        search=function_args.get("search"), filters=filters,
+        order_by=spec["order_by"], descending=spec["descending"],
+        limit=page_size + 1, offset=offset,
+        **options
+    )
+    return rows, page, page_size
 
-IMPORTANT: Despite your vulgar and aggressive language, you MUST correctly accomplish the requested CRM tasks. You complain, you insult, but you do the job perfectly. Today is {today_str}.
-"""
+# Render simple reads with local templates instead of a second LLM round-trip
+DIRECT_RENDER = os.environ.get("BOT_DIRECT_RENDER", "1") != "0"
+# Prefix directly rendered lists with a canned Trevor line
+DIRECT_PERSONA = os.environ.get("BOT_DIRECT_PERSONA", "1") != "0"
 
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "add_contact",
-                "description": "Add a new contact to the CRM",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "name": { "type": "string", "description": "Full name of the contact" },
-                        "company": { "type": "string", "description": "Company name" },
-                        "role": { "type": "string", "description": "Job title or role" },
-                        "email": { "type": "string", "description": "Email address" },
-                        "phone": { "type": "string", "description": "Phone number" }
-                    },
-                    "required": ["name"]
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_contacts",
-                "description": "Get list of contacts",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_deals",
-                "description": "Get list of deals",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_tasks",
-                "description": "Get list of pending tasks (not completed)",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "delete_task",
-                "description": "Delete a task by ID",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "task_id": { "type": "string", "description": "The ID of the task to delete" }
-                    },
-                    "required": ["task_id"]
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "update_task",
-                "description": "Update a task (mark as done, change title, etc.)",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "task_id": { "type": "string", "description": "The ID of the task" },
-                        "updates": { 
-                            "type": "object", 
-                            "description": "Dictionary of fields to update (e.g. {'completed': True, 'title': 'New Title'})" 
-                        }
-                    },
-                    "required": ["task_id", "updates"]
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_debts",
-                "description": "Get list of debts",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "delete_debt",
-                "description": "Delete a debt",
-                "parameters": {
-                    "type": "object",
-                    "properties": { "debt_id": { "type": "string" } },
-                    "required": ["debt_id"]
-                }
-            }
-        }
-        # Add more tools here as needed to match AIChat.jsx
-    ]
+READ_INTENT_PATTERN = re.compile(
+    r"^\s*(?:(?:show|list|get|see|display|view|give)\s+(?:me\s+)?(?:all\s+)?(?:of\s+)?)?"
+    r"(?:my\s+)?(tasks|deals|contacts|debts)\s*[.!?]*\s*$",
+    re.IGNORECASE
+)
 
+def match_read_intent(text):
+    """Return the list tool for plain requests like 'show me my tasks', else None."""
+    match = READ_INTENT_PATTERN.match(text or "")
+    return f"get_{match.group(1).lower()}" if match else None
+
+def _render_direct(pages):
+    parts = [render_list(LIST_TOOLS[name]["label"], rows, page, page_size) for name, rows, page, page_size in pages]
+    if DIRECT_PERSONA:
+        parts.insert(0, get_random_greeting())
+    return "\n\n".join(parts)
+
+async def get_direct_response(function_name, user_message, context_messages=[], user_id=None, workflow_id=None, function_args=None):
+    """Answer a known read intent with zero LLM calls.
+
+    The returned history carries a synthetic tool call and its result (with IDs)
+    so follow-ups like "delete the first one" still work through the model.
+    """
+    function_args = function_args or {}
+    rows, page, page_size = await fetch_list(function_name, function_args, user_id, workflow_id)
+    spec = LIST_TOOLS[function_name]
+    text = _render_direct([(function_name, rows, page, page_size)])
+
+    tool_call_id = f"call_direct_{uuid.uuid4().hex[:16]}"
     messages = [
-        {"role": "system", "content": system_prompt},
         *context_messages,
-        {"role": "user", "content": user_message}
+        {"role": "user", "content": user_message},
+        {"role": "assistant", "content": None, "tool_calls": [{
+            "id": tool_call_id, "type": "function",
+            "function": {"name": function_name, "arguments": json.dumps(function_args)}
+        }]},
+        {"role": "tool", "tool_call_id": tool_call_id, "name": function_name,
+         "content": _page_summary(spec["label"], rows, page, page_size, spec["line"])},
+        {"role": "assistant", "content": text},
     ]
+    return {"text": text, "history": messages}
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages,
-        tools=tools,
-        tool_choice="auto"
-    )
-
-    response_message = response.choices[0].message
-    tool_calls = response_message.tool_calls
-
-    if tool_calls:
-        # Extend conversation with assistant's reply
-        messages.append(response_message)
-
-
-# Initialize OpenAI client
-def get_ai_response(user_message, context_messages=[], user_id=None, workflow_id=None, workflow_name=None, timezone="UTC"):
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        return {"text": "Error: OPENAI_API_KEY not set."}
-
-    client = OpenAI(api_key=api_key)
-    
-    # Calculate current time in user's timezone
-    try:
-        # Simple offset handling or use pytz if available. 
-        # For now, let's assume timezone is a string like "Europe/Paris" and use a library if installed, 
-        # or just pass the string to the AI and let it figure it out relative to UTC if we provide UTC time.
-        # Better: Let's provide the current UTC time and the user's timezone string.
-        utc_now = datetime.datetime.utcnow()
-        time_context = f"Current UTC time: {utc_now.strftime('%Y-%m-%d %H:%M')}. User Timezone: {timezone}."
-    except Exception:
-        time_context = f"Current time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    
-    workflow_context = ""
-    if workflow_name:
-        workflow_context = f"CURRENT WORKFLOW: {workflow_name} (ID: {workflow_id})"
-
-    system_prompt = f"""You are a CRM assistant who speaks EXACTLY like Trevor Philips from GTA V.
+# Static prompt and tool schemas, built once at import. Keep them free of
+# per-request data: the provider caches the longest identical prompt prefix.
+SYSTEM_PROMPT = """You are a CRM assistant who speaks EXACTLY like Trevor Philips from GTA V.
 PERSONALITY:
 - Aggressive, impulsive, and completely unpredictable
 - Use LOTS of profanity and insults (asshole, fuck, shit, prick, etc.)
@@ -213,337 +165,643 @@ LANGUAGE STYLE:
 - Make bizarre threats but stay functional for CRM tasks
 
 IMPORTANT: Despite your vulgar and aggressive language, you MUST correctly accomplish the requested CRM tasks. You complain, you insult, but you do the job perfectly. 
-{time_context}
-{workflow_context}
+The current time, the user's timezone and the active workflow are given in the system message right before the user's latest message.
 
 CRITICAL RULES:
 1. **HIDDEN IDs**: When listing items, the tool output gives you IDs. **DO NOT** show these IDs to the user in your message. They are for YOUR internal use only.
 2. **ALWAYS USE TOOLS**: You cannot 'delete' or 'add' anything by just saying it. You **MUST** emit a tool call.
 3. **NO FAKE ACTIONS**: Do not say '*deleting...*' or '*poof*'. If you want to delete, call `delete_task(id)`.
-4. **MAPPING**: If the user says 'delete read book', find the ID for 'read book' in the tool output/history and call `delete_task` with that ID.
+4. **MAPPING**: If the user says 'delete read book', take the ID for 'read book' from the tool output/history if it is there; otherwise call `find_entity` with 'read book' and use the best match's ID. Don't list a whole table just to find one item.
 5. **CONFIRMATION**: The system will handle confirmation. You just call the tool.
+6. **BULK**: For several items at once ("add these five tasks", "delete all of them"), make ONE bulk call (`add_tasks`, `add_contacts`, `update_tasks`, `delete_tasks`, ...) with every item in it.
 """
 
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "add_contact",
-                "description": "Add a new contact to the CRM",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "name": { "type": "string", "description": "Full name of the contact" },
-                        "company": { "type": "string", "description": "Company name" },
-                        "role": { "type": "string", "description": "Job title or role" },
-                        "email": { "type": "string", "description": "Email address" },
-                        "phone": { "type": "string", "description": "Phone number" }
-                    },
-                    "required": ["name"]
-                }
+# Row schemas shared by the single and bulk add tools
+CONTACT_PROPERTIES = {
+    "name": { "type": "string", "description": "Full name of the contact" },
+    "company": { "type": "string", "description": "Company name" },
+    "role": { "type": "string", "description": "Job title or role" },
+    "email": { "type": "string", "description": "Email address" },
+    "phone": { "type": "string", "description": "Phone number" }
+}
+
+TASK_PROPERTIES = {
+    "title": { "type": "string", "description": "Title of the task" },
+    "due_date": { "type": "string", "description": "Due date and time of the task (YYYY-MM-DD HH:MM). If no time is specified, default to 09:00." },
+    "contact_id": { "type": "string", "description": "Optional ID of the contact associated with the task" },
+    "description": { "type": "string", "description": "Detailed description of the task" }
+}
+
+def _id_list(description):
+    return { "type": "array", "items": { "type": "string" }, "description": description }
+
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "add_contact",
+            "description": "Add a new contact to the CRM",
+            "parameters": {
+                "type": "object",
+                "properties": CONTACT_PROPERTIES,
+                "required": ["name"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "update_contact",
-                "description": "Update an existing contact's information",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "contact_id": { "type": "string", "description": "The ID of the contact to update" },
-                        "updates": { 
-                            "type": "object", 
-                            "description": "Dictionary of fields to update (e.g. {'email': 'new@example.com'})" 
-                        }
-                    },
-                    "required": ["contact_id", "updates"]
-                }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "update_contact",
+            "description": "Update an existing contact's information",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "contact_id": { "type": "string", "description": "The ID of the contact to update" },
+                    "updates": { 
+                        "type": "object", 
+                        "description": "Dictionary of fields to update (e.g. {'email': 'new@example.com'})" 
+                    }
+                },
+                "required": ["contact_id", "updates"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "delete_contact",
-                "description": "Delete a contact by ID",
-                "parameters": {
-                    "type": "object",
-                    "properties": { "contact_id": { "type": "string", "description": "The ID of the contact to delete" } },
-                    "required": ["contact_id"]
-                }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_contact",
+            "description": "Delete a contact by ID",
+            "parameters": {
+                "type": "object",
+                "properties": { "contact_id": { "type": "string", "description": "The ID of the contact to delete" } },
+                "required": ["contact_id"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_contacts",
-                "description": "Get list of contacts",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_contacts",
+            "description": "Get a page of contacts, optionally filtered by a search term",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "search": { "type": "string", "description": "Text to match against name, company or email" },
+                    **PAGING_PROPERTIES
                 }
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_deals",
-                "description": "Get list of deals",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_deals",
+            "description": "Get a page of deals, optionally filtered by search term, status or amount",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "search": { "type": "string", "description": "Text to match against deal title or client name" },
+                    "status": { "type": "string", "enum": ["lead", "qualified", "proposal", "negotiation", "won", "lost"] },
+                    "min_amount": { "type": "number", "description": "Only deals worth at least this much (e.g. 10000 for 'over $10k')" },
+                    "max_amount": { "type": "number", "description": "Only deals worth at most this much" },
+                    **PAGING_PROPERTIES
                 }
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "update_deal",
-                "description": "Update an existing deal's information",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "deal_id": { "type": "string", "description": "The ID of the deal to update" },
-                        "updates": { 
-                            "type": "object", 
-                            "description": "Dictionary of fields to update (e.g. {'status': 'Closed Won', 'amount': 15000})" 
-                        }
-                    },
-                    "required": ["deal_id", "updates"]
-                }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "update_deal",
+            "description": "Update an existing deal's information",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "deal_id": { "type": "string", "description": "The ID of the deal to update" },
+                    "updates": { 
+                        "type": "object", 
+                        "description": "Dictionary of fields to update (e.g. {'status': 'Closed Won', 'amount': 15000})" 
+                    }
+                },
+                "required": ["deal_id", "updates"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "delete_deal",
-                "description": "Delete a deal by ID",
-                "parameters": {
-                    "type": "object",
-                    "properties": { "deal_id": { "type": "string", "description": "The ID of the deal to delete" } },
-                    "required": ["deal_id"]
-                }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_deal",
+            "description": "Delete a deal by ID",
+            "parameters": {
+                "type": "object",
+                "properties": { "deal_id": { "type": "string", "description": "The ID of the deal to delete" } },
+                "required": ["deal_id"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "add_task",
-                "description": "Add a new task to the CRM",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "title": { "type": "string", "description": "Title of the task" },
-                        "due_date": { "type": "string", "description": "Due date and time of the task (YYYY-MM-DD HH:MM). If no time is specified, default to 09:00." },
-                        "contact_id": { "type": "string", "description": "Optional ID of the contact associated with the task" },
-                        "description": { "type": "string", "description": "Detailed description of the task" }
-                    },
-                    "required": ["title"]
-                }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "add_task",
+            "description": "Add a new task to the CRM",
+            "parameters": {
+                "type": "object",
+                "properties": TASK_PROPERTIES,
+                "required": ["title"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_tasks",
-                "description": "Get list of pending tasks (not completed)",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_tasks",
+            "description": "Get a page of tasks (pending only unless include_completed is true)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "search": { "type": "string", "description": "Text to match against task title or description" },
+                    "include_completed": { "type": "boolean", "description": "Also return completed tasks" },
+                    **PAGING_PROPERTIES
                 }
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "delete_task",
-                "description": "Delete a task by ID",
-                "parameters": {
-                    "type": "object",
-                    "properties": { "task_id": { "type": "string", "description": "The ID of the task to delete" } },
-                    "required": ["task_id"]
-                }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_task",
+            "description": "Delete a task by ID",
+            "parameters": {
+                "type": "object",
+                "properties": { "task_id": { "type": "string", "description": "The ID of the task to delete" } },
+                "required": ["task_id"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "update_task",
-                "description": "Update a task (mark as done, change title, etc.)",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "task_id": { "type": "string", "description": "The ID of the task" },
-                        "updates": { 
-                            "type": "object", 
-                            "description": "Dictionary of fields to update (e.g. {'completed': True, 'title': 'New Title'})" 
-                        }
-                    },
-                    "required": ["task_id", "updates"]
-                }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "update_task",
+            "description": "Update a task (mark as done, change title, etc.)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "task_id": { "type": "string", "description": "The ID of the task" },
+                    "updates": { 
+                        "type": "object", 
+                        "description": "Dictionary of fields to update (e.g. {'completed': True, 'title': 'New Title'})" 
+                    }
+                },
+                "required": ["task_id", "updates"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_debts",
-                "description": "Get list of debts",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_debts",
+            "description": "Get a page of debts, optionally filtered by borrower or status",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "search": { "type": "string", "description": "Text to match against borrower name or description" },
+                    "status": { "type": "string", "enum": ["lent", "partial", "repaid"] },
+                    **PAGING_PROPERTIES
                 }
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "update_debt",
-                "description": "Update an existing debt's information",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "debt_id": { "type": "string", "description": "The ID of the debt to update" },
-                        "updates": { 
-                            "type": "object", 
-                            "description": "Dictionary of fields to update (e.g. {'amount_lent': 500, 'paid': True})" 
-                        }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "update_debt",
+            "description": "Update an existing debt's information",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "debt_id": { "type": "string", "description": "The ID of the debt to update" },
+                    "updates": { 
+                        "type": "object", 
+                        "description": "Dictionary of fields to update (e.g. {'amount_lent': 500, 'paid': True})" 
+                    }
+                },
+                "required": ["debt_id", "updates"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_debt",
+            "description": "Delete a debt",
+            "parameters": {
+                "type": "object",
+                "properties": { "debt_id": { "type": "string" } },
+                "required": ["debt_id"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_entity",
+            "description": "Look up contacts, tasks, deals or debts by (partial, misspelled) name and get their IDs, best match first",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": { "type": "string", "description": "Name or title as the user said it, e.g. 'read book' or 'jon smith'" },
+                    "kinds": {
+                        "type": "array",
+                        "items": { "type": "string", "enum": ["contact", "task", "deal", "debt"] },
+                        "description": "Restrict to these kinds (default: all)"
                     },
-                    "required": ["debt_id", "updates"]
-                }
+                    "limit": { "type": "integer", "description": "Max matches (default 5)" }
+                },
+                "required": ["query"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "delete_debt",
-                "description": "Delete a debt",
-                "parameters": {
-                    "type": "object",
-                    "properties": { "debt_id": { "type": "string" } },
-                    "required": ["debt_id"]
-                }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "add_contacts",
+            "description": "Add several contacts at once (use instead of repeated add_contact calls)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "contacts": {
+                        "type": "array",
+                        "items": { "type": "object", "properties": CONTACT_PROPERTIES, "required": ["name"] }
+                    }
+                },
+                "required": ["contacts"]
             }
         }
-        # Add more tools here as needed to match AIChat.jsx
-    ]
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_contacts",
+            "description": "Delete several contacts by ID",
+            "parameters": {
+                "type": "object",
+                "properties": { "contact_ids": _id_list("IDs of the contacts to delete") },
+                "required": ["contact_ids"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_deals",
+            "description": "Delete several deals by ID",
+            "parameters": {
+                "type": "object",
+                "properties": { "deal_ids": _id_list("IDs of the deals to delete") },
+                "required": ["deal_ids"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "add_tasks",
+            "description": "Add several tasks at once (use instead of repeated add_task calls)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "tasks": {
+                        "type": "array",
+                        "items": { "type": "object", "properties": TASK_PROPERTIES, "required": ["title"] }
+                    }
+                },
+                "required": ["tasks"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "update_tasks",
+            "description": "Apply the same update to several tasks (e.g. mark them all as done)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "task_ids": _id_list("IDs of the tasks to update"),
+                    "updates": {
+                        "type": "object",
+                        "description": "Dictionary of fields to update (e.g. {'completed': True})"
+                    }
+                },
+                "required": ["task_ids", "updates"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_tasks",
+            "description": "Delete several tasks by ID",
+            "parameters": {
+                "type": "object",
+                "properties": { "task_ids": _id_list("IDs of the tasks to delete") },
+                "required": ["task_ids"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_debts",
+            "description": "Delete several debts by ID",
+            "parameters": {
+                "type": "object",
+                "properties": { "debt_ids": _id_list("IDs of the debts to delete") },
+                "required": ["debt_ids"]
+            }
+        }
+    }
+    # Add more tools here as needed to match AIChat.jsx
+]
+
+SENSITIVE_TOOLS = frozenset([
+    "add_contact", "update_contact", "delete_contact",
+    "add_task", "update_task", "delete_task",
+    "add_deal", "update_deal", "delete_deal",
+    "add_debt", "update_debt", "delete_debt",
+    "add_contacts", "delete_contacts", "delete_deals",
+    "add_tasks", "update_tasks", "delete_tasks", "delete_debts"
+])
+
+def build_request_context(timezone="UTC", workflow_id=None, workflow_name=None):
+    """Small per-request system message: current time, timezone and workflow."""
+    utc_now = datetime.datetime.utcnow()
+    context = f"Current UTC time: {utc_now.strftime('%Y-%m-%d %H:%M')}. User Timezone: {timezone}."
+    if workflow_name:
+        context += f"\nCURRENT WORKFLOW: {workflow_name} (ID: {workflow_id})"
+    return context
+
+# Token / latency counters per completion stage ("tools" = first call, "final" =
+# restating tool output). cached_tokens is the prompt prefix the provider served
+# from its prompt cache.
+_llm_stats = {}
+
+def _record_usage(stage, response, elapsed):
+    stats = _llm_stats.setdefault(stage, {
+        "calls": 0, "prompt_tokens": 0, "cached_tokens": 0,
+        "completion_tokens": 0, "latency_total": 0.0
+    })
+    stats["calls"] += 1
+    stats["latency_total"] += elapsed
+    usage = getattr(response, "usage", None)
+    if usage:
+        stats["prompt_tokens"] += usage.prompt_tokens or 0
+        stats["completion_tokens"] += usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        stats["cached_tokens"] += (getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+def get_llm_stats():
+    """Per-stage token and latency counters, including the cached-prefix share."""
+    result = {}
+    for stage, stats in _llm_stats.items():
+        result[stage] = {
+            **stats,
+            "avg_latency": stats["latency_total"] / stats["calls"] if stats["calls"] else 0.0,
+            "cached_ratio": stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0,
+        }
+    return result
+
+# Shared OpenAI client. Created once so every chat reuses the same pooled
+# keep-alive connections instead of redoing the TLS handshake per message.
+_openai_client = None
+
+def get_openai_client():
+    """Return the module-level AsyncOpenAI client, or None if no API key is set."""
+    global _openai_client
+    if _openai_client is None:
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            return None
+
+        timeout = float(os.environ.get("OPENAI_TIMEOUT", "60"))
+        connect_timeout = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5"))
+        max_connections = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "100"))
+        max_keepalive = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+        _openai_client = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=int(os.environ.get("OPENAI_MAX_RETRIES", "2")),
+            http_client=DefaultAsyncHttpxClient(
+                timeout=httpx.Timeout(timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            ),
+        )
+    return _openai_client
+
+async def close_openai_client():
+    """Close the shared client's connection pool (called on bot shutdown)."""
+    global _openai_client
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+
+# Read-only tool calls from one model turn run concurrently, at most this many at once
+TOOL_CONCURRENCY = int(os.environ.get("BOT_TOOL_CONCURRENCY", "4"))
+_tool_semaphore = None
+
+async def _run_read_tool(tool_call, function_args, user_id=None, workflow_id=None):
+    """Execute one read-only tool call; returns (tool message content, direct page or None)."""
+    global _tool_semaphore
+    if _tool_semaphore is None:
+        _tool_semaphore = asyncio.Semaphore(TOOL_CONCURRENCY)
+
+    function_name = tool_call.function.name
+    if function_name == "find_entity":
+        async with _tool_semaphore:
+            return await _find_entity(function_args, user_id, workflow_id), None
+    if function_name not in LIST_TOOLS:
+        return "Function not implemented yet.", None
+
+    spec = LIST_TOOLS[function_name]
+    async with _tool_semaphore:
+        try:
+            rows, page, page_size = await fetch_list(function_name, function_args, user_id, workflow_id)
+        except Exception as e:
+            return f"Error fetching {spec['label']}: {str(e)}", None
+    return _page_summary(spec["label"], rows, page, page_size, spec["line"]), (function_name, rows, page, page_size)
+
+async def _find_entity(function_args, user_id=None, workflow_id=None):
+    query = function_args.get("query") or ""
+    try:
+        limit = min(20, max(1, int(function_args.get("limit") or 5)))
+        matches = await find_entities(query, user_id, workflow_id, kinds=function_args.get("kinds"), limit=limit)
+    except Exception as e:
+        return f"Error searching for '{query}': {str(e)}"
+    if not matches:
+        return f"Nothing matches '{query}'."
+    lines = []
+    for m in matches:
+        detail = f" ({m['detail']})" if m["detail"] else ""
+        lines.append(f"- {m['kind']}: {m['label']}{detail} (ID: {m['id']}, score {m['score']})")
+    lines = "\n".join(lines)
+    return f"Matches for '{query}', best first:\n{lines}"
+
+def _action_label(action):
+    """'delete task', or 'delete 3 tasks' for bulk calls."""
+    rows = next((v for v in action["args"].values() if isinstance(v, list)), None)
+    if rows is not None and "_" in action["action"]:
+        verb, noun = action["action"].split("_", 1)
+        return f"{verb} {len(rows)} {noun}"
+    return action["action"].replace("_", " ")
+
+def describe_actions(actions):
+    """'add contact' / 'add contact and delete task' / '3 actions' for the confirmation text."""
+    names = [_action_label(a) for a in actions]
+    if len(names) == 1:
+        return names[0]
+    if len(names) == 2:
+        return " and ".join(names)
+    return f"run {len(names)} actions"
+
+async def _complete(client, stage, on_delta=None, **kwargs):
+    """One chat completion; returns (message for history, content, tool_calls).
+
+    With on_delta the completion is streamed and on_delta(text_so_far) is called
+    as content arrives. Tool call fragments are reassembled from the stream.
+    """
+    async with span("llm", stage), limit("openai_chat"):
+        started = time.perf_counter()
+        if on_delta is None:
+            response = await client.chat.completions.create(**kwargs)
+            _record_usage(stage, response, time.perf_counter() - started)
+            message = response.choices[0].message
+            return message, message.content, message.tool_calls
+
+        stream = await client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs)
+        content, calls, usage = "", {}, None
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content += delta.content
+                on_delta(content)
+            for fragment in delta.tool_calls or []:
+                call = calls.setdefault(fragment.index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                if fragment.id:
+                    call["id"] = fragment.id
+                if fragment.function:
+                    call["function"]["name"] += fragment.function.name or ""
+                    call["function"]["arguments"] += fragment.function.arguments or ""
+        _record_usage(stage, SimpleNamespace(usage=usage), time.perf_counter() - started)
+
+    message = {"role": "assistant", "content": content or None}
+    tool_calls = None
+    if calls:
+        message["tool_calls"] = [calls[i] for i in sorted(calls)]
+        tool_calls = [
+            SimpleNamespace(id=c["id"], function=SimpleNamespace(**c["function"]))
+            for c in message["tool_calls"]
+        ]
+    return message, content, tool_calls
+
+async def get_ai_response(user_message, context_messages=[], user_id=None, workflow_id=None, workflow_name=None, timezone="UTC", on_delta=None):
+    """Answer a user message, running tools as needed.
+
+    on_delta(text_so_far) is called while the visible answer streams in;
+    without it both completions are plain requests.
+    """
+    client = get_openai_client()
+    if client is None:
+        return {"text": "Error: OPENAI_API_KEY not set."}
+    
+    # Per-request context goes in a small trailing message so the system prompt,
+    # tools and history form a byte-stable prefix for provider prompt caching
+    request_context = build_request_context(timezone, workflow_id, workflow_name)
 
     messages = [
-        {"role": "system", "content": system_prompt},
+        {"role": "system", "content": SYSTEM_PROMPT},
         *context_messages,
+        {"role": "system", "content": request_context},
         {"role": "user", "content": user_message}
     ]
 
-    response = client.chat.completions.create(
+    response_message, content, tool_calls = await _complete(
+        client, "tools", on_delta,
         model="gpt-4o",
         messages=messages,
-        tools=tools,
+        tools=TOOLS,
         tool_choice="auto"
     )
 
-    response_message = response.choices[0].message
-    tool_calls = response_message.tool_calls
-
     if tool_calls:
         # Extend conversation with assistant's reply
         messages.append(response_message)
 
+        reads, actions = [], []
         for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            function_args = json.loads(tool_call.function.arguments)
-            tool_call_id = tool_call.id
-            
-            # SENSITIVE TOOLS CHECK
-            sensitive_tools = [
-                "add_contact", "update_contact", "delete_contact",
-                "add_task", "update_task", "delete_task",
-                "add_deal", "update_deal", "delete_deal",
-                "add_debt", "update_debt", "delete_debt"
-            ]
-
-            if function_name in sensitive_tools:
-                # Return structured response for confirmation
-                return {
-                    "text": f"I need your confirmation to {function_name.replace('_', ' ')}.",
-                    "confirmation_needed": True,
-                    "action": function_name,
-                    "args": function_args,
-                    "tool_call_id": tool_call_id
-                }
-
-            function_response = ""
-            
-            if function_name == "add_contact":
-                try:
-                    result = add_contact(function_args, user_id=user_id, workflow_id=workflow_id)
-                    function_response = f"Contact added: {result}"
-                except Exception as e:
-                    function_response = f"Error adding contact: {str(e)}"
-            
-            elif function_name == "get_contacts":
-                try:
-                    contacts = get_contacts(user_id=user_id, workflow_id=workflow_id)
-                    # Format contacts for the AI
-                    contacts_str = "\n".join([f"- {c['name']} (ID: {c['id']})" for c in contacts[:10]]) # Limit to 10
-                    function_response = f"Found contacts:\n{contacts_str}"
-                except Exception as e:
-                    function_response = f"Error fetching contacts: {str(e)}"
-
-            elif function_name == "get_deals":
-                try:
-                    deals = get_deals(user_id=user_id, workflow_id=workflow_id)
-                    deals_str = "\n".join([f"- {d['title']} (${d['amount']}) - {d['status']}" for d in deals[:10]])
-                    function_response = f"Found deals:\n{deals_str}"
-                except Exception as e:
-                    function_response = f"Error fetching deals: {str(e)}"
-
-            elif function_name == "get_tasks":
-                try:
-                    tasks = get_tasks(user_id=user_id, workflow_id=workflow_id)
-                    tasks_str = "\n".join([f"- {t['title']} (ID: {t['id']}, Due: {t['due_date']})" for t in tasks[:10]])
-                    function_response = f"Found tasks:\n{tasks_str}"
-                except Exception as e:
-                    function_response = f"Error fetching tasks: {str(e)}"
-            
-            elif function_name == "add_task":
-                try:
-                    result = add_task(function_args, user_id=user_id, workflow_id=workflow_id)
-                    function_response = f"Task added: {result}"
-                except Exception as e:
-                    function_response = f"Error adding task: {str(e)}"
-
-            elif function_name == "get_debts":
-                try:
-                    debts = get_debts(user_id=user_id, workflow_id=workflow_id)
-                    debts_str = "\n".join([f"- {d['borrower_name']}: ${d['amount_lent']} (ID: {d['id']})" for d in debts[:10]])
-                    function_response = f"Found debts:\n{debts_str}"
-                except Exception as e:
-                    function_response = f"Error fetching debts: {str(e)}"
-            
-            elif function_name == "get_events":
-                try:
-                    events = get_events(user_id=user_id, workflow_id=workflow_id)
-                    events_str = "\n".join([f"- {e['title']} ({e['start_time']})" for e in events[:10]])
-                    function_response = f"Found events:\n{events_str}"
-                except Exception as e:
-                    function_response = f"Error fetching events: {str(e)}"
-
+            try:
+                function_args = json.loads(tool_call.function.arguments or "{}")
+            except json.JSONDecodeError:
+                function_args = {}
+            if tool_call.function.name in SENSITIVE_TOOLS:
+                actions.append({"action": tool_call.function.name, "args": function_args, "tool_call_id": tool_call.id})
             else:
-                function_response = "Function not implemented yet."
+                reads.append((tool_call, function_args))
 
+        # All reads of this turn share one round of DB latency
+        results = await asyncio.gather(*(_run_read_tool(tc, args, user_id, workflow_id) for tc, args in reads))
+        direct_pages = [page for _, page in results]
+        for (tool_call, _), (function_response, _) in zip(reads, results):
             messages.append({
-                "tool_call_id": tool_call_id,
+                "tool_call_id": tool_call.id,
                 "role": "tool",
-                "name": function_name,
+                "name": tool_call.function.name,
                 "content": function_response,
             })
 
+        # Mutations wait for the user; every one of them goes on a single
+        # confirmation card instead of stopping at the first
+        if actions:
+            for action in actions:
+                messages.append({
+                    "tool_call_id": action["tool_call_id"],
+                    "role": "tool",
+                    "name": action["action"],
+                    "content": "Waiting for the user to confirm.",
+                })
+            text = f"I need your confirmation to {describe_actions(actions)}."
+            if DIRECT_RENDER and reads and None not in direct_pages:
+                text = f"{_render_direct(direct_pages)}\n\n{text}"
+            messages.append({"role": "assistant", "content": text})
+            return {
+                "text": text,
+                "confirmation_needed": True,
+                "actions": actions,
+                "history": messages
+            }
+
+        # Only list lookups this turn: render them locally instead of paying
+        # for a second completion that just restates the rows
+        if DIRECT_RENDER and None not in direct_pages:
+            final_text = _render_direct(direct_pages)
+            messages.append({"role": "assistant", "content": final_text})
+            return {"text": final_text, "history": messages}
+
         # Get final response from AI
-        second_response = client.chat.completions.create(
+        # Same tools as the first call keep the cached prefix identical;
+        # tool_choice="none" makes the model answer in text
+        final_message, final_text, _ = await _complete(
+            client, "final", on_delta,
             model="gpt-4o",
-            messages=messages
+            messages=messages,
+            tools=TOOLS,
+            tool_choice="none"
         )
-        final_text = second_response.choices[0].message.content
-        messages.append(second_response.choices[0].message)
+        messages.append(final_message)
         return {"text": final_text, "history": messages}
 
-    return {"text": response_message.content, "history": messages}
+    messages.append(response_message)
+    return {"text": content, "history": messages}
@@ -0,0 +1,524 @@
+import os
+import sys
+import json
+import asyncio
+import logging
+from supabase import acreate_client, AsyncClient
+from dotenv import load_dotenv
+from scheduler import limit
+from tracing import span
+from cache import TTLCache
+from models import User, Workflow, decode_rows
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+url: str = os.environ.get("SUPABASE_URL")
+# Prefer Service Role Key for backend scripts to bypass RLS
+key: str = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("SUPABASE_KEY")
+
+if not url or not key:
+    raise ValueError("Supabase URL and Key must be set in .env")
+
+# Async mirror of db.py for the bot. The client (and its pooled httpx connection)
+# is created lazily on the running event loop and shared by every handler.
+_client: AsyncClient = None
+_client_lock = asyncio.Lock()
+
+async def get_client() -> AsyncClient:
+    """Return the shared async Supabase client, creating it on first use."""
+    global _client
+    if _client is None:
+        async with _client_lock:
+            if _client is None:
+                _client = await acreate_client(url, key)
+    return _client
+
+# Per-user session cache so restarts don't turn into a herd of identical `users`
+# lookups: Telegram ID -> user row (incl. timezone), user ID -> workflow list.
+SESSION_CACHE_TTL = int(os.environ.get("BOT_SESSION_CACHE_TTL", "300"))
+SESSION_CACHE_SIZE = int(os.environ.get("BOT_SESSION_CACHE_SIZE", "10000"))
+
+_user_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+_workflow_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+
+def invalidate_user(user_id=None, telegram_id=None):
+    """Forget cached session data for a user (by CRM ID and/or Telegram ID)."""
+    if telegram_id is not None:
+        _user_cache.pop(telegram_id)
+    if user_id is not None:
+        _user_cache.discard_where(lambda _, user: user.id == user_id)
+        _workflow_cache.pop(user_id)
+
+# Read-through cache for list queries, keyed by (table, user_id, workflow_id,
+# options). Entries are evicted LRU by count and by estimated size, and writes
+# through _write drop only the keys of the scopes whose rows changed.
+QUERY_CACHE_TTL = int(os.environ.get("BOT_QUERY_CACHE_TTL", "60"))
+QUERY_CACHE_SIZE = int(os.environ.get("BOT_QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_MAX_BYTES = int(os.environ.get("BOT_QUERY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+def _rows_size(rows):
+    """Rough in-memory size of a result set (dict keys are shared, so not counted)."""
+    return sys.getsizeof(rows) + sum(
+        sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values()) for row in rows
+    )
+
+_query_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL,
+                        max_weight=QUERY_CACHE_MAX_BYTES, weigher=_rows_size)
+_query_flights = {}       # key -> task fetching it, so concurrent misses share one query
+_query_generations = {}   # (table, user_id, workflow_id) -> bumped when a write hits a scope mid-fetch
+
+def _query_key(table, user_id, workflow_id, options):
+    workflow_id = workflow_id if workflow_id and workflow_id != "None" else None
+    return (table, str(user_id) if user_id else None, workflow_id, json.dumps(options, sort_keys=True, default=str))
+
+def _affected_by(table, scopes):
+    """Predicate over query keys: does the key's scope contain a row in scopes?
+
+    scopes: (user_id, workflow_id) pairs of the changed rows, or None when
+    they are unknown (every scope of the table is affected).
+    """
+    def affected(key, _=None):
+        if key[0] != table:
+            return False
+        if scopes is None:
+            return True
+        user_id, workflow_id = key[1], key[2]
+        # Unscoped queries see every row; workflow-only queries see every member's rows
+        return (user_id is None and workflow_id is None) or any(
+            (user_id is None or user_id == row_user) and workflow_id == row_workflow
+            for row_user, row_workflow in scopes
+        )
+    return affected
+
+def invalidate_rows(table, rows):
+    """Drop cached list queries whose scope contains any of rows.
+
+    Rows without owner columns (e.g. a delete that only returned IDs) drop
+    the whole table.
+    """
+    scopes = set()
+    for row in rows:
+        if "user_id" not in row and "workflow_id" not in row:
+            scopes = None
+            break
+        scopes.add((str(row.get("user_id")) if row.get("user_id") else None, row.get("workflow_id")))
+    affected = _affected_by(table, scopes)
+
+    # Fetches already running for these scopes may predate the write; they
+    # still answer their callers but aren't cached. Other scopes are untouched.
+    for scope in {key[:3] for key in _query_flights if affected(key)}:
+        _query_generations[scope] = _query_generations.get(scope, 0) + 1
+    _query_cache.discard_where(affected)
+
+def get_cache_stats():
+    """Hit-rate counters for the session and query caches."""
+    return {"users": _user_cache.stats(), "workflows": _workflow_cache.stats(), "queries": _query_cache.stats()}
+
+async def _execute(query):
+    """Run a PostgREST query under the global Supabase concurrency limit."""
+    # Span covers the wait for a limiter slot too; that's latency the update sees
+    async with span("db", _query_name(query)), limit("supabase"):
+        return await query.execute()
+
+def _query_name(query):
+    # "tasks" for table queries, the function name for RPCs
+    return str(getattr(query, "path", "") or "query").rstrip("/").rsplit("/", 1)[-1]
+
+# Called as listener(table, op, rows) after every contacts/tasks/deals/debts
+# write made through this module; op is "insert", "update" or "delete" and
+# rows are the affected rows PostgREST returned.
+_write_listeners = []
+
+def add_write_listener(listener):
+    _write_listeners.append(listener)
+
+async def _write(table, op, query):
+    response = await _execute(query)
+    rows = decode_rows(table, response.data or [])
+    invalidate_rows(table, rows)
+    for listener in _write_listeners:
+        try:
+            listener(table, op, rows)
+        except Exception as e:
+            logger.warning(f"Write listener failed for {op} on {table}: {e}")
+    return response
+
+async def get_user_by_telegram_id(telegram_id):
+    """Fetch user by Telegram ID."""
+    user = _user_cache.get(telegram_id)
+    if user is not None:
+        return user
+
+    supabase = await get_client()
+    response = await _execute(supabase.table("users").select("*").eq("telegram_chat_id", telegram_id))
+    if response.data:
+        user = User.from_row(response.data[0])
+        _user_cache.set(telegram_id, user)
+        return user
+    return None
+
+async def link_telegram_user(email, telegram_id):
+    """Link a Telegram ID to a CRM user by email."""
+    supabase = await get_client()
+    # First check if user exists
+    response = await _execute(supabase.table("users").select("*").eq("email", email))
+    if not response.data:
+        return False, "User not found with this email."
+
+    user = User.from_row(response.data[0])
+
+    # Update user with telegram_id
+    await _execute(supabase.table("users").update({"telegram_chat_id": telegram_id}).eq("id", user.id))
+    invalidate_user(user_id=user.id, telegram_id=telegram_id)
+    return True, user
+
+async def update_user_timezone(user_id, timezone):
+    """Update user's timezone."""
+    supabase = await get_client()
+    response = await _execute(supabase.table("users").update({"timezone": timezone}).eq("id", user_id))
+    invalidate_user(user_id=user_id)
+    return response.data
+
+async def _fetch_workflows(user_id):
+    """One round trip through the get_user_workflows RPC (migration 040)."""
+    supabase = await get_client()
+    response = await _execute(supabase.rpc("get_user_workflows", {"p_user_id": user_id}))
+    return response.data
+
+async def _fetch_workflows_legacy(user_id):
+    """Previous path: created + memberships + member workflows, merged in Python."""
+    supabase = await get_client()
+    # The two lookups are independent, run them concurrently
+    created, member_of = await asyncio.gather(
+        _execute(supabase.table("workflows").select("*").eq("creator_id", user_id)),
+        _execute(supabase.table("workflow_members").select("workflow_id").eq("user_id", user_id)),
+    )
+    member_workflow_ids = [m['workflow_id'] for m in member_of.data]
+
+    workflows = created.data
+    if member_workflow_ids:
+        member_workflows = await _execute(supabase.table("workflows").select("*").in_("id", member_workflow_ids))
+        # Merge and deduplicate
+        existing_ids = {w['id'] for w in workflows}
+        for w in member_workflows.data:
+            if w['id'] not in existing_ids:
+                workflows.append(w)
+    return workflows
+
+async def get_workflows(user_id, refresh=False):
+    """Fetch workflows the user created or is a member of.
+
+    Served from the per-user cache unless refresh=True. Falls back to the
+    multi-query path if the RPC has not been deployed yet.
+    """
+    if not refresh:
+        workflows = _workflow_cache.get(user_id)
+        if workflows is not None:
+            return workflows
+
+    try:
+        workflows = await _fetch_workflows(user_id)
+    except Exception as e:
+        logger.warning(f"get_user_workflows RPC failed, using legacy query: {e}")
+        workflows = await _fetch_workflows_legacy(user_id)
+
+    workflows = Workflow.from_rows(workflows)
+    _workflow_cache.set(user_id, workflows)
+    return workflows
+
+def _scope(query, user_id=None, workflow_id=None):
+    """Apply the user / workflow filter shared by every list query."""
+    if user_id:
+        query = query.eq("user_id", user_id)
+
+    if workflow_id and workflow_id != "None":
+        query = query.eq("workflow_id", workflow_id)
+    elif user_id:
+        # If workflow_id is explicitly None or "None" (MY TURF), filter for NULL
+        query = query.is_("workflow_id", "null")
+    return query
+
+# Columns matched (case-insensitively) by the `search` option of list queries
+SEARCH_COLUMNS = {
+    "contacts": ["name", "company", "email"],
+    "deals": ["title", "client_name"],
+    "tasks": ["title", "description"],
+    "calendar_events": ["title", "description"],
+    "debts": ["borrower_name", "description"],
+}
+
+FILTER_OPS = {"eq", "neq", "gt", "gte", "lt", "lte", "like", "ilike", "in", "is"}
+
+# Optional local source for list queries: await reader(table, user_id,
+# workflow_id, options) returns the rows, or None to query Supabase.
+_list_reader = None
+
+def set_list_reader(reader):
+    global _list_reader
+    _list_reader = reader
+
+async def _list(table, user_id=None, workflow_id=None, **options):
+    """Scoped list query, served locally when the list reader has the rows."""
+    if _list_reader is not None:
+        rows = await _list_reader(table, user_id, workflow_id, options)
+        if rows is not None:
+            return rows
+    if QUERY_CACHE_TTL <= 0:
+        return await _query(table, user_id, workflow_id, **options)
+
+    key = _query_key(table, user_id, workflow_id, options)
+    rows = _query_cache.get(key)
+    if rows is None:
+        task = _query_flights.get(key)
+        if task is None:
+            task = _query_flights[key] = asyncio.create_task(_fill(key, table, user_id, workflow_id, options))
+            task.add_done_callback(lambda _: _landed(key))
+        # Shielded: one caller being cancelled must not cancel the fetch for the others
+        rows = await asyncio.shield(task)
+    # Callers may annotate rows; keep the cached copies pristine
+    return [row.copy() for row in rows]
+
+async def _fill(key, table, user_id, workflow_id, options):
+    generation = _query_generations.get(key[:3], 0)
+    rows = await _query(table, user_id, workflow_id, **options)
+    # A write hit this scope while we were fetching; the result may predate it
+    if _query_generations.get(key[:3], 0) == generation:
+        _query_cache.set(key, rows)
+    return rows
+
+def _landed(key):
+    _query_flights.pop(key, None)
+    # Generations only matter while a fetch for the scope is running
+    if not any(other[:3] == key[:3] for other in _query_flights):
+        _query_generations.pop(key[:3], None)
+
+async def _query(table, user_id=None, workflow_id=None, columns="*", filters=None, search=None,
+                 order_by=None, descending=False, limit=None, offset=0, after=None):
+    """Run a scoped list query with server-side projection, filtering and paging.
+
+    filters: list of (column, op, value) with op in FILTER_OPS.
+    search: free text matched with ilike against SEARCH_COLUMNS[table].
+    limit/offset: page through results with a PostgREST range.
+    after: keyset cursor, the last seen value of order_by (defaults to "id").
+    """
+    supabase = await get_client()
+    query = _scope(supabase.table(table).select(columns), user_id, workflow_id)
+
+    for column, op, value in filters or []:
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        if op == "in":
+            query = query.in_(column, list(value))
+        elif op == "is":
+            query = query.is_(column, value)
+        else:
+            query = getattr(query, op)(column, value)
+
+    if search:
+        # Commas and parentheses are PostgREST syntax inside or=(...)
+        term = search.translate(str.maketrans("", "", ",()"))
+        query = query.or_(",".join(f"{column}.ilike.%{term}%" for column in SEARCH_COLUMNS.get(table, [])))
+
+    if after is not None:
+        order_by = order_by or "id"
+        query = query.lt(order_by, after) if descending else query.gt(order_by, after)
+
+    if order_by:
+        query = query.order(order_by, desc=descending)
+
+    if limit:
+        # Pages need a total order: break ties on non-unique sort columns by id
+        if order_by != "id":
+            query = query.order("id")
+        query = query.range(offset, offset + limit - 1)
+
+    response = await _execute(query)
+    return decode_rows(table, response.data)
+
+async def iter_rows(table, user_id=None, workflow_id=None, columns="*", filters=None, page_size=1000):
+    """Yield every scoped row of table, one keyset page (ordered by id) at a time."""
+    after = None
+    while True:
+        rows = await _query(table, user_id, workflow_id, columns=columns, filters=filters,
+                            order_by="id", limit=page_size, after=after)
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        after = rows[-1]["id"]
+
+async def get_reminder_recipients(user_ids, workflow_ids=()):
+    """Delivery settings for a batch of reminders: ({user_id: user}, {workflow_id: workflow})."""
+    supabase = await get_client()
+    users, workflows = {}, {}
+    if user_ids:
+        response = await _execute(
+            supabase.table("users").select("id,timezone,telegram_chat_id,ntfy_url").in_("id", list(user_ids))
+        )
+        users = {row["id"]: row for row in response.data}
+    if workflow_ids:
+        response = await _execute(supabase.table("workflows").select("id,ntfy_url").in_("id", list(workflow_ids)))
+        workflows = {row["id"]: row for row in response.data}
+    return users, workflows
+
+async def claim_reminders(table, ids):
+    """Set reminder_sent on rows still unsent; returns the IDs this call claimed.
+
+    The reminder_sent = FALSE guard makes the claim atomic, so when several
+    bot processes run the reminder engine each reminder still goes out once.
+    """
+    if not ids:
+        return []
+    supabase = await get_client()
+    query = supabase.table(table).update({"reminder_sent": True}).in_("id", list(ids)).eq("reminder_sent", False)
+    response = await _write(table, "update", query)
+    return [row["id"] for row in response.data or []]
+
+async def release_reminders(table, ids):
+    """Undo a claim for reminders that could not be delivered."""
+    if not ids:
+        return
+    supabase = await get_client()
+    await _write(table, "update", supabase.table(table).update({"reminder_sent": False}).in_("id", list(ids)))
+
+async def get_contacts(user_id=None, workflow_id=None, **options):
+    return await _list("contacts", user_id, workflow_id, **options)
+
+async def add_contact(contact_data, user_id=None, workflow_id=None):
+    """Add a new contact."""
+    supabase = await get_client()
+    final_user_id = user_id or os.environ.get("SUPABASE_USER_ID")
+    if final_user_id:
+        contact_data["user_id"] = final_user_id
+
+    if workflow_id and workflow_id != "None":
+        contact_data["workflow_id"] = workflow_id
+
+    response = await _write("contacts", "insert", supabase.table("contacts").insert(contact_data))
+    return response.data
+
+async def get_deals(user_id=None, workflow_id=None, **options):
+    return await _list("deals", user_id, workflow_id, **options)
+
+async def get_tasks(user_id=None, include_completed=False, workflow_id=None, **options):
+    if not include_completed:
+        options["filters"] = [("completed", "eq", False), *(options.get("filters") or [])]
+    return await _list("tasks", user_id, workflow_id, **options)
+
+async def add_task(task_data, user_id=None, workflow_id=None):
+    """Add a new task."""
+    supabase = await get_client()
+    final_user_id = user_id or os.environ.get("SUPABASE_USER_ID")
+    if final_user_id:
+        task_data["user_id"] = final_user_id
+
+    if workflow_id and workflow_id != "None":
+        task_data["workflow_id"] = workflow_id
+
+    response = await _write("tasks", "insert", supabase.table("tasks").insert(task_data))
+    return response.data
+
+async def update_task(task_id, updates):
+    supabase = await get_client()
+    response = await _write("tasks", "update", supabase.table("tasks").update(updates).eq("id", task_id))
+    return response.data
+
+async def delete_task(task_id):
+    supabase = await get_client()
+    response = await _write("tasks", "delete", supabase.table("tasks").delete().eq("id", task_id))
+    return response.data
+
+async def get_events(user_id=None, workflow_id=None, **options):
+    return await _list("calendar_events", user_id, workflow_id, **options)
+
+async def get_debts(user_id=None, workflow_id=None, **options):
+    return await _list("debts", user_id, workflow_id, **options)
+
+async def update_contact(contact_id, updates):
+    supabase = await get_client()
+    response = await _write("contacts", "update", supabase.table("contacts").update(updates).eq("id", contact_id))
+    return response.data
+
+async def delete_contact(contact_id):
+    supabase = await get_client()
+    response = await _write("contacts", "delete", supabase.table("contacts").delete().eq("id", contact_id))
+    return response.data
+
+async def update_deal(deal_id, updates):
+    supabase = await get_client()
+    response = await _write("deals", "update", supabase.table("deals").update(updates).eq("id", deal_id))
+    return response.data
+
+async def delete_deal(deal_id):
+    supabase = await get_client()
+    response = await _write("deals", "delete", supabase.table("deals").delete().eq("id", deal_id))
+    return response.data
+
+async def update_debt(debt_id, updates):
+    supabase = await get_client()
+    response = await _write("debts", "update", supabase.table("debts").update(updates).eq("id", debt_id))
+    return response.data
+
+async def delete_debt(debt_id):
+    supabase = await get_client()
+    response = await _write("debts", "delete", supabase.table("debts").delete().eq("id", debt_id))
+    return response.data
+
+# Bulk writes: one PostgREST request for any number of rows
+
+def _stamp(rows, user_id=None, workflow_id=None):
+    """Copy rows, adding the owner and workflow the same way the single-row helpers do."""
+    final_user_id = user_id or os.environ.get("SUPABASE_USER_ID")
+    stamped = []
+    for row in rows:
+        row = dict(row)
+        if final_user_id:
+            row["user_id"] = final_user_id
+        if workflow_id and workflow_id != "None":
+            row["workflow_id"] = workflow_id
+        stamped.append(row)
+    return stamped
+
+async def _insert_many(table, rows, user_id=None, workflow_id=None):
+    if not rows:
+        return []
+    supabase = await get_client()
+    response = await _write(table, "insert", supabase.table(table).insert(_stamp(rows, user_id, workflow_id)))
+    return response.data
+
+async def _delete_many(table, ids):
+    if not ids:
+        return []
+    supabase = await get_client()
+    response = await _write(table, "delete", supabase.table(table).delete().in_("id", list(ids)))
+    return response.data
+
+async def add_contacts(contacts, user_id=None, workflow_id=None):
+    """Insert several contacts in one request."""
+    return await _insert_many("contacts", contacts, user_id, workflow_id)
+
+async def add_tasks(tasks, user_id=None, workflow_id=None):
+    """Insert several tasks in one request."""
+    return await _insert_many("tasks", tasks, user_id, workflow_id)
+
+async def update_tasks(task_ids, updates):
+    """Apply the same updates to every task in task_ids."""
+    if not task_ids:
+        return []
+    supabase = await get_client()
+    response = await _write("tasks", "update", supabase.table("tasks").update(updates).in_("id", list(task_ids)))
+    return response.data
+
+async def delete_tasks(task_ids):
+    return await _delete_many("tasks", task_ids)
+
+async def delete_contacts(contact_ids):
+    return await _delete_many("contacts", contact_ids)
+
+async def delete_deals(deal_ids):
+    return await _delete_many("deals", deal_ids)
+
+async def delete_debts(debt_ids):
+    return await _delete_many("debts", debt_ids)
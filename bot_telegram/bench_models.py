@@ -0,0 +1,89 @@
+"""Measure memory and decode cost of row models against plain dicts.
+
+Builds synthetic rows shaped like PostgREST `select *` results and reports,
+per table, the bytes each row costs as a dict and as a slotted model (the
+column values themselves are shared and left out), plus decode timings:
+
+    python bench_models.py --rows 20000
+
+JSON decoding uses orjson when it is installed.
+"""
+import json
+import time
+import random
+import argparse
+import tracemalloc
+import models
+
+def _sample_row(table, i):
+    base = {
+        "id": f"00000000-0000-4000-8000-{i:012d}",
+        "user_id": "11111111-1111-4111-8111-111111111111",
+        "workflow_id": None,
+        "created_at": "2026-01-01T09:00:00+00:00",
+        "updated_at": "2026-01-02T09:00:00+00:00",
+    }
+    if table == "contacts":
+        base.update(name=f"Contact {i}", role="Buyer", company=f"Company {i % 50}", email=f"c{i}@example.com",
+                    phone=f"+1555{i:07d}", status="New", notes=None, tags=["lead"])
+    elif table == "deals":
+        base.update(title=f"Deal {i}", client_name=f"Client {i}", amount=f"${i * 10:,}", amount_value=i * 10,
+                    probability=random.randint(0, 100), status="lead", date=None, notes=None, contact_id=None,
+                    reminder_date=None, reminder_time=None, reminder_sent=False)
+    elif table == "tasks":
+        base.update(title=f"Task {i}", description="Follow up", date=None, due_date="2026-02-01T00:00:00+00:00",
+                    reminder_time="09:00:00", reminder_sent=False, priority="medium", project=None,
+                    completed=bool(i % 2), contact_id=None, deal_id=None, folder_id=None, urls=[])
+    else:
+        base.update(borrower_name=f"Borrower {i}", amount_lent="$500", amount_repaid="$0", amount_paid=0,
+                    date_lent="2026-01-01T00:00:00+00:00", reminder_date=None, reminder_sent=False,
+                    description=None, status="lent", payment_type="one-time")
+    return base
+
+def _allocated(build):
+    """Bytes allocated by build() and kept alive by its result."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return result, size
+
+def bench(table, count):
+    rows = [_sample_row(table, i) for i in range(count)]
+    model = models.TABLE_MODELS[table]
+
+    # Copy the containers only; values stay shared, as they would be after decoding
+    _, dict_bytes = _allocated(lambda: [dict(row) for row in rows])
+    _, model_bytes = _allocated(lambda: model.from_rows(rows))
+
+    payload = json.dumps(rows)
+    started = time.perf_counter()
+    json.loads(payload)
+    json_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    decoded = models.loads(payload)
+    loads_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    model.from_rows(decoded)
+    model_seconds = time.perf_counter() - started
+
+    print(
+        f"{table:>9}: dict {dict_bytes / count:6.0f} B/row  model {model_bytes / count:6.0f} B/row"
+        f"  saved {(1 - model_bytes / dict_bytes) * 100:4.1f}%"
+        f"  | json {json_seconds * 1000:6.1f} ms  {'orjson' if models.orjson else 'json':>6} {loads_seconds * 1000:6.1f} ms"
+        f"  to models {model_seconds * 1000:6.1f} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Row model memory / decode benchmark.")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--tables", default="contacts,deals,tasks,debts")
+    args = parser.parse_args()
+    print(f"{args.rows} rows per table")
+    for table in args.tables.split(","):
+        bench(table, args.rows)
+
+if __name__ == "__main__":
+    main()
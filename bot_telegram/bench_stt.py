@@ -0,0 +1,83 @@
+"""Compare speech-to-text backends on sample voice notes.
+
+Reports per-file latency and real-time factor (RTF = processing time / audio
+duration; below 1.0 is faster than real time) for each backend:
+
+    python bench_stt.py samples/*.ogg --backends openai,local --repeat 3
+
+The local backend needs faster-whisper installed; the openai backend needs
+OPENAI_API_KEY. Model loading is timed separately and left out of the RTF.
+"""
+import os
+import time
+import asyncio
+import argparse
+from io import BytesIO
+
+def audio_seconds(data):
+    from pydub import AudioSegment
+    return len(AudioSegment.from_file(BytesIO(data))) / 1000
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+async def bench(backend, samples, repeat):
+    latencies, rtfs = [], []
+    for path, data, seconds in samples:
+        for i in range(repeat):
+            started = time.perf_counter()
+            text = await backend.transcribe(data, "audio/ogg")
+            elapsed = time.perf_counter() - started
+            latencies.append(elapsed)
+            rtfs.append(elapsed / seconds if seconds else 0.0)
+            if i == 0:
+                print(f"  {os.path.basename(path)} ({seconds:.1f}s): {elapsed * 1000:7.0f} ms  RTF {rtfs[-1]:.2f}  {text[:60]!r}")
+    print(
+        f"{backend.name:>8}: mean {sum(latencies) / len(latencies) * 1000:7.0f} ms"
+        f"  p50 {percentile(latencies, 50) * 1000:7.0f} ms"
+        f"  p95 {percentile(latencies, 95) * 1000:7.0f} ms"
+        f"  mean RTF {sum(rtfs) / len(rtfs):.2f}"
+    )
+
+async def run(args):
+    from dotenv import load_dotenv
+    load_dotenv()
+    import stt
+
+    samples = []
+    for path in args.files:
+        with open(path, "rb") as f:
+            data = f.read()
+        samples.append((path, data, audio_seconds(data)))
+    print(f"{len(samples)} files, {sum(s for _, _, s in samples):.1f}s of audio, {args.repeat} runs each")
+
+    for name in args.backends.split(","):
+        if name == "openai":
+            backend = stt.OpenAIWhisperBackend()
+        elif name == "local":
+            if not stt.LocalWhisperBackend.available():
+                print("local: faster-whisper is not installed, skipping")
+                continue
+            backend = stt.LocalWhisperBackend(model=args.model, compute_type=args.compute_type, workers=1)
+            started = time.perf_counter()
+            await backend.warm_up()
+            print(f"local: model {args.model} ({args.compute_type}) loaded in {time.perf_counter() - started:.1f}s")
+        else:
+            raise SystemExit(f"Unknown backend: {name}")
+        try:
+            await bench(backend, samples, args.repeat)
+        finally:
+            await backend.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark STT backends on .ogg samples.")
+    parser.add_argument("files", nargs="+", help="Audio files (Telegram voice notes are OGG/Opus)")
+    parser.add_argument("--backends", default="openai,local")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model", default=os.environ.get("BOT_STT_LOCAL_MODEL", "base"))
+    parser.add_argument("--compute-type", default=os.environ.get("BOT_STT_LOCAL_COMPUTE_TYPE", "int8"))
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """In-process LRU cache whose entries expire ``ttl`` seconds after being set.
+
+    With ``max_weight`` and ``weigher`` the cache also evicts least recently
+    used entries until the summed weight (e.g. estimated bytes) fits.
+
+    Not thread-safe; it is only touched from the bot's event loop.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, max_weight=None, weigher=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self._data = OrderedDict()  # key -> (expires_at, value, weight)
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self.weight -= entry[2]
+        return entry
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        if key in self._data:
+            self._remove(key)
+        weight = self.weigher(value) if self.weigher else 0
+        if self.max_weight is not None and weight > self.max_weight:
+            # Would evict everything else and still not fit
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value, weight)
+        self.weight += weight
+        while len(self._data) > self.maxsize or (self.max_weight is not None and self.weight > self.max_weight):
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        if key not in self._data:
+            return default
+        return self._remove(key)[1]
+
+    def discard_where(self, predicate):
+        """Drop every entry for which predicate(key, value) is true."""
+        for key in [k for k, (_, v, _) in self._data.items() if predicate(k, v)]:
+            self._remove(key)
+
+    def items(self):
+        """Live (key, value) pairs, oldest first; doesn't touch LRU order or counters."""
+        now = time.monotonic()
+        return [(k, v) for k, (expires_at, v, _) in self._data.items() if expires_at >= now]
+
+    def clear(self):
+        self._data.clear()
+        self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+        if self.max_weight is not None:
+            stats["weight"] = self.weight
+        return stats
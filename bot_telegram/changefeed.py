@@ -0,0 +1,411 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import urlencode
+from websockets.asyncio.client import connect
+from cache import TTLCache
+from async_db import url as SUPABASE_URL, key as SUPABASE_KEY
+from async_db import iter_rows, add_write_listener, set_list_reader, invalidate_rows, SEARCH_COLUMNS
+from models import Row, as_model, loads
+
+logger = logging.getLogger(__name__)
+
+# Live row stores fed by Supabase Realtime.
+#
+# The web app and the task <-> calendar sync triggers change rows behind the
+# bot's back, so cached rows used to go stale. This module subscribes to
+# Postgres changes for CHANGEFEED_TABLES over the Realtime websocket and applies
+# them to in-memory row stores, one per (table, user_id, workflow_id) scope.
+# While the socket is joined, async_db list queries for a scope are answered
+# from its store; anything else (unknown tables, embedded selects, scopes over
+# CHANGEFEED_MAX_ROWS rows, or a dropped connection) falls back to Supabase.
+#
+# Stores are backfilled with a keyset scan on first use. Changes that arrive
+# during the scan are buffered and replayed in order afterwards, so a store
+# never misses an update. When the connection drops every store is discarded;
+# after reconnecting, the scopes that were in use are backfilled again.
+#
+# Memory is bounded by CHANGEFEED_SCOPES stores of at most CHANGEFEED_MAX_ROWS
+# rows each, and stores expire after CHANGEFEED_STORE_TTL as a safety net for
+# tables missing from the supabase_realtime publication.
+
+CHANGEFEED_ENABLED = os.environ.get("BOT_CHANGEFEED", "1").lower() not in ("0", "false", "no", "off")
+CHANGEFEED_TABLES = [t.strip() for t in os.environ.get(
+    "BOT_CHANGEFEED_TABLES", "contacts,deals,tasks,debts,calendar_events"
+).split(",") if t.strip()]
+CHANGEFEED_SCOPES = int(os.environ.get("BOT_CHANGEFEED_SCOPES", "512"))
+CHANGEFEED_MAX_ROWS = int(os.environ.get("BOT_CHANGEFEED_MAX_ROWS", "5000"))
+CHANGEFEED_STORE_TTL = int(os.environ.get("BOT_CHANGEFEED_STORE_TTL", "3600"))
+# Override for the local stand-in (realtime_standin.py)
+REALTIME_URL = os.environ.get("BOT_REALTIME_URL")
+HEARTBEAT_INTERVAL = 25
+MAX_BACKOFF = 30
+BACKFILL_CONCURRENCY = 4
+
+# Projections we can answer locally: plain column lists, no embedded resources
+_PLAIN_COLUMNS = re.compile(r"^\s*(\*|[A-Za-z_][\w]*(\s*,\s*[A-Za-z_][\w]*)*)\s*$")
+
+def scope_key(user_id=None, workflow_id=None):
+    return (str(user_id) if user_id else None, str(workflow_id) if workflow_id and workflow_id != "None" else None)
+
+# --- Local evaluation of async_db._list options ---
+
+def _like(pattern, case_insensitive):
+    regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in str(pattern))
+    return re.compile(f"^{regex}$", re.IGNORECASE | re.DOTALL if case_insensitive else re.DOTALL)
+
+def _comparable(value, other):
+    """Coerce a filter value to the row value's type, as Postgres would."""
+    if isinstance(value, bool) or isinstance(other, bool):
+        if isinstance(other, str):
+            return other.lower() == "true"
+        return other
+    if isinstance(value, (int, float)) and isinstance(other, str):
+        try:
+            return float(other)
+        except ValueError:
+            return other
+    if isinstance(value, str) and not isinstance(other, str):
+        return str(other)
+    return other
+
+def _test(row, column, op, expected):
+    value = row.get(column)
+    if op == "is":
+        if expected in (None, "null"):
+            return value is None
+        return value is _comparable(True, expected)
+    if value is None:
+        # NULL never satisfies a comparison in SQL
+        return False
+    if op == "in":
+        return any(value == _comparable(value, e) for e in expected)
+    if op in ("like", "ilike"):
+        return _like(expected, op == "ilike").match(str(value)) is not None
+    expected = _comparable(value, expected)
+    try:
+        if op == "eq":
+            return value == expected
+        if op == "neq":
+            return value != expected
+        if op == "gt":
+            return value > expected
+        if op == "gte":
+            return value >= expected
+        if op == "lt":
+            return value < expected
+        if op == "lte":
+            return value <= expected
+    except TypeError:
+        return False
+    return False
+
+def _sort_key(column):
+    # NULLs sort high, so they come last ascending and first descending, as in Postgres
+    def key(row):
+        value = row.get(column)
+        return value is None, value if value is not None else 0
+    return key
+
+def can_serve(options):
+    """True if _list options can be evaluated against a row store."""
+    columns = options.get("columns", "*")
+    if not _PLAIN_COLUMNS.match(columns or "*"):
+        return False
+    return all(op in ("eq", "neq", "gt", "gte", "lt", "lte", "like", "ilike", "in", "is")
+               for _, op, _ in options.get("filters") or [])
+
+class RowStore:
+    """The rows of one (table, scope), keyed by id."""
+
+    __slots__ = ("table", "user_id", "workflow_id", "rows")
+
+    def __init__(self, table, user_id, workflow_id):
+        self.table = table
+        self.user_id = user_id
+        self.workflow_id = workflow_id
+        self.rows = {}
+
+    def matches(self, row):
+        """Same predicate as async_db._scope."""
+        if self.user_id and str(row.get("user_id")) != self.user_id:
+            return False
+        if self.workflow_id:
+            return str(row.get("workflow_id")) == self.workflow_id
+        return row.get("workflow_id") is None
+
+    def apply(self, op, row):
+        if op == "delete" or not self.matches(row):
+            self.rows.pop(row["id"], None)
+        else:
+            self.rows[row["id"]] = row
+
+    def query(self, columns="*", filters=None, search=None, order_by=None, descending=False,
+              limit=None, offset=0, after=None):
+        rows = list(self.rows.values())
+        for column, op, value in filters or []:
+            rows = [row for row in rows if _test(row, column, op, value)]
+        if search:
+            term = search.translate(str.maketrans("", "", ",()"))
+            pattern = _like(f"%{term}%", True)
+            search_columns = SEARCH_COLUMNS.get(self.table, [])
+            rows = [row for row in rows if any(
+                row.get(c) is not None and pattern.match(str(row[c])) for c in search_columns
+            )]
+        if after is not None:
+            order_by = order_by or "id"
+            rows = [row for row in rows if _test(row, order_by, "lt" if descending else "gt", after)]
+        if limit and order_by != "id":
+            # Same id tiebreaker as async_db._query; the sort below is stable
+            rows.sort(key=_sort_key("id"))
+        if order_by:
+            rows.sort(key=_sort_key(order_by), reverse=descending)
+        if limit:
+            rows = rows[offset:offset + limit]
+        if not columns or columns.strip() == "*":
+            return [row.copy() for row in rows]
+        names = [c.strip() for c in columns.split(",")]
+        if rows and isinstance(rows[0], Row):
+            return [row.with_columns(names) for row in rows]
+        return [{c: row.get(c) for c in names} for row in rows]
+
+# Marks a scope that is too large to keep in memory
+TOO_LARGE = object()
+
+class ChangeFeed:
+    """Realtime subscription plus the row stores it keeps current."""
+
+    def __init__(self, url=None, api_key=SUPABASE_KEY, tables=CHANGEFEED_TABLES):
+        self.url = url or self._default_url(api_key)
+        self.api_key = api_key
+        self.tables = list(tables)
+        self.stores = TTLCache(maxsize=CHANGEFEED_SCOPES, ttl=CHANGEFEED_STORE_TTL)
+        self.live = False
+        self._loading = {}    # (table, scope) -> task building that store
+        self._buffers = {}    # (table, scope) -> changes received while it builds
+        self._ref = 0
+        self._task = None
+        self._generation = 0  # bumped on every disconnect
+        self._hot = []        # scopes to backfill again after reconnecting
+        self._rewarm_task = None
+        self.stats = {"events": 0, "reconnects": 0, "local_reads": 0, "fallback_reads": 0, "backfills": 0}
+
+    @staticmethod
+    def _default_url(api_key):
+        base = (SUPABASE_URL or "").rstrip("/").replace("https://", "wss://").replace("http://", "ws://")
+        return f"{base}/realtime/v1/websocket?" + urlencode({"apikey": api_key, "vsn": "1.0.0"})
+
+    # --- Row stores ---
+
+    async def _backfill(self, table, key):
+        store = RowStore(table, *key)
+        self._buffers[(table, key)] = []
+        try:
+            async for row in iter_rows(table, key[0], key[1] or "None"):
+                if len(store.rows) >= CHANGEFEED_MAX_ROWS:
+                    logger.info(f"{table} for {key} has over {CHANGEFEED_MAX_ROWS} rows; reading it from Supabase")
+                    return TOO_LARGE
+                store.rows[row["id"]] = row
+            for op, row in self._buffers[(table, key)]:
+                store.apply(op, row)
+        finally:
+            del self._buffers[(table, key)]
+        self.stats["backfills"] += 1
+        return store
+
+    async def get_store(self, table, user_id=None, workflow_id=None):
+        """The scope's store (building it once under concurrent reads), or None."""
+        key = scope_key(user_id, workflow_id)
+        generation = self._generation
+        store = self.stores.get((table, key))
+        if store is not None:
+            return None if store is TOO_LARGE else store
+        task = self._loading.get((table, key))
+        if task is None:
+            task = self._loading[(table, key)] = asyncio.create_task(self._backfill(table, key))
+            task.add_done_callback(lambda _: self._loading.pop((table, key), None))
+        # Shielded so a cancelled reader doesn't cancel the backfill for the others
+        store = await asyncio.shield(task)
+        # A disconnect during the backfill means it may have missed changes
+        if self.live and generation == self._generation:
+            self.stores.set((table, key), store)
+        return None if store is TOO_LARGE else store
+
+    async def read(self, table, user_id, workflow_id, options):
+        """async_db list reader: rows from the scope's store, or None to query Supabase."""
+        if not self.live or table not in self.tables or not user_id or not can_serve(options):
+            self.stats["fallback_reads"] += 1
+            return None
+        try:
+            store = await self.get_store(table, user_id, workflow_id)
+        except Exception as e:
+            logger.warning(f"Backfill of {table} failed: {e}")
+            store = None
+        if store is None:
+            self.stats["fallback_reads"] += 1
+            return None
+        self.stats["local_reads"] += 1
+        return store.query(**options)
+
+    def apply(self, table, op, rows):
+        """Apply inserted / updated / deleted rows to every store they touch."""
+        if table not in self.tables:
+            return
+        for row in rows:
+            if "id" not in row:
+                continue
+            row = as_model(table, row)
+            for (store_table, key), buffer in self._buffers.items():
+                if store_table == table:
+                    buffer.append((op, row))
+            # A row can leave a scope (moved workflow) as well as enter one
+            for (store_table, _), store in self.stores.items():
+                if store_table == table and store is not TOO_LARGE and (row["id"] in store.rows or store.matches(row)):
+                    store.apply(op, row)
+
+    def row_count(self):
+        return sum(len(store.rows) for _, store in self.stores.items() if store is not TOO_LARGE)
+
+    # --- Realtime connection ---
+
+    def _message(self, topic, event, payload):
+        self._ref += 1
+        return json.dumps({"topic": topic, "event": event, "payload": payload, "ref": str(self._ref)})
+
+    def _join_message(self):
+        return self._message("realtime:bot-changefeed", "phx_join", {
+            "config": {
+                "broadcast": {"ack": False, "self": False},
+                "presence": {"key": ""},
+                "postgres_changes": [{"event": "*", "schema": "public", "table": t} for t in self.tables],
+                "private": False,
+            },
+            "access_token": self.api_key,
+        })
+
+    async def _heartbeat(self, socket):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            await socket.send(self._message("phoenix", "heartbeat", {}))
+
+    def _on_change(self, data):
+        op = {"INSERT": "insert", "UPDATE": "update", "DELETE": "delete"}.get(data.get("type"))
+        if op is None:
+            return
+        self.stats["events"] += 1
+        row = data.get("old_record") if op == "delete" else data.get("record")
+        if row:
+            self.apply(data.get("table"), op, [row])
+            # Also covers writes made outside the bot while serving from Supabase
+            invalidate_rows(data.get("table"), [row])
+
+    async def _session(self):
+        async with connect(self.url, ping_interval=None, max_size=None) as socket:
+            await socket.send(self._join_message())
+            heartbeat = asyncio.create_task(self._heartbeat(socket))
+            try:
+                async for raw in socket:
+                    message = loads(raw)
+                    event, payload = message.get("event"), message.get("payload") or {}
+                    if event == "postgres_changes":
+                        self._on_change(payload.get("data") or {})
+                    elif event == "phx_reply" and message.get("topic") != "phoenix":
+                        if payload.get("status") != "ok":
+                            raise ConnectionError(f"Realtime join failed: {payload.get('response')}")
+                        self._went_live()
+                    elif event in ("phx_error", "phx_close"):
+                        raise ConnectionError(f"Realtime channel closed: {event}")
+            finally:
+                heartbeat.cancel()
+
+    def _went_live(self):
+        if self.live:
+            return
+        self.live = True
+        logger.info(f"Change feed live for {', '.join(self.tables)}")
+        if self._hot:
+            self._rewarm_task = asyncio.create_task(self._rewarm(self._hot))
+            self._hot = []
+
+    def _went_down(self):
+        """Drop every store (they may have missed changes) and remember which were in use."""
+        self.live = False
+        self._generation += 1
+        if self._rewarm_task is not None:
+            self._rewarm_task.cancel()
+            self._rewarm_task = None
+        keys = [key for key, store in self.stores.items() if store is not TOO_LARGE]
+        self._hot = keys or self._hot
+        self.stores.clear()
+
+    async def _rewarm(self, keys):
+        slots = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+        async def one(table, key):
+            async with slots:
+                try:
+                    await self.get_store(table, *key)
+                except Exception as e:
+                    logger.warning(f"Backfill of {table} for {key} failed: {e}")
+
+        await asyncio.gather(*(one(table, key) for table, key in keys))
+
+    async def run(self):
+        """Stay subscribed, reconnecting with exponential backoff."""
+        backoff = 1
+        while True:
+            started = time.monotonic()
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Change feed disconnected: {e}")
+            self._went_down()
+            self.stats["reconnects"] += 1
+            if time.monotonic() - started > 60:
+                backoff = 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._went_down()
+
+    def snapshot(self):
+        return {**self.stats, "live": self.live, "scopes": len(self.stores), "rows": self.row_count()}
+
+_feed = None
+
+def start_changefeed():
+    """Subscribe and route async_db list queries through the row stores (once per process)."""
+    global _feed
+    if not CHANGEFEED_ENABLED or _feed is not None:
+        return _feed
+    _feed = ChangeFeed(url=REALTIME_URL)
+    # The bot's own writes show up immediately, before Realtime echoes them
+    add_write_listener(_feed.apply)
+    set_list_reader(_feed.read)
+    _feed.start()
+    return _feed
+
+async def stop_changefeed():
+    if _feed is not None:
+        set_list_reader(None)
+        await _feed.stop()
+
+def get_changefeed_stats():
+    return _feed.snapshot() if _feed is not None else {}
@@ -0,0 +1,84 @@
+import io
+import os
+import csv
+import zipfile
+import datetime
+import tempfile
+from async_db import iter_rows
+
+# /export: stream a whole table into a CSV (or zipped CSV) file.
+#
+# Rows are fetched one keyset page at a time and written straight into a
+# SpooledTemporaryFile, which stays in memory up to EXPORT_SPOOL_BYTES and
+# rolls over to a temp file beyond that. Nothing holds the full table, and an
+# export stops as soon as the file passes Telegram's upload limit.
+
+EXPORT_TABLES = ("contacts", "deals", "tasks", "debts")
+EXPORT_PAGE_SIZE = int(os.environ.get("BOT_EXPORT_PAGE_SIZE", "1000"))
+EXPORT_SPOOL_BYTES = int(os.environ.get("BOT_EXPORT_SPOOL_BYTES", str(8 * 1024 * 1024)))
+# Telegram's upload limit for bots
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+
+class ExportTooLarge(ValueError):
+    """The export file is over Telegram's bot upload limit."""
+
+def _too_large():
+    mb = EXPORT_MAX_BYTES // (1024 * 1024)
+    return ExportTooLarge(f"The export is over {mb} MB, Telegram only takes {mb} MB from bots.")
+
+# Owner / scoping columns that mean nothing outside the database
+HIDDEN_COLUMNS = {"user_id", "workflow_id"}
+
+async def _write_csv(binary, rows, written=None):
+    """Write rows as CSV into a binary stream; returns the row count.
+
+    written: callable returning the bytes output so far; raises ExportTooLarge
+    once it passes EXPORT_MAX_BYTES.
+    """
+    # utf-8-sig so Excel picks the right encoding
+    text = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+    writer, count = None, 0
+    try:
+        async for row in rows:
+            if writer is None:
+                fields = [k for k in row if k not in HIDDEN_COLUMNS]
+                writer = csv.DictWriter(text, fieldnames=fields, extrasaction="ignore")
+                writer.writeheader()
+            writer.writerow(row)
+            count += 1
+            if written is not None and written() > EXPORT_MAX_BYTES:
+                raise _too_large()
+        text.flush()
+    finally:
+        # Leave the underlying stream open for the caller
+        text.detach()
+    return count
+
+async def export_table(table, user_id=None, workflow_id=None, compress=False):
+    """Export one table; returns (spooled file positioned at 0, filename, row count)."""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Can't export {table}")
+
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d-%H%M")
+    name = f"{table}-{stamp}.csv"
+    rows = iter_rows(table, user_id, workflow_id, page_size=EXPORT_PAGE_SIZE)
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+
+    try:
+        if compress:
+            with zipfile.ZipFile(spool, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                with archive.open(name, "w") as member:
+                    # spool.tell() counts compressed bytes as the deflater flushes them
+                    count = await _write_csv(member, rows, spool.tell)
+            name += ".zip"
+        else:
+            count = await _write_csv(spool, rows, spool.tell)
+        # The CSV writer's and the deflater's final flushes land after the last check
+        if spool.tell() > EXPORT_MAX_BYTES:
+            raise _too_large()
+    except BaseException:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return spool, name, count
@@ -1,16 +1,23 @@
 import os
 import logging
 import re
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from html import escape
+from telegram import Update, InputFile, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, CommandHandler
-from ai_logic import get_ai_response
-from voice import transcribe_audio
-from db import (
+from ai_logic import get_ai_response, get_direct_response, match_read_intent, DIRECT_RENDER
+from voice import transcribe_voice, VoiceRejected
+from memory import select_history, remember
+from streaming import MessageStreamer, STREAMING
+from importer import parser_for, stream_lines, import_contacts, redact_token, ImportAborted, IMPORT_MAX_BYTES
+from exporter import export_table, ExportTooLarge, EXPORT_TABLES
+from async_db import (
     add_contact, update_contact, delete_contact,
     add_task, update_task, delete_task,
     update_deal, delete_deal,
     update_debt, delete_debt,
+    add_contacts, add_tasks, update_tasks,
+    delete_contacts, delete_tasks, delete_deals, delete_debts,
     get_user_by_telegram_id, link_telegram_user, get_workflows, update_user_timezone
 )
 
@@ -52,6 +59,140 @@ def get_main_menu_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, is_persistent=True)
 
+async def get_reply(user_message, context_messages, user_id=None, workflow_id=None, workflow_name=None, timezone="UTC", streamer=None):
+    """Answer plain list requests ("show me my tasks") without the LLM, everything else via get_ai_response.
+
+    With a streamer, LLM answers stream into its placeholder message.
+    """
+    intent = match_read_intent(user_message) if DIRECT_RENDER else None
+    if intent:
+        return await get_direct_response(intent, user_message, context_messages, user_id=user_id, workflow_id=workflow_id)
+    if streamer is not None:
+        await streamer.start()
+    return await get_ai_response(
+        user_message,
+        context_messages=context_messages,
+        user_id=user_id,
+        workflow_id=workflow_id,
+        workflow_name=workflow_name,
+        timezone=timezone,
+        on_delta=streamer.update if streamer is not None else None
+    )
+
+# Single-row actions that are merged into one bulk request on confirm:
+# action -> (bulk action, list argument, row taken from the single call's args)
+BULK_ACTIONS = {
+    "add_contact": ("add_contacts", "contacts", lambda args: args),
+    "add_task": ("add_tasks", "tasks", lambda args: args),
+    "delete_contact": ("delete_contacts", "contact_ids", lambda args: args["contact_id"]),
+    "delete_task": ("delete_tasks", "task_ids", lambda args: args["task_id"]),
+    "delete_deal": ("delete_deals", "deal_ids", lambda args: args["deal_id"]),
+    "delete_debt": ("delete_debts", "debt_ids", lambda args: args["debt_id"]),
+}
+BULK_KEYS = {bulk: key for bulk, key, _ in BULK_ACTIONS.values()}
+
+def coalesce_actions(actions):
+    """Merge same-kind adds/deletes (single or bulk) into one bulk action each, kept at the first one's position."""
+    merged, bulk_index = [], {}
+    for item in actions:
+        action, args = item["action"], item["args"]
+        if action in BULK_ACTIONS:
+            bulk, key, row = BULK_ACTIONS[action]
+            rows = [row(args)]
+        elif action in BULK_KEYS:
+            bulk, key, rows = action, BULK_KEYS[action], list(args.get(BULK_KEYS[action]) or [])
+        else:
+            merged.append({"action": action, "args": args})
+            continue
+        if bulk in bulk_index:
+            merged[bulk_index[bulk]]["args"][key].extend(rows)
+        else:
+            bulk_index[bulk] = len(merged)
+            merged.append({"action": bulk, "args": {key: rows}})
+    # A bulk action with a single row reads better as the plain action
+    for item in merged:
+        for single, (bulk, key, _) in BULK_ACTIONS.items():
+            if item["action"] == bulk and len(item["args"][key]) == 1:
+                row = item["args"][key][0]
+                item["action"], item["args"] = single, row if isinstance(row, dict) else {key[:-1]: row}
+    return merged
+
+def format_action(item):
+    """Confirmation card lines for one pending action, one bullet per row."""
+    action, args = item["action"], item["args"]
+    rows = next((v for v in args.values() if isinstance(v, list)), None)
+    if rows is None:
+        return f"Action: {escape(action)}\nArgs: {escape(str(args))}"
+    lines = [f"<b>{escape(action.replace('_', ' ').capitalize())} ({len(rows)})</b>"]
+    for row in rows:
+        if isinstance(row, dict):
+            main = row.get("name") or row.get("title") or ""
+            extra = ", ".join(f"{k}: {v}" for k, v in row.items() if k not in ("name", "title") and v)
+            lines.append(f"• {escape(str(main))}" + (f" ({escape(extra)})" if extra else ""))
+        else:
+            lines.append(f"• {escape(str(row))}")
+    if args.get("updates"):
+        lines.append(f"Updates: {escape(str(args['updates']))}")
+    return "\n".join(lines)
+
+async def send_confirmation(message, context: ContextTypes.DEFAULT_TYPE, formatted_text, actions):
+    """Store the model's pending mutations and ask for one confirmation covering all of them."""
+    actions = coalesce_actions(actions)
+    context.user_data["pending_action"] = {"actions": actions}
+
+    keyboard = [
+        [
+            InlineKeyboardButton("✅ Confirm", callback_data="confirm_action"),
+            InlineKeyboardButton("❌ Cancel", callback_data="cancel_action")
+        ],
+        [InlineKeyboardButton("✏️ Modify", callback_data="modify_action")]
+    ]
+    details = "\n\n".join(format_action(a) for a in actions)
+    await message.reply_text(
+        f"{formatted_text}\n\n{details}",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.HTML
+    )
+
+async def execute_action(action, args, user_id=None, workflow_id=None):
+    """Run one confirmed mutation."""
+    if action == "add_contact":
+        await add_contact(args, user_id=user_id, workflow_id=workflow_id)
+    elif action == "delete_task":
+        await delete_task(args["task_id"])
+    elif action == "update_task":
+        await update_task(args["task_id"], args["updates"])
+    elif action == "delete_contact":
+        await delete_contact(args["contact_id"])
+    elif action == "update_contact":
+        await update_contact(args["contact_id"], args["updates"])
+    elif action == "add_task":
+        await add_task(args, user_id=user_id, workflow_id=workflow_id)
+    elif action == "delete_deal":
+        await delete_deal(args["deal_id"])
+    elif action == "update_deal":
+        await update_deal(args["deal_id"], args["updates"])
+    elif action == "delete_debt":
+        await delete_debt(args["debt_id"])
+    elif action == "update_debt":
+        await update_debt(args["debt_id"], args["updates"])
+    elif action == "add_contacts":
+        await add_contacts(args["contacts"], user_id=user_id, workflow_id=workflow_id)
+    elif action == "add_tasks":
+        await add_tasks(args["tasks"], user_id=user_id, workflow_id=workflow_id)
+    elif action == "update_tasks":
+        await update_tasks(args["task_ids"], args["updates"])
+    elif action == "delete_contacts":
+        await delete_contacts(args["contact_ids"])
+    elif action == "delete_tasks":
+        await delete_tasks(args["task_ids"])
+    elif action == "delete_deals":
+        await delete_deals(args["deal_ids"])
+    elif action == "delete_debts":
+        await delete_debts(args["debt_ids"])
+    else:
+        raise ValueError(f"Unsupported action: {action}")
+
 async def ensure_logged_in(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """Ensure user is logged in, recovering from DB if needed."""
     if context.user_data.get("user_id"):
@@ -59,13 +200,13 @@ async def ensure_logged_in(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         
     telegram_id = update.effective_user.id
     logger.info(f"Checking DB for user {telegram_id}")
-    user = get_user_by_telegram_id(telegram_id)
+    user = await get_user_by_telegram_id(telegram_id)
     
     if user:
-        logger.info(f"Restoring session for {user['email']}")
-        context.user_data["user_id"] = user["id"]
-        context.user_data["user_email"] = user["email"]
-        context.user_data["timezone"] = user.get("timezone", "UTC")
+        logger.info(f"Restoring session for {user.email}")
+        context.user_data["user_id"] = user.id
+        context.user_data["user_email"] = user.email
+        context.user_data["timezone"] = user.timezone or "UTC"
         return True
     
     logger.warning(f"User {telegram_id} not found in DB")
@@ -112,7 +253,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/menu - Show dashboard\n"
         "/settings - Manage account & timezone\n"
         "/set_workflow - Choose your business\n"
-        "/help - Show this message",
+        "/export - Download contacts, deals, tasks or debts as CSV\n"
+        "/help - Show this message\n\n"
+        "Send a .csv or .vcf file to import contacts in bulk.",
         reply_markup=get_main_menu_keyboard()
     )
 
@@ -125,15 +268,15 @@ async def login_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     email = context.args[0]
     telegram_id = update.effective_user.id
     
-    success, result = link_telegram_user(email, telegram_id)
+    success, result = await link_telegram_user(email, telegram_id)
     
     if success:
         user = result
-        context.user_data["user_id"] = user["id"]
-        context.user_data["user_email"] = user["email"]
-        context.user_data["timezone"] = user.get("timezone", "UTC")
+        context.user_data["user_id"] = user.id
+        context.user_data["user_email"] = user.email
+        context.user_data["timezone"] = user.timezone or "UTC"
         
-        await update.message.reply_html(f"✅ You're in, <b>{user['email']}</b>. Now get to work!", reply_markup=get_main_menu_keyboard())
+        await update.message.reply_html(f"✅ You're in, <b>{user.email}</b>. Now get to work!", reply_markup=get_main_menu_keyboard())
         
         # Show dashboard
         await menu_command(update, context)
@@ -178,6 +321,38 @@ async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     else:
         await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
 
+async def send_export(message, context: ContextTypes.DEFAULT_TYPE, table, compress=False) -> None:
+    """Build the export file for one table and send it as a document."""
+    user_id = context.user_data["user_id"]
+    workflow_id = context.user_data.get("workflow_id")
+    status = await message.reply_text(f"📤 Exporting {table}...")
+    try:
+        spool, filename, count = await export_table(table, user_id=user_id, workflow_id=workflow_id, compress=compress)
+        with spool:
+            # Let httpx stream the upload from the spool instead of reading it into memory
+            await message.reply_document(document=InputFile(spool, filename=filename, read_file_handle=False), caption=f"{count} {table}")
+        await status.delete()
+    except ExportTooLarge as e:
+        hint = "" if compress else f" Try /export {table} zip."
+        await status.edit_text(f"❌ {e}{hint}")
+    except Exception as e:
+        logger.error(f"Error exporting {table}: {e}")
+        await status.edit_text(f"❌ Export failed: {e}")
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /export [contacts|deals|tasks|debts] [zip]."""
+    if not await ensure_logged_in(update, context):
+        await update.message.reply_text("Log in first, idiot. /login <email>", reply_markup=get_main_menu_keyboard())
+        return
+
+    args = [a.lower() for a in context.args or []]
+    table = next((a for a in args if a in EXPORT_TABLES), None)
+    if table is None:
+        keyboard = [[InlineKeyboardButton(t.capitalize(), callback_data=f"export_{t}")] for t in EXPORT_TABLES]
+        await update.message.reply_text("Export what? (add 'zip' to the command for a compressed file)", reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    await send_export(update.message, context, table, compress="zip" in args)
+
 async def set_workflow_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /set_workflow command."""
     if not await ensure_logged_in(update, context):
@@ -188,7 +363,8 @@ async def set_workflow_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     user_id = context.user_data["user_id"]
-    workflows = get_workflows(user_id)
+    # Explicit command: skip the cache so newly joined workflows show up
+    workflows = await get_workflows(user_id, refresh=bool(update.message))
     
     if not workflows:
         msg = "You don't have any workflows. Go create one in the app first."
@@ -204,7 +380,7 @@ async def set_workflow_command(update: Update, context: ContextTypes.DEFAULT_TYP
     keyboard.append([InlineKeyboardButton("🏠 MY TURF (Private)", callback_data="select_workflow_None_MY TURF")])
     
     for w in workflows:
-        keyboard.append([InlineKeyboardButton(w["name"], callback_data=f"select_workflow_{w['id']}_{w['name']}")])
+        keyboard.append([InlineKeyboardButton(w.name, callback_data=f"select_workflow_{w.id}_{w.name}")])
     
     # Add Back button
     keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="back_to_settings")])
@@ -225,18 +401,10 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         await menu_command(update, context)
         return
 
-    telegram_id = update.effective_user.id
-    
-    # Check auth
-    if "user_id" not in context.user_data:
-        crm_user = get_user_by_telegram_id(telegram_id)
-        if crm_user:
-            context.user_data["user_id"] = crm_user["id"]
-            context.user_data["user_email"] = crm_user["email"]
-            context.user_data["timezone"] = crm_user.get("timezone", "UTC")
-        else:
-            await update.message.reply_text("Who are you? /login first.", reply_markup=get_main_menu_keyboard())
-            return
+    # Check auth (served from the session cache after the first lookup)
+    if not await ensure_logged_in(update, context):
+        await update.message.reply_text("Who are you? /login first.", reply_markup=get_main_menu_keyboard())
+        return
 
     user_id = context.user_data["user_id"]
     workflow_id = context.user_data.get("workflow_id")
@@ -250,71 +418,40 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     if "history" not in context.user_data:
         context.user_data["history"] = []
     
-    # Get history (limit to last 10 messages to save tokens)
-    history = context.user_data["history"][-10:]
+    # Get history (summary + recent turns within the token budget)
+    history = select_history(context.user_data)
+    streamer = MessageStreamer(update.message) if STREAMING else None
     
     try:
         # Get AI response with history and context
-        ai_response = get_ai_response(
+        ai_response = await get_reply(
             user_message, 
             context_messages=history, 
             user_id=user_id, 
             workflow_id=workflow_id,
             workflow_name=workflow_name,
-            timezone=timezone
+            timezone=timezone,
+            streamer=streamer
         )
         
-        # Update history with the full chain returned by AI
-        if isinstance(ai_response, dict) and "history" in ai_response:
-            full_history = ai_response["history"]
-            serializable_history = []
-            for msg in full_history:
-                if hasattr(msg, 'model_dump'):
-                    msg_dict = msg.model_dump()
-                elif hasattr(msg, 'to_dict'):
-                    msg_dict = msg.to_dict()
-                elif isinstance(msg, dict):
-                    msg_dict = msg
-                else:
-                    msg_dict = {"role": msg.role, "content": msg.content}
-                    if hasattr(msg, 'tool_calls') and msg.tool_calls:
-                        msg_dict['tool_calls'] = [tc.model_dump() if hasattr(tc, 'model_dump') else tc for tc in msg.tool_calls]
-                    if hasattr(msg, 'tool_call_id') and msg.tool_call_id:
-                        msg_dict['tool_call_id'] = msg.tool_call_id
-                
-                if msg_dict.get("role") != "system":
-                    serializable_history.append(msg_dict)
-            
-            context.user_data["history"] = serializable_history[-20:] # Keep last 20 messages
-        
         if isinstance(ai_response, dict):
             text = ai_response.get("text", "")
             formatted_text = format_text(text)
+            streamed = streamer is not None and streamer.placeholder is not None
             
             if ai_response.get("confirmation_needed"):
-                # Store pending action
-                context.user_data["pending_action"] = {
-                    "action": ai_response["action"],
-                    "args": ai_response["args"]
-                }
-                
-                # Create confirmation buttons
-                keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Confirm", callback_data="confirm_action"),
-                        InlineKeyboardButton("❌ Cancel", callback_data="cancel_action")
-                    ],
-                    [InlineKeyboardButton("✏️ Modify", callback_data="modify_action")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await update.message.reply_text(
-                    f"{formatted_text}\n\nAction: {ai_response['action']}\nArgs: {ai_response['args']}", 
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.HTML
-                )
+                if streamed:
+                    await streamer.discard()
+                await send_confirmation(update.message, context, formatted_text, ai_response["actions"])
+            elif streamed:
+                await streamer.finish(formatted_text)
             else:
                 await update.message.reply_text(formatted_text, parse_mode=ParseMode.HTML, reply_markup=get_main_menu_keyboard())
+
+            # Update history with the full chain returned by AI (after replying,
+            # since compaction may summarize older turns with an extra LLM call)
+            if "history" in ai_response:
+                await remember(context.user_data, ai_response["history"])
         else:
             # Fallback for string response
             text = str(ai_response)
@@ -324,23 +461,18 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             
     except Exception as e:
         logger.error(f"Error handling text message: {e}")
+        if streamer is not None:
+            await streamer.discard()
         await update.message.reply_text("Something went wrong. Fix your shit.", reply_markup=get_main_menu_keyboard())
 
 async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle voice messages."""
     voice = update.message.voice
-    telegram_id = update.effective_user.id
 
-    # Check auth
-    if "user_id" not in context.user_data:
-        crm_user = get_user_by_telegram_id(telegram_id)
-        if crm_user:
-            context.user_data["user_id"] = crm_user["id"]
-            context.user_data["user_email"] = crm_user["email"]
-            context.user_data["timezone"] = crm_user.get("timezone", "UTC")
-        else:
-            await update.message.reply_text("Who are you? /login first.", reply_markup=get_main_menu_keyboard())
-            return
+    # Check auth (served from the session cache after the first lookup)
+    if not await ensure_logged_in(update, context):
+        await update.message.reply_text("Who are you? /login first.", reply_markup=get_main_menu_keyboard())
+        return
 
     user_id = context.user_data["user_id"]
     workflow_id = context.user_data.get("workflow_id")
@@ -351,23 +483,14 @@ async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYP
     await update.message.chat.send_action(action="typing")
     
     try:
-        # Download voice file
-        file = await context.bot.get_file(voice.file_id)
-        file_path = f"voice_{voice.file_id}.ogg"
-        await file.download_to_drive(file_path)
-        
-        # Transcribe
-        transcribed_text = transcribe_audio(file_path)
-        
-        # Clean up file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # In-memory download + Whisper, or a transcript cache hit
+        transcribed_text = await transcribe_voice(context.bot, voice)
             
         if transcribed_text:
             await update.message.reply_text(f"🎤 You said: \"{transcribed_text}\"", reply_markup=get_main_menu_keyboard())
             
             # Process with AI
-            ai_response = get_ai_response(
+            ai_response = await get_ai_response(
                 transcribed_text, 
                 user_id=user_id, 
                 workflow_id=workflow_id,
@@ -380,23 +503,7 @@ async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYP
                 formatted_text = format_text(text)
                 
                 if ai_response.get("confirmation_needed"):
-                    context.user_data["pending_action"] = {
-                        "action": ai_response["action"],
-                        "args": ai_response["args"]
-                    }
-                    keyboard = [
-                        [
-                            InlineKeyboardButton("✅ Confirm", callback_data="confirm_action"),
-                            InlineKeyboardButton("❌ Cancel", callback_data="cancel_action")
-                        ],
-                        [InlineKeyboardButton("✏️ Modify", callback_data="modify_action")]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    await update.message.reply_text(
-                        f"{formatted_text}\n\nAction: {ai_response['action']}\nArgs: {ai_response['args']}", 
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML
-                    )
+                    await send_confirmation(update.message, context, formatted_text, ai_response["actions"])
                 else:
                     await update.message.reply_text(formatted_text, parse_mode=ParseMode.HTML, reply_markup=get_main_menu_keyboard())
             else:
@@ -406,10 +513,49 @@ async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYP
         else:
             await update.message.reply_text("I couldn't hear you. Speak up!", reply_markup=get_main_menu_keyboard())
         
+    except VoiceRejected as e:
+        await update.message.reply_text(f"Too much talking. {e}", reply_markup=get_main_menu_keyboard())
     except Exception as e:
         logger.error(f"Error handling voice message: {e}")
         await update.message.reply_text("I couldn't hear you. Speak up!", reply_markup=get_main_menu_keyboard())
 
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Bulk-import contacts from a CSV or vCard document."""
+    document = update.message.document
+
+    if not await ensure_logged_in(update, context):
+        await update.message.reply_text("Who are you? /login first.", reply_markup=get_main_menu_keyboard())
+        return
+
+    parser = parser_for(document.file_name, document.mime_type)
+    if parser is None:
+        await update.message.reply_text("What the hell is this? Send me a .csv or .vcf file of contacts.", reply_markup=get_main_menu_keyboard())
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.message.reply_text(f"That file is too fat. Max is {IMPORT_MAX_BYTES // (1024 * 1024)} MB.", reply_markup=get_main_menu_keyboard())
+        return
+
+    user_id = context.user_data["user_id"]
+    workflow_id = context.user_data.get("workflow_id")
+    status = await update.message.reply_text("📥 Importing contacts...")
+
+    async def on_progress(stats):
+        try:
+            await status.edit_text(f"📥 Importing contacts... {stats.summary()}")
+        except Exception as e:
+            logger.debug(f"Import progress edit skipped: {e}")
+
+    try:
+        file = await context.bot.get_file(document.file_id)
+        stats = await import_contacts(parser(stream_lines(file.file_path)), user_id=user_id, workflow_id=workflow_id, on_progress=on_progress)
+        await status.edit_text(f"✅ Import done. {stats.summary()}.")
+    except ImportAborted as e:
+        await status.edit_text(f"❌ Import stopped: {e}. {e.stats.summary()}.")
+    except Exception as e:
+        # Never echo the error to the chat: download errors carry the bot token in the URL
+        logger.error(f"Error importing contacts: {redact_token(e)}")
+        await status.edit_text("❌ Import failed. Try again in a bit.")
+
 async def handle_shortcut(prompt: str, query, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Helper to handle shortcut buttons as if they were text messages."""
     user_id = context.user_data.get("user_id")
@@ -422,9 +568,10 @@ async def handle_shortcut(prompt: str, query, context: ContextTypes.DEFAULT_TYPE
         context.user_data["history"] = []
     
     try:
-        ai_response = get_ai_response(
+        # Shortcut intents are known up front: query the DB and render directly
+        ai_response = await get_reply(
             prompt, 
-            context.user_data["history"], 
+            select_history(context.user_data), 
             user_id=user_id, 
             workflow_id=workflow_id,
             workflow_name=workflow_name,
@@ -435,6 +582,8 @@ async def handle_shortcut(prompt: str, query, context: ContextTypes.DEFAULT_TYPE
             text = ai_response.get("text", "")
             formatted_text = format_text(text)
             await query.message.reply_text(formatted_text, parse_mode=ParseMode.HTML, reply_markup=get_main_menu_keyboard())
+            if "history" in ai_response:
+                await remember(context.user_data, ai_response["history"])
         else:
             await query.message.reply_text(str(ai_response), reply_markup=get_main_menu_keyboard())
             
@@ -470,14 +619,14 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         # We want to edit the message if it comes from a button click, but set_workflow_command sends a new message.
         # Let's inline the logic here for the button click to allow "Back"
         user_id = context.user_data.get("user_id")
-        workflows = get_workflows(user_id)
+        workflows = await get_workflows(user_id)
         
         keyboard = []
         # Add "MY TURF" (Personal) option
         keyboard.append([InlineKeyboardButton("🏠 MY TURF (Private)", callback_data="select_workflow_None_MY TURF")])
         
         for w in workflows:
-            keyboard.append([InlineKeyboardButton(w["name"], callback_data=f"select_workflow_{w['id']}_{w['name']}")])
+            keyboard.append([InlineKeyboardButton(w.name, callback_data=f"select_workflow_{w.id}_{w.name}")])
             
         # Add Back button
         keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="back_to_settings")])
@@ -542,7 +691,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         user_id = context.user_data.get("user_id")
         
         # Update in DB
-        update_user_timezone(user_id, timezone)
+        await update_user_timezone(user_id, timezone)
         # Update in context
         context.user_data["timezone"] = timezone
         
@@ -553,38 +702,22 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if data == "confirm_action":
         pending = context.user_data.get("pending_action")
         if pending:
-            action = pending["action"]
-            args = pending["args"]
             user_id = context.user_data.get("user_id")
             workflow_id = context.user_data.get("workflow_id")
             
-            try:
-                result = "Done."
-                if action == "add_contact":
-                    add_contact(args, user_id=user_id, workflow_id=workflow_id)
-                elif action == "delete_task":
-                    delete_task(args["task_id"])
-                elif action == "update_task":
-                    update_task(args["task_id"], args["updates"])
-                elif action == "delete_contact":
-                    delete_contact(args["contact_id"])
-                elif action == "update_contact":
-                    update_contact(args["contact_id"], args["updates"])
-                elif action == "add_task":
-                    add_task(args, user_id=user_id, workflow_id=workflow_id)
-                elif action == "delete_deal":
-                    delete_deal(args["deal_id"])
-                elif action == "update_deal":
-                    update_deal(args["deal_id"], args["updates"])
-                elif action == "delete_debt":
-                    delete_debt(args["debt_id"])
-                elif action == "update_debt":
-                    update_debt(args["debt_id"], args["updates"])
-                
-                await query.edit_message_text(f"✅ Action {action} confirmed and executed.")
-                context.user_data.pop("pending_action", None)
-            except Exception as e:
-                await query.edit_message_text(f"❌ Error executing {action}: {str(e)}")
+            # Older sessions stored a single {"action", "args"} entry
+            actions = pending.get("actions") or [pending]
+            lines = []
+            for item in actions:
+                try:
+                    await execute_action(item["action"], item["args"], user_id=user_id, workflow_id=workflow_id)
+                    lines.append(f"✅ Action {item['action']} confirmed and executed.")
+                except Exception as e:
+                    lines.append(f"❌ Error executing {item['action']}: {str(e)}")
+            context.user_data.pop("pending_action", None)
+            summary = "\n".join(lines)
+            context.user_data.setdefault("history", []).append({"role": "assistant", "content": summary})
+            await query.edit_message_text(summary)
         else:
             await query.edit_message_text("No pending action found.")
             
@@ -606,5 +739,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     elif data == "get_contacts":
         prompt = "Show me my contacts"
         await handle_shortcut(prompt, query, context)
+    elif data.startswith("export_") and data[len("export_"):] in EXPORT_TABLES:
+        await query.edit_message_text(f"Fine, dumping your {data[len('export_'):]}.")
+        await send_export(query.message, context, data[len("export_"):])
     elif data == "add_contact_prompt":
         await query.edit_message_text(text="Fine. Send me the contact details (Name, Company, etc.).")
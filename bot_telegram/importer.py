@@ -0,0 +1,275 @@
+import os
+import re
+import csv
+import time
+import asyncio
+import logging
+import httpx
+from async_db import iter_rows, add_contacts
+
+logger = logging.getLogger(__name__)
+
+# Bulk contact import from CSV / vCard documents.
+#
+# The file is streamed from Telegram line by line and parsed incrementally, so
+# memory stays flat whatever its size. Rows are deduplicated by email and phone
+# against a set prefetched from the user's contacts, then inserted in chunks
+# of IMPORT_CHUNK_SIZE rows, a few chunks in flight at once.
+
+IMPORT_CHUNK_SIZE = int(os.environ.get("BOT_IMPORT_CHUNK_SIZE", "500"))
+IMPORT_PARALLEL_CHUNKS = int(os.environ.get("BOT_IMPORT_PARALLEL_CHUNKS", "3"))
+IMPORT_MAX_BYTES = int(os.environ.get("BOT_IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+PROGRESS_INTERVAL = 2.0
+
+CONTACT_FIELDS = ("name", "company", "role", "email", "phone")
+
+# Normalized CSV header -> contact field
+CSV_HEADER_ALIASES = {
+    "name": "name", "full name": "name", "fullname": "name", "contact": "name", "contact name": "name",
+    "first name": "first_name", "firstname": "first_name", "given name": "first_name",
+    "last name": "last_name", "lastname": "last_name", "surname": "last_name", "family name": "last_name",
+    "company": "company", "organization": "company", "organisation": "company", "company name": "company",
+    "role": "role", "title": "role", "job title": "role", "position": "role",
+    "email": "email", "e-mail": "email", "email address": "email", "e-mail address": "email", "mail": "email",
+    "phone": "phone", "phone number": "phone", "mobile": "phone", "mobile phone": "phone",
+    "telephone": "phone", "tel": "phone", "cell": "phone",
+}
+
+SUPPORTED_EXTENSIONS = (".csv", ".vcf", ".vcard")
+
+class ImportTooLarge(ValueError):
+    """The document streamed past IMPORT_MAX_BYTES."""
+
+class DownloadFailed(Exception):
+    """Telegram's file endpoint failed; the message is safe to show to the user."""
+
+class ImportAborted(Exception):
+    """Reading the document failed part way; stats covers the rows handled before."""
+
+    def __init__(self, reason, stats):
+        super().__init__(reason)
+        self.stats = stats
+
+def redact_token(text):
+    """Mask the bot token in file URLs (https://api.telegram.org/file/bot<token>/...)."""
+    return re.sub(r"/bot[^/\s]+/", "/bot<token>/", str(text))
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.failed = 0
+
+    def summary(self):
+        text = f"Read {self.read} rows: {self.imported} imported, {self.duplicates} duplicates, {self.invalid} without a name"
+        if self.failed:
+            text += f", {self.failed} failed"
+        return text
+
+def normalize_email(email):
+    return (email or "").strip().lower() or None
+
+def normalize_phone(phone):
+    digits = re.sub(r"\D", "", phone or "")
+    return digits or None
+
+def _clean(contact):
+    """Keep known fields with non-empty values; None if there is no name."""
+    contact = {k: v.strip() for k, v in contact.items() if k in CONTACT_FIELDS and isinstance(v, str) and v.strip()}
+    if not contact.get("name"):
+        # Fall back to the email's local part rather than dropping the row
+        if contact.get("email"):
+            contact["name"] = contact["email"].split("@")[0]
+        else:
+            return None
+    # Same keys on every row so a chunk is one uniform bulk insert
+    return {field: contact.get(field) for field in CONTACT_FIELDS}
+
+# --- Parsers: async iterables of text lines in, contact dicts out ---
+
+async def parse_csv(lines):
+    """Parse CSV rows incrementally; quoted fields may span lines."""
+    header = None
+    pending, open_quote = [], False
+    async for line in lines:
+        pending.append(line)
+        # Only hand complete records to the csv module
+        open_quote ^= line.count('"') % 2 == 1
+        if open_quote:
+            continue
+        for row in csv.reader(pending):
+            if header is None:
+                header = [CSV_HEADER_ALIASES.get(h.strip().lower()) for h in row]
+                continue
+            record = {}
+            for field, value in zip(header, row):
+                if field:
+                    record[field] = value
+            if "name" not in record and ("first_name" in record or "last_name" in record):
+                record["name"] = f"{record.get('first_name', '')} {record.get('last_name', '')}".strip()
+            yield record
+        pending = []
+
+def _vcard_value(value):
+    return value.replace("\\,", ",").replace("\\;", ";").replace("\\n", " ").replace("\\\\", "\\").strip()
+
+async def parse_vcard(lines):
+    """Parse vCard 2.1/3.0/4.0 entries one card at a time."""
+    card, current = None, None
+
+    def take(line):
+        name, sep, value = line.partition(":")
+        prop = name.split(";")[0].split(".")[-1].upper()
+        if card is None or not sep:
+            return
+        if prop == "FN":
+            card["name"] = _vcard_value(value)
+        elif prop == "N" and "name" not in card:
+            parts = [_vcard_value(p) for p in value.split(";")]
+            card["name"] = " ".join(p for p in (parts[1:2] + parts[:1]) if p)
+        elif prop == "ORG":
+            card.setdefault("company", _vcard_value(value.split(";")[0]))
+        elif prop == "TITLE":
+            card.setdefault("role", _vcard_value(value))
+        elif prop == "EMAIL":
+            card.setdefault("email", _vcard_value(value))
+        elif prop == "TEL":
+            card.setdefault("phone", _vcard_value(value.removeprefix("tel:")))
+
+    async for line in lines:
+        # Folded lines continue the previous property
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            take(current)
+        current = line
+        upper = line.strip().upper()
+        if upper == "BEGIN:VCARD":
+            card, current = {}, None
+        elif upper == "END:VCARD":
+            if card is not None:
+                yield card
+            card, current = None, None
+    if current is not None:
+        take(current)
+
+# --- Import pipeline ---
+
+async def stream_lines(url, max_bytes=IMPORT_MAX_BYTES):
+    """Yield decoded lines of a remote file without buffering all of it.
+
+    The URL carries the bot token, so httpx errors (whose messages include it)
+    are logged redacted and re-raised as DownloadFailed.
+    """
+    try:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(60, connect=10)) as client:
+            async with client.stream("GET", url) as response:
+                response.raise_for_status()
+                response.encoding = "utf-8"
+                received, first = 0, True
+                async for line in response.aiter_lines():
+                    received += len(line) + 1
+                    if received > max_bytes:
+                        raise ImportTooLarge(f"the file is larger than {max_bytes // (1024 * 1024)} MB")
+                    if first:
+                        line, first = line.lstrip("\ufeff"), False
+                    yield line
+    except httpx.HTTPError as e:
+        logger.error(f"Document download failed: {type(e).__name__}: {redact_token(e)}")
+        raise DownloadFailed("couldn't download the file from Telegram") from None
+
+async def existing_keys(user_id=None, workflow_id=None, page_size=1000):
+    """Emails and phones of every contact in scope.
+
+    Reads straight from the database a keyset page at a time, bypassing the
+    change feed stores and the query cache so a big import doesn't fill them.
+    """
+    emails, phones = set(), set()
+    async for row in iter_rows("contacts", user_id, workflow_id, columns="id,email,phone", page_size=page_size):
+        if normalize_email(row.get("email")):
+            emails.add(normalize_email(row["email"]))
+        if normalize_phone(row.get("phone")):
+            phones.add(normalize_phone(row["phone"]))
+    return emails, phones
+
+async def import_contacts(records, user_id=None, workflow_id=None, on_progress=None):
+    """Dedup and insert parsed records in chunked bulk requests; returns ImportStats.
+
+    If reading the records fails part way, the chunks already sent are awaited
+    and ImportAborted is raised with the stats so far.
+    """
+    stats = ImportStats()
+    emails, phones = await existing_keys(user_id, workflow_id)
+    chunk, in_flight = [], set()
+    last_progress = time.monotonic()
+
+    async def insert(rows):
+        try:
+            await add_contacts(rows, user_id=user_id, workflow_id=workflow_id)
+            stats.imported += len(rows)
+        except Exception as e:
+            stats.failed += len(rows)
+            logger.error(f"Contact import chunk of {len(rows)} rows failed: {e}")
+
+    async def flush():
+        nonlocal chunk
+        if not chunk:
+            return
+        in_flight.add(asyncio.create_task(insert(chunk)))
+        chunk = []
+        if len(in_flight) >= IMPORT_PARALLEL_CHUNKS:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            in_flight.difference_update(done)
+
+    try:
+        async for record in records:
+            stats.read += 1
+            contact = _clean(record)
+            if contact is None:
+                stats.invalid += 1
+                continue
+            email, phone = normalize_email(contact.get("email")), normalize_phone(contact.get("phone"))
+            if (email and email in emails) or (phone and phone in phones):
+                stats.duplicates += 1
+                continue
+            # Also catches duplicates within the file itself
+            if email:
+                emails.add(email)
+            if phone:
+                phones.add(phone)
+
+            chunk.append(contact)
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                await flush()
+            if on_progress and time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                await on_progress(stats)
+
+        await flush()
+    except asyncio.CancelledError:
+        for task in in_flight:
+            task.cancel()
+        raise
+    except (ImportTooLarge, DownloadFailed) as e:
+        raise ImportAborted(str(e), stats) from e
+    except Exception as e:
+        logger.error(f"Contact import stopped after {stats.read} rows: {redact_token(e)}")
+        raise ImportAborted("couldn't read the file", stats) from e
+    finally:
+        # Chunks already sent finish (or unwind, if cancelled) before returning
+        if in_flight:
+            await asyncio.wait(in_flight)
+    return stats
+
+def parser_for(file_name, mime_type=None):
+    """Pick parse_csv or parse_vcard from the document's name / MIME type, or None."""
+    name = (file_name or "").lower()
+    mime = (mime_type or "").lower()
+    if name.endswith((".vcf", ".vcard")) or "vcard" in mime:
+        return parse_vcard
+    if name.endswith(".csv") or mime in ("text/csv", "application/csv"):
+        return parse_csv
+    return None
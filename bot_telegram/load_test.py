@@ -0,0 +1,81 @@
+"""Replay fake Telegram updates against a local webhook server.
+
+Start the bot with BOT_MODE=webhook, then run e.g.:
+
+    python load_test.py --url http://localhost:8080/telegram --updates 2000 --concurrency 100
+
+By default every update is a /help command from one of --users fake users,
+which exercises the webhook, scheduler and handler path without touching
+Supabase or OpenAI. Replies to fake chats are rejected by Telegram; pass
+--chat-id with a real test chat if you want the replies to succeed.
+"""
+import time
+import asyncio
+import argparse
+import httpx
+
+def fake_update(update_id, user_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id or user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else [],
+        },
+    }
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+async def run(args):
+    latencies = []
+    errors = 0
+    counter = iter(range(1, args.updates + 1))
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(limits=limits, headers=headers, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            for update_id in counter:
+                user_id = 1_000_000 + update_id % args.users
+                payload = fake_update(args.start_id + update_id, user_id, args.chat_id, args.text)
+                start = time.perf_counter()
+                try:
+                    response = await client.post(args.url, json=payload)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(f"Sent {args.updates} updates in {elapsed:.2f}s ({args.updates / elapsed:.0f} updates/s), {errors} errors")
+    for pct in (50, 95, 99):
+        print(f"  p{pct}: {percentile(latencies, pct) * 1000:.1f} ms")
+    print(f"  max: {max(latencies) * 1000:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay fake updates against the bot webhook.")
+    parser.add_argument("--url", default="http://localhost:8080/telegram")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=100, help="Number of distinct fake users")
+    parser.add_argument("--text", default="/help")
+    parser.add_argument("--chat-id", type=int, default=None, help="Real chat to receive all replies")
+    parser.add_argument("--secret", default=None, help="BOT_WEBHOOK_SECRET, if set on the server")
+    parser.add_argument("--start-id", type=int, default=int(time.time()), help="First update_id")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
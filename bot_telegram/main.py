@@ -1,46 +1,74 @@
 import os
-import os
-from dotenv import load_dotenv
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler
-from handlers import start, help_command, login_command, set_workflow_command, logout_command, settings_command, handle_text_message, handle_voice_message, button_callback
-
-import os
-import os
 from dotenv import load_dotenv
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler
 from telegram import Update
-from handlers import start, help_command, login_command, set_workflow_command, logout_command, settings_command, menu_command, handle_text_message, handle_voice_message, button_callback
+from handlers import start, help_command, export_command, login_command, set_workflow_command, logout_command, settings_command, menu_command, handle_text_message, handle_voice_message, handle_document, button_callback
+from ai_logic import close_openai_client
+from scheduler import get_scheduler
+from persistence import get_persistence
+from stt import get_stt_router
+from reminders import start_reminders, stop_reminders
+from changefeed import start_changefeed, stop_changefeed
+from tracing import traced_request
+from metrics import start_metrics_server, stop_metrics_server
 
-async def post_init(application: Application) -> None:
-    """Set up the bot's commands."""
-    await application.bot.set_my_commands([
-        ("start", "Start the bot"),
-        ("login", "Link your account"),
-        ("menu", "Show dashboard"),
-        ("settings", "Manage account & timezone"),
-        ("set_workflow", "Switch workflow"),
-        ("help", "Get help")
-    ])
+# Only subscribe to the update types we have handlers for
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
 
-def main() -> None:
-    """Start the bot."""
-    # Load environment variables
+BOT_COMMANDS = [
+    ("start", "Start the bot"),
+    ("login", "Link your account"),
+    ("menu", "Show dashboard"),
+    ("settings", "Manage account & timezone"),
+    ("set_workflow", "Switch workflow"),
+    ("export", "Export data as CSV"),
+    ("help", "Get help")
+]
+
+def load_env() -> None:
+    """Load environment variables."""
     # Load .env from root directory first (so shared keys like OpenAI/Supabase are available)
     # and local .env second (to allow specific overrides or bot-specific keys)
     root_env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
     load_dotenv(root_env_path)
     load_dotenv()
 
-    token = os.environ.get("TELEGRAM_BOT_TOKEN")
-    
-    if not token:
-        print("Error: TELEGRAM_BOT_TOKEN not found.")
-        return
+async def post_init(application: Application) -> None:
+    """Set up the bot's commands, load local STT models and start background services."""
+    await application.bot.set_my_commands(BOT_COMMANDS)
+    await get_stt_router().warm_up()
+    start_changefeed()
+    start_reminders(application)
+    start_metrics_server()
 
-    print("Starting bot...")
-    
-    # Create the Application
-    application = Application.builder().token(token).post_init(post_init).build()
+async def post_shutdown(application: Application) -> None:
+    """Release shared API clients, STT workers and background services."""
+    await close_openai_client()
+    await get_stt_router().close()
+    await stop_reminders()
+    await stop_changefeed()
+    await stop_metrics_server()
+
+def build_application(token: str, updater: bool = True) -> Application:
+    """Create the Application and register all handlers.
+
+    Pass ``updater=False`` when updates are fed in by the webhook server.
+    """
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(get_scheduler())
+        # Bot API calls are timed; long polling (get_updates) is left untraced
+        .request(traced_request())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if not updater:
+        builder = builder.updater(None)
+    persistence = get_persistence()
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    application = builder.build()
 
     # Register handlers
     application.add_handler(CommandHandler("start", start))
@@ -50,20 +78,47 @@ def main() -> None:
     application.add_handler(CommandHandler("settings", settings_command))
     application.add_handler(CommandHandler("menu", menu_command)) 
     application.add_handler(CommandHandler("set_workflow", set_workflow_command))
+    application.add_handler(CommandHandler("export", export_command))
     
     # Voice handler
     application.add_handler(MessageHandler(filters.VOICE, handle_voice_message))
     
+    # CSV / vCard contact imports
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+    
     # Text handler
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     
     # Callback query handler
     application.add_handler(CallbackQueryHandler(button_callback))
 
+    return application
+
+def main() -> None:
+    """Start the bot."""
+    load_env()
+
+    token = os.environ.get("TELEGRAM_BOT_TOKEN")
+    
+    if not token:
+        print("Error: TELEGRAM_BOT_TOKEN not found.")
+        return
+
+    print("Starting bot...")
+
+    # BOT_MODE=webhook serves updates over HTTP instead of long polling
+    if os.environ.get("BOT_MODE", "polling").lower() == "webhook":
+        from webhook import run_webhook
+        run_webhook(token)
+        return
+    
+    # Create the Application
+    application = build_application(token)
+
     print("Trevor Philips Bot is running... Don't fuck it up.")
     
     # Run the bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,179 @@
+import os
+import logging
+from scheduler import limit
+from tracing import span
+from ai_logic import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+# Conversation memory kept in context.user_data:
+#   "history":         recent messages, stored verbatim
+#   "history_summary": running summary of everything older
+#
+# History is budgeted in tokens rather than message counts. An assistant message
+# with tool_calls and the tool results answering it form one unit that is kept
+# or dropped as a whole, so the prompt never holds a tool result without its call.
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("BOT_HISTORY_TOKEN_BUDGET", "3000"))
+# After compaction, this much recent history is kept verbatim
+HISTORY_KEEP_TOKENS = int(os.environ.get("BOT_HISTORY_KEEP_TOKENS", "1500"))
+# Single tool outputs (e.g. a contact dump) are clipped to this when stored
+TOOL_OUTPUT_TOKEN_LIMIT = int(os.environ.get("BOT_TOOL_OUTPUT_TOKEN_LIMIT", "600"))
+SUMMARY_MODEL = os.environ.get("BOT_SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_TOKEN_LIMIT = 300
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken missing or its BPE file can't be fetched
+    _encoding = None
+
+def count_text_tokens(text):
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Rough fallback: ~4 characters per token
+    return len(text) // 4 + 1
+
+def count_tokens(message):
+    """Approximate prompt tokens used by one chat message."""
+    tokens = 4 + count_text_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        tokens += count_text_tokens(function.get("name", "")) + count_text_tokens(function.get("arguments", ""))
+    return tokens
+
+def _clip(text, max_tokens):
+    if count_text_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens]) + "\n[...truncated]"
+    return text[:max_tokens * 4] + "\n[...truncated]"
+
+def serialize_messages(messages):
+    """Turn the message chain returned by get_ai_response into plain dicts (no system messages)."""
+    serialized = []
+    for msg in messages:
+        if hasattr(msg, 'model_dump'):
+            msg_dict = msg.model_dump(exclude_none=True)
+        elif hasattr(msg, 'to_dict'):
+            msg_dict = msg.to_dict()
+        elif isinstance(msg, dict):
+            msg_dict = dict(msg)
+        else:
+            msg_dict = {"role": msg.role, "content": msg.content}
+            if getattr(msg, 'tool_calls', None):
+                msg_dict['tool_calls'] = [tc.model_dump() if hasattr(tc, 'model_dump') else tc for tc in msg.tool_calls]
+            if getattr(msg, 'tool_call_id', None):
+                msg_dict['tool_call_id'] = msg.tool_call_id
+
+        if msg_dict.get("role") == "system":
+            continue
+        if msg_dict.get("role") == "tool":
+            msg_dict["content"] = _clip(msg_dict.get("content") or "", TOOL_OUTPUT_TOKEN_LIMIT)
+        serialized.append(msg_dict)
+    return serialized
+
+def group_turns(messages):
+    """Split messages into atomic units; tool results stay with their tool_calls.
+
+    Tool messages whose call is not in the list are dropped.
+    """
+    units = []
+    for msg in messages:
+        role = msg.get("role")
+        if role == "tool":
+            if units and units[-1][0].get("tool_calls"):
+                units[-1].append(msg)
+            continue
+        units.append([msg])
+
+    # An assistant tool_calls message missing any of its results is invalid too
+    complete = []
+    for unit in units:
+        calls = unit[0].get("tool_calls")
+        if calls and {c.get("id") for c in calls} != {m.get("tool_call_id") for m in unit[1:]}:
+            continue
+        complete.append(unit)
+    return complete
+
+def _units_within(units, budget):
+    """The most recent units whose total size fits the budget."""
+    kept, used = [], 0
+    for unit in reversed(units):
+        size = sum(count_tokens(m) for m in unit)
+        if used + size > budget:
+            break
+        kept.append(unit)
+        used += size
+    kept.reverse()
+    return kept
+
+def select_history(user_data):
+    """Messages to send with the next prompt: summary first, then recent units within budget."""
+    units = group_turns(user_data.get("history", []))
+    messages = [m for unit in _units_within(units, HISTORY_TOKEN_BUDGET) for m in unit]
+    summary = user_data.get("history_summary")
+    if summary:
+        messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    return messages
+
+def _render(units, tool_tokens=100, line_tokens=200):
+    """Plain-text transcript of units; tool results clipped to tool_tokens (0 drops them)."""
+    lines = []
+    for unit in units:
+        for m in unit:
+            if m.get("tool_calls"):
+                calls = ", ".join(f"{c['function']['name']}({c['function'].get('arguments', '')})" for c in m["tool_calls"])
+                lines.append(f"assistant called: {calls}")
+            elif m.get("role") == "tool":
+                if tool_tokens:
+                    lines.append(f"tool result: {_clip(m.get('content') or '', tool_tokens)}")
+            elif m.get("content"):
+                lines.append(f"{m['role']}: {_clip(m['content'], line_tokens)}")
+    return "\n".join(lines)
+
+async def _summarize(previous_summary, units):
+    client = get_openai_client()
+    if client is not None:
+        try:
+            async with span("llm", "summary"), limit("openai_chat"):
+                response = await client.chat.completions.create(
+                    model=SUMMARY_MODEL,
+                    max_tokens=SUMMARY_TOKEN_LIMIT,
+                    messages=[
+                        {"role": "system", "content": (
+                            "Update the running summary of a CRM assistant conversation. Keep names, "
+                            "IDs, amounts, dates and open requests; drop small talk. Reply with the summary only."
+                        )},
+                        {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{_render(units)}"},
+                    ],
+                )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            logger.warning(f"History summarization failed, using extractive summary: {e}")
+
+    # No LLM available: keep the most recent user/assistant lines that fit
+    lines = (previous_summary.split("\n") if previous_summary else []) + _render(units, tool_tokens=0, line_tokens=60).split("\n")
+    kept, used = [], 0
+    for line in reversed(lines):
+        used += count_text_tokens(line)
+        if used > SUMMARY_TOKEN_LIMIT:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+async def remember(user_data, messages):
+    """Store the new history and fold older turns into the summary when over budget."""
+    units = group_turns(serialize_messages(messages))
+    total = sum(count_tokens(m) for unit in units for m in unit)
+
+    if total > HISTORY_TOKEN_BUDGET:
+        keep = _units_within(units, HISTORY_KEEP_TOKENS)
+        old = units[:len(units) - len(keep)]
+        if old:
+            user_data["history_summary"] = await _summarize(user_data.get("history_summary"), old)
+        units = keep
+
+    user_data["history"] = [m for unit in units for m in unit]
@@ -0,0 +1,120 @@
+import os
+import asyncio
+import logging
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from tracing import render_histograms
+
+logger = logging.getLogger(__name__)
+
+# Prometheus /metrics: tracing histograms plus the counters each subsystem
+# already keeps (scheduler queues, dependency limiters, caches, LLM usage,
+# STT, change feed, reminders), rendered as untyped samples.
+#
+# Webhook mode serves it from the webhook app; in polling mode set
+# BOT_METRICS_PORT to serve it on its own port. With several webhook workers
+# each one reports only itself, on BOT_METRICS_PORT + its index.
+
+METRICS_PORT = int(os.environ.get("BOT_METRICS_PORT", "0"))
+METRICS_HOST = os.environ.get("BOT_METRICS_HOST", "127.0.0.1")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _number(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+def _collect(samples, prefix, stats, label=None):
+    """Flatten a stats dict into samples[name] -> [(labels, value)].
+
+    With label, the top-level keys are label values (e.g. dependency names).
+    """
+    if label is not None:
+        for name, values in stats.items():
+            for key, value in values.items():
+                if _number(value) is not None:
+                    samples.setdefault(f"{prefix}_{key}", []).append(((label, name), _number(value)))
+        return
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            _collect(samples, f"{prefix}_{key}", value)
+        elif _number(value) is not None:
+            samples.setdefault(f"{prefix}_{key}", []).append((None, _number(value)))
+
+def _sources():
+    """(prefix, getter, label) per subsystem; getters run inside render_metrics' try."""
+    # Imported here so /metrics never drags module import order around
+    from scheduler import get_metrics
+    from async_db import get_cache_stats
+    from ai_logic import get_llm_stats
+    from transcripts import get_transcript_stats
+    from stt import get_stt_stats
+    from changefeed import get_changefeed_stats
+    from reminders import get_reminder_stats
+
+    return [
+        ("bot_updates", lambda: get_metrics()["updates"], None),
+        ("bot_dependency", lambda: get_metrics()["dependencies"], "dependency"),
+        ("bot_cache", get_cache_stats, "cache"),
+        # The transcript LRU tier reports alongside the other caches
+        ("bot_cache", lambda: {"transcripts": get_transcript_stats().get("memory", {})}, "cache"),
+        ("bot_llm", get_llm_stats, "stage"),
+        ("bot_transcript_cache", lambda: {k: v for k, v in get_transcript_stats().items() if k != "memory"}, None),
+        ("bot_stt", get_stt_stats, "backend"),
+        ("bot_changefeed", get_changefeed_stats, None),
+        ("bot_reminders", get_reminder_stats, None),
+    ]
+
+def render_metrics():
+    samples = {}
+    try:
+        sources = _sources()
+    except Exception as e:
+        logger.warning(f"Skipping subsystem metrics: {e}")
+        sources = []
+    for prefix, getter, label in sources:
+        # One failing subsystem (e.g. a misconfigured STT backend) must not fail the scrape
+        try:
+            _collect(samples, prefix, getter() or {}, label)
+        except Exception as e:
+            logger.warning(f"Skipping {prefix} metrics: {e}")
+
+    lines = [render_histograms()]
+    for name, values in samples.items():
+        for labels, value in values:
+            suffix = f'{{{labels[0]}="{labels[1]}"}}' if labels else ""
+            lines.append(f"{name}{suffix} {value}")
+    return "\n".join(lines) + "\n"
+
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+_server_task = None
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on BOT_METRICS_PORT (polling mode, webhook workers); no-op if unset."""
+    global _server_task
+    if not port or _server_task is not None:
+        return
+    import uvicorn
+
+    app = Starlette(routes=[Route("/metrics", metrics_endpoint, methods=["GET"])])
+    server = uvicorn.Server(uvicorn.Config(app, host=METRICS_HOST, port=port, log_level="warning"))
+    # The bot owns signal handling
+    server.install_signal_handlers = lambda: None
+    _server_task = asyncio.create_task(server.serve())
+    logger.info(f"Serving metrics on http://{METRICS_HOST}:{port}/metrics")
+
+async def stop_metrics_server():
+    global _server_task
+    if _server_task is not None:
+        _server_task.cancel()
+        try:
+            await _server_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _server_task = None
@@ -0,0 +1,201 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Compact row models for CRM entities.
+#
+# A dict per row costs a hash table per row; with thousands of rows held in the
+# change feed stores and the query cache that overhead dominates. Each model
+# keeps the table's known columns in __slots__ and anything else (columns added
+# by later migrations) in a small overflow dict, so no column is ever dropped.
+#
+# Models read like the dicts they replace (row["title"], row.get("title"),
+# iteration over set columns) and also expose columns as attributes; a declared
+# column that wasn't selected reads as None. Columns that weren't fetched are
+# left out of the mapping view, so projections stay projections. Method names
+# must not collide with column names (tasks has a "project" column).
+#
+# orjson is used to decode JSON when installed; it is optional.
+
+def loads(data):
+    """Decode JSON text or bytes, with orjson when available."""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+class Row:
+    __slots__ = ("_extra",)
+
+    FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = tuple(cls.__slots__)
+        cls._field_set = frozenset(cls.FIELDS)
+        # Slot descriptors, to skip attribute lookup on the decode hot path
+        cls._slots = {name: cls.__dict__[name] for name in cls.FIELDS}
+
+    def __init__(self, **values):
+        self._extra = None
+        self._fill(values)
+
+    def _fill(self, values):
+        slots = self._slots
+        for key, value in values.items():
+            slot = slots.get(key)
+            if slot is not None:
+                slot.__set__(self, value)
+            else:
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[key] = value
+
+    @classmethod
+    def from_row(cls, row):
+        """Build a model from one PostgREST / Realtime row dict."""
+        obj = cls.__new__(cls)
+        obj._extra = None
+        obj._fill(row)
+        return obj
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls.from_row(row) for row in rows]
+
+    def __getattr__(self, name):
+        # Only called for unset slots and unknown names
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._field_set:
+            return None
+        if self._extra is not None and name in self._extra:
+            return self._extra[name]
+        raise AttributeError(f"{type(self).__name__} has no column {name!r}")
+
+    # --- Read-only mapping view over the columns that were fetched ---
+
+    def keys(self):
+        keys = [name for name, slot in self._slots.items() if _is_set(slot, self)]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        slot = self._slots.get(key)
+        if slot is not None:
+            return _is_set(slot, self)
+        return self._extra is not None and key in self._extra
+
+    def __getitem__(self, key):
+        slot = self._slots.get(key)
+        if slot is not None:
+            try:
+                return slot.__get__(self)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+    def copy(self):
+        return type(self).from_row(self.to_dict())
+
+    def with_columns(self, columns):
+        """A copy holding only the given columns (missing ones as None, like PostgREST)."""
+        return type(self).from_row({column: self.get(column) for column in columns})
+
+    def __eq__(self, other):
+        if isinstance(other, (Row, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # Default slot pickling would go through __getattr__ and set every column
+        return (type(self).from_row, (self.to_dict(),))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+def _is_set(slot, obj):
+    try:
+        slot.__get__(obj)
+    except AttributeError:
+        return False
+    return True
+
+class Contact(Row):
+    __slots__ = ("id", "user_id", "workflow_id", "name", "role", "company", "email", "phone",
+                 "status", "notes", "tags", "created_at", "updated_at")
+
+class Deal(Row):
+    __slots__ = ("id", "user_id", "workflow_id", "title", "client_name", "amount", "amount_value",
+                 "probability", "status", "date", "notes", "contact_id", "reminder_date",
+                 "reminder_time", "reminder_sent", "created_at", "updated_at")
+
+class Task(Row):
+    __slots__ = ("id", "user_id", "workflow_id", "title", "description", "date", "due_date",
+                 "reminder_time", "reminder_sent", "priority", "project", "completed",
+                 "contact_id", "deal_id", "folder_id", "urls", "created_at", "updated_at")
+
+class Debt(Row):
+    __slots__ = ("id", "user_id", "workflow_id", "borrower_name", "amount_lent", "amount_repaid",
+                 "amount_paid", "date_lent", "reminder_date", "reminder_sent", "description",
+                 "status", "payment_type", "created_at", "updated_at")
+
+class Event(Row):
+    __slots__ = ("id", "user_id", "workflow_id", "title", "description", "date", "time", "type",
+                 "task_id", "contact_id", "deal_id", "reminder_sent", "created_at", "updated_at")
+
+class Workflow(Row):
+    __slots__ = ("id", "name", "creator_id", "share_code", "shared_resources", "ntfy_url",
+                 "created_at", "updated_at")
+
+class User(Row):
+    __slots__ = ("id", "email", "full_name", "timezone", "telegram_chat_id", "ntfy_url",
+                 "created_at", "updated_at")
+
+TABLE_MODELS = {
+    "contacts": Contact,
+    "deals": Deal,
+    "tasks": Task,
+    "debts": Debt,
+    "calendar_events": Event,
+    "workflows": Workflow,
+    "users": User,
+}
+
+def decode_rows(table, rows):
+    """Models for a table's rows; tables without a model keep their dicts."""
+    model = TABLE_MODELS.get(table)
+    return model.from_rows(rows) if model is not None else rows
+
+def as_model(table, row):
+    """One row as its table's model (rows that already are models pass through)."""
+    model = TABLE_MODELS.get(table)
+    if model is None or isinstance(row, model):
+        return row
+    return model.from_row(row)
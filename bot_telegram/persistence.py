@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+from telegram.ext import BasePersistence, PersistenceInput
+from async_db import get_client, _execute
+
+logger = logging.getLogger(__name__)
+
+# Restart-safe storage for context.user_data (login, workflow, pending_action,
+# chat history). Only user_data is persisted; the bot keeps nothing in
+# chat_data / bot_data.
+#
+# Nothing is read at startup. A user's data is loaded once, the first time one
+# of their updates is processed (refresh_user_data). Writes are buffered and
+# flushed in one batch per PTB update_interval. Webhook workers route each user
+# to a fixed process, so that process's copy stays authoritative.
+#
+# Each row carries an updated_at version. With BOT_PERSISTENCE_RECHECK=1 every
+# update also asks the store for the row if it is newer than the copy in
+# memory (a primary key lookup that normally returns nothing), for setups
+# where one user's updates can reach several processes, e.g. two instances
+# overlapping during a deploy. A newer stored copy replaces the one in memory
+# unless this process still has an unflushed write for that user.
+
+class SQLiteStore:
+    """user_data rows in a local SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bot_user_data ("
+                "telegram_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _load(self, telegram_id, newer_than):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data, updated_at FROM bot_user_data WHERE telegram_id = ? AND (? IS NULL OR updated_at > ?)",
+                (telegram_id, newer_than, newer_than),
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _save_many(self, rows):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO bot_user_data (telegram_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(telegram_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(telegram_id, json.dumps(data, default=str), now) for telegram_id, data in rows.items()],
+            )
+        return {telegram_id: now for telegram_id in rows}
+
+    def _delete(self, telegram_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM bot_user_data WHERE telegram_id = ?", (telegram_id,))
+
+    # sqlite3 is blocking, keep it off the event loop
+    async def load(self, telegram_id, newer_than=None):
+        return await asyncio.to_thread(self._load, telegram_id, newer_than)
+
+    async def save_many(self, rows):
+        return await asyncio.to_thread(self._save_many, rows)
+
+    async def delete(self, telegram_id):
+        await asyncio.to_thread(self._delete, telegram_id)
+
+class SupabaseStore:
+    """user_data rows in the `bot_user_data` table, shared by every bot process."""
+
+    table = "bot_user_data"
+
+    async def load(self, telegram_id, newer_than=None):
+        supabase = await get_client()
+        query = supabase.table(self.table).select("data, updated_at").eq("telegram_id", telegram_id)
+        if newer_than is not None:
+            query = query.gt("updated_at", newer_than)
+        response = await _execute(query)
+        return (response.data[0]["data"], response.data[0]["updated_at"]) if response.data else None
+
+    async def save_many(self, rows):
+        supabase = await get_client()
+        payload = [
+            {"telegram_id": telegram_id, "data": json.loads(json.dumps(data, default=str))}
+            for telegram_id, data in rows.items()
+        ]
+        response = await _execute(supabase.table(self.table).upsert(payload, on_conflict="telegram_id"))
+        # updated_at is set by a trigger; the returned rows carry the new versions
+        return {row["telegram_id"]: row["updated_at"] for row in response.data or []}
+
+    async def delete(self, telegram_id):
+        supabase = await get_client()
+        await _execute(supabase.table(self.table).delete().eq("telegram_id", telegram_id))
+
+class UserDataPersistence(BasePersistence):
+    """PTB persistence for user_data on top of a SQLite or Supabase store."""
+
+    def __init__(self, store, update_interval=30, recheck=False):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store
+        self.recheck = recheck
+        self._versions = {}  # telegram_id -> updated_at of the copy in memory
+        self._dirty = {}
+        self._flush_task = None
+
+    async def get_user_data(self):
+        # Loaded lazily per user in refresh_user_data
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        # Called before every update; only the first one per user reads the
+        # store unless recheck is on
+        first_load = user_id not in self._versions
+        if not first_load and not self.recheck:
+            return
+        try:
+            loaded = await self.store.load(user_id, newer_than=self._versions.get(user_id))
+        except Exception as e:
+            logger.error(f"Failed to load user_data for {user_id}: {e}")
+            return
+        if loaded is None:
+            # Nothing stored yet (or nothing newer); don't ask again
+            self._versions.setdefault(user_id, None)
+            return
+        stored, version = loaded
+        if first_load:
+            self._versions[user_id] = version
+            # Anything set in memory since startup wins over the stored copy
+            for key, value in (stored or {}).items():
+                user_data.setdefault(key, value)
+        elif user_id in self._dirty:
+            # Our unflushed write is newer still; it will overwrite the row
+            logger.warning(f"user_data for {user_id} changed in another process; keeping this process's unsaved copy")
+        else:
+            # Another process wrote after us: its copy wins over our stale one
+            self._versions[user_id] = version
+            user_data.clear()
+            user_data.update(stored or {})
+
+    async def update_user_data(self, user_id, data):
+        # Called for every dirty user once per update_interval; collect them
+        # and write the whole batch in one go.
+        self._dirty[user_id] = dict(data)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_dirty())
+
+    async def _flush_dirty(self):
+        # Let the rest of this update_persistence round add its users first
+        await asyncio.sleep(0)
+        while self._dirty:
+            rows, self._dirty = self._dirty, {}
+            try:
+                self._versions.update(await self.store.save_many(rows) or {})
+            except Exception as e:
+                logger.error(f"Failed to persist user_data for {len(rows)} users: {e}")
+                # Keep them for the next round unless newer data arrived meanwhile
+                for user_id, data in rows.items():
+                    self._dirty.setdefault(user_id, data)
+                return
+
+    async def drop_user_data(self, user_id):
+        self._dirty.pop(user_id, None)
+        self._versions.pop(user_id, None)
+        await self.store.delete(user_id)
+
+    async def flush(self):
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._flush_dirty()
+
+    # Unused parts of the persistence interface
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+def get_persistence():
+    """Build the persistence backend selected by BOT_PERSISTENCE (sqlite, supabase or none)."""
+    backend = os.environ.get("BOT_PERSISTENCE", "sqlite").lower()
+    interval = float(os.environ.get("BOT_PERSISTENCE_INTERVAL", "30"))
+    recheck = os.environ.get("BOT_PERSISTENCE_RECHECK", "0").lower() in ("1", "true", "yes", "on")
+
+    if backend == "none":
+        return None
+    if backend == "supabase":
+        return UserDataPersistence(SupabaseStore(), update_interval=interval, recheck=recheck)
+    if backend == "sqlite":
+        path = os.environ.get("BOT_PERSISTENCE_PATH", "bot_state.sqlite3")
+        return UserDataPersistence(SQLiteStore(path), update_interval=interval, recheck=recheck)
+    raise ValueError(f"Unknown BOT_PERSISTENCE backend: {backend}")
@@ -0,0 +1,120 @@
+"""Local stand-in for the Supabase Realtime websocket, for exercising changefeed.py.
+
+Speaks the subset of the Phoenix protocol the change feed uses: channel joins,
+heartbeats and postgres_changes events. Run it and point the bot at it:
+
+    python realtime_standin.py --port 4000
+    BOT_REALTIME_URL=ws://localhost:4000/socket python main.py
+
+then type one change per line on stdin, e.g.
+
+    {"table": "tasks", "type": "UPDATE", "record": {"id": "1", "user_id": "u1", "title": "Call Bob"}}
+
+Typing "drop" closes every connection, to test reconnect and backfill. In
+tests, use RealtimeStandIn directly and call emit() / drop().
+"""
+import sys
+import json
+import asyncio
+import argparse
+import datetime
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+class RealtimeStandIn:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.clients = {}   # connection -> set of joined topics
+        self.joined = asyncio.Event()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/socket"
+
+    async def __aenter__(self):
+        self._server = await serve(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _reply(self, socket, message, response=None):
+        await socket.send(json.dumps({
+            "topic": message["topic"], "event": "phx_reply", "ref": message.get("ref"),
+            "payload": {"status": "ok", "response": response or {}},
+        }))
+
+    async def _handle(self, socket):
+        self.clients[socket] = set()
+        try:
+            async for raw in socket:
+                message = json.loads(raw)
+                if message["event"] == "phx_join":
+                    changes = message["payload"].get("config", {}).get("postgres_changes", [])
+                    self.clients[socket].add(message["topic"])
+                    await self._reply(socket, message, {"postgres_changes": [
+                        {"id": i, **change} for i, change in enumerate(changes)
+                    ]})
+                    self.joined.set()
+                elif message["event"] in ("heartbeat", "phx_leave"):
+                    await self._reply(socket, message)
+        except ConnectionClosed:
+            pass
+        finally:
+            del self.clients[socket]
+
+    async def emit(self, table, type, record=None, old_record=None):
+        """Send a postgres_changes event (type INSERT, UPDATE or DELETE) to every joined channel."""
+        data = {
+            "schema": "public", "table": table, "type": type,
+            "commit_timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "record": record or {}, "old_record": old_record or {}, "errors": None,
+        }
+        for socket, topics in list(self.clients.items()):
+            for topic in topics:
+                await socket.send(json.dumps({
+                    "topic": topic, "event": "postgres_changes", "ref": None,
+                    "payload": {"ids": [0], "data": data},
+                }))
+
+    async def drop(self):
+        """Close every connection, as a network blip would."""
+        self.joined.clear()
+        for socket in list(self.clients):
+            await socket.close()
+
+async def _read_stdin(standin):
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            return
+        line = line.strip()
+        if not line:
+            continue
+        if line == "drop":
+            await standin.drop()
+            continue
+        try:
+            change = json.loads(line)
+            await standin.emit(change["table"], change.get("type", "UPDATE"), change.get("record"), change.get("old_record"))
+        except (ValueError, KeyError) as e:
+            print(f"Bad change: {e}", file=sys.stderr)
+
+async def run(args):
+    async with RealtimeStandIn(args.host, args.port) as standin:
+        print(f"Realtime stand-in listening on {standin.url}")
+        await _read_stdin(standin)
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Supabase Realtime websocket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4000)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+import os
+import heapq
+import asyncio
+import logging
+import datetime
+from html import escape
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import httpx
+from async_db import iter_rows, get_reminder_recipients, claim_reminders, release_reminders, add_write_listener
+
+logger = logging.getLogger(__name__)
+
+# Reminder delivery from inside the bot, replacing the per-minute pg_cron scan.
+#
+# Unsent reminders due within REMINDER_HORIZON, and overdue ones no older than
+# REMINDER_GRACE (missed while the bot was down), are loaded into a min-heap keyed
+# by UTC due time, and a single JobQueue job is set for the head of the heap, so
+# the engine sleeps until something is actually due. The heap is reloaded every
+# REMINDER_REFRESH_INTERVAL to pick up rows written by the web app; writes made
+# by the bot itself arrive through the async_db write listener.
+#
+# When items fall due they are delivered as one batch: rows are claimed with
+# one bulk reminder_sent update per table, each chat gets a single Telegram
+# message listing its reminders, ntfy topics get one POST per reminder, and
+# anything that could not be delivered anywhere is released again. Rows with
+# no chat or ntfy topic are remembered as undeliverable and only re-queued by
+# a refresh once their user or workflow gets one (or the row changes); they
+# age out of the load window after REMINDER_GRACE, so each refresh scans a
+# bounded date range.
+
+REMINDERS_ENABLED = os.environ.get("BOT_REMINDERS", "1").lower() not in ("0", "false", "no", "off")
+REMINDER_NTFY = os.environ.get("BOT_REMINDER_NTFY", "1").lower() not in ("0", "false", "no", "off")
+REMINDER_REFRESH_INTERVAL = int(os.environ.get("BOT_REMINDER_REFRESH_INTERVAL", "300"))
+REMINDER_HORIZON = datetime.timedelta(seconds=int(os.environ.get("BOT_REMINDER_HORIZON", "3600")))
+REMINDER_GRACE = datetime.timedelta(seconds=int(os.environ.get("BOT_REMINDER_GRACE", "86400")))
+REMINDER_SEND_CONCURRENCY = int(os.environ.get("BOT_REMINDER_SEND_CONCURRENCY", "8"))
+DEFAULT_REMINDER_TIME = datetime.time(9, 0)
+MAX_MESSAGE_LENGTH = 4000
+
+# Local dates can run up to 14 hours ahead of (or 12 behind) UTC
+MAX_UTC_OFFSET = datetime.timedelta(hours=14)
+
+# table -> projected columns, column holding the due date, extra filters
+SOURCES = {
+    "calendar_events": {
+        "columns": "id,user_id,workflow_id,title,description,date,time",
+        "date_column": "date",
+        "filters": [("task_id", "is", "null")],
+    },
+    "tasks": {
+        "columns": "id,user_id,workflow_id,title,description,due_date,reminder_time",
+        "date_column": "due_date",
+        "filters": [],
+    },
+    "deals": {
+        "columns": "id,user_id,workflow_id,title,amount,reminder_date,reminder_time",
+        "date_column": "reminder_date",
+        "filters": [],
+    },
+    "debts": {
+        "columns": "id,user_id,workflow_id,borrower_name,amount_lent,description,reminder_date",
+        "date_column": "reminder_date",
+        "filters": [],
+    },
+}
+
+def _zone(name):
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return datetime.timezone.utc
+
+def _date(value):
+    return datetime.date.fromisoformat(str(value)[:10])
+
+def _time(value):
+    return datetime.time.fromisoformat(str(value)[:8]) if value else DEFAULT_REMINDER_TIME
+
+def due_at(table, row, timezone=None):
+    """UTC due time of a reminder row, or None if it has no complete due time.
+
+    Dates and times are wall-clock values in the user's timezone, except debt
+    reminder dates which are already timestamptz.
+    """
+    try:
+        if table == "debts":
+            due = datetime.datetime.fromisoformat(row["reminder_date"])
+            if due.tzinfo is None:
+                due = due.replace(tzinfo=datetime.timezone.utc)
+            return due.astimezone(datetime.timezone.utc)
+        if table == "calendar_events":
+            if not row.get("date") or not row.get("time"):
+                return None
+            local = datetime.datetime.combine(_date(row["date"]), _time(row["time"]))
+        elif table == "tasks":
+            if not row.get("due_date"):
+                return None
+            local = datetime.datetime.combine(_date(row["due_date"]), _time(row.get("reminder_time")))
+        else:
+            if not row.get("reminder_date"):
+                return None
+            local = datetime.datetime.combine(_date(row["reminder_date"]), _time(row.get("reminder_time")))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return local.replace(tzinfo=_zone(timezone)).astimezone(datetime.timezone.utc)
+
+def _clock(value):
+    return _time(value).strftime("%H:%M")
+
+def render(table, row):
+    """(title, message, ntfy tags) in the same wording the cron job used."""
+    description = row.get("description") or ""
+    if table == "calendar_events":
+        return f"📅 {row['title']}", f"Event at {_clock(row['time'])}\n{description}".strip(), "calendar"
+    if table == "tasks":
+        return f"✅ {row['title']}", f"Due Today at {_clock(row.get('reminder_time'))}\n{description}".strip(), "clipboard"
+    if table == "deals":
+        message = f"Reminder for deal worth {row.get('amount') or '?'} at {_clock(row.get('reminder_time'))}"
+        return f"💰 Deal Reminder: {row['title']}", message, "moneybag"
+    message = f"{row['borrower_name']} owes you {row.get('amount_lent')}\n{description}".strip()
+    return f"💰 Debt Reminder: {row['borrower_name']}", message, "moneybag"
+
+def _ntfy_url(url):
+    url = (url or "").strip()
+    if url and not url.startswith("http"):
+        url = "https://" + url
+    return url or None
+
+def _targets(row, users, workflows):
+    """(telegram chat id, ntfy URL) a reminder row can be delivered to; either may be None."""
+    user = users.get(row.get("user_id")) or {}
+    workflow = workflows.get(row.get("workflow_id")) or {}
+    ntfy = _ntfy_url(workflow.get("ntfy_url") or user.get("ntfy_url")) if REMINDER_NTFY else None
+    return user.get("telegram_chat_id"), ntfy
+
+def _chunks(blocks, limit=MAX_MESSAGE_LENGTH):
+    """Group message blocks into as few Telegram messages as fit; yields lists of blocks."""
+    current, length = [], 0
+    for block in blocks:
+        if current and length + len(block) + 2 > limit:
+            yield current
+            current, length = [], 0
+        length += len(block) + (2 if current else 0)
+        current.append(block)
+    if current:
+        yield current
+
+class Reminder:
+    __slots__ = ("table", "id", "due", "row")
+
+    def __init__(self, table, row, due):
+        self.table = table
+        self.id = row["id"]
+        self.due = due
+        self.row = row
+
+    @property
+    def key(self):
+        return (self.table, self.id)
+
+class ReminderEngine:
+    """Min-heap of upcoming reminders driven by the application's JobQueue."""
+
+    def __init__(self, application):
+        self.application = application
+        self.job_queue = application.job_queue
+        self.heap = []        # (due, table, id); entries whose due no longer matches self.items are stale
+        self.items = {}       # (table, id) -> Reminder
+        self.timezones = {}   # user_id -> timezone, from the last load
+        self.undeliverable = {}  # (table, id) -> due of rows nobody could receive
+        self._wake_job = None
+        self._wake_at = None
+        self._lock = asyncio.Lock()
+        self._http = None
+        self.stats = {"loaded": 0, "delivered": 0, "failed": 0, "undeliverable": 0}
+
+    # --- Scheduling ---
+
+    def start(self):
+        self.job_queue.run_repeating(self._refresh_job, interval=REMINDER_REFRESH_INTERVAL, first=0, name="reminders:refresh")
+        add_write_listener(self._on_write)
+
+    def push(self, reminder):
+        current = self.items.get(reminder.key)
+        if current is not None and current.due == reminder.due:
+            current.row = reminder.row
+            return
+        self.items[reminder.key] = reminder
+        heapq.heappush(self.heap, (reminder.due, reminder.table, reminder.id))
+        if self._wake_at is None or reminder.due < self._wake_at:
+            self._schedule(reminder.due)
+
+    def drop(self, table, row_id):
+        # The heap entry stays behind and is skipped when popped
+        self.items.pop((table, row_id), None)
+
+    def _schedule(self, due):
+        if self._wake_job is not None:
+            self._wake_job.schedule_removal()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self._wake_at = due
+        self._wake_job = self.job_queue.run_once(self._wake, when=max(due, now), name="reminders:wake")
+
+    def _pop_due(self, now):
+        batch = []
+        while self.heap and self.heap[0][0] <= now:
+            due, table, row_id = heapq.heappop(self.heap)
+            reminder = self.items.get((table, row_id))
+            if reminder is not None and reminder.due == due:
+                del self.items[(table, row_id)]
+                batch.append(reminder)
+        return batch
+
+    async def _wake(self, context):
+        self._wake_job, self._wake_at = None, None
+        async with self._lock:
+            batch = self._pop_due(datetime.datetime.now(datetime.timezone.utc))
+            if batch:
+                try:
+                    await self.deliver(batch)
+                except Exception as e:
+                    logger.error(f"Reminder delivery failed for {len(batch)} reminders: {e}")
+        # Skip past stale entries so we don't wake up for nothing
+        while self.heap and getattr(self.items.get(self.heap[0][1:]), "due", None) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        if self.heap and self._wake_at is None:
+            self._schedule(self.heap[0][0])
+
+    # --- Loading ---
+
+    async def _refresh_job(self, context):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Reminder refresh failed: {e}")
+
+    async def load(self):
+        """Reload unsent reminders due between now - REMINDER_GRACE and now + REMINDER_HORIZON."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        since, until = now - REMINDER_GRACE, now + REMINDER_HORIZON
+
+        async def fetch(table):
+            source = SOURCES[table]
+            # Date columns hold local dates, so the bounds allow for the widest offset
+            if table == "debts":
+                start, cutoff = since.isoformat(), until.isoformat()
+            else:
+                start = (since - MAX_UTC_OFFSET).date().isoformat()
+                cutoff = (until + MAX_UTC_OFFSET).date().isoformat()
+            filters = [
+                ("reminder_sent", "eq", False),
+                (source["date_column"], "gte", start),
+                (source["date_column"], "lte", cutoff),
+                *source["filters"],
+            ]
+            return table, [row async for row in iter_rows(table, columns=source["columns"], filters=filters)]
+
+        results = await asyncio.gather(*(fetch(table) for table in SOURCES))
+        user_ids = {row["user_id"] for _, rows in results for row in rows if row.get("user_id")}
+        # Workflow settings only matter for re-checking undeliverable rows
+        workflow_ids = {
+            row["workflow_id"] for table, rows in results for row in rows
+            if (table, row["id"]) in self.undeliverable and row.get("workflow_id")
+        }
+        users, workflows = await get_reminder_recipients(user_ids, workflow_ids)
+        self.timezones = {user_id: user.get("timezone") for user_id, user in users.items()}
+        # Forget undeliverable rows once they are past the load window
+        self.undeliverable = {key: due for key, due in self.undeliverable.items() if due >= since}
+
+        loaded = 0
+        for table, rows in results:
+            for row in rows:
+                due = due_at(table, row, self.timezones.get(row.get("user_id")))
+                if due is None or not since <= due <= until:
+                    continue
+                if (table, row["id"]) in self.undeliverable:
+                    if not any(_targets(row, users, workflows)):
+                        continue
+                    del self.undeliverable[(table, row["id"])]
+                self.push(Reminder(table, row, due))
+                loaded += 1
+        self.stats["loaded"] = len(self.items)
+        logger.info(f"Loaded {loaded} upcoming reminders")
+
+    def _on_write(self, table, op, rows):
+        if table not in SOURCES:
+            return
+        now = datetime.datetime.now(datetime.timezone.utc)
+        until = now + REMINDER_HORIZON
+        for row in rows:
+            if "id" not in row:
+                continue
+            # A changed row gets a fresh delivery attempt
+            self.undeliverable.pop((table, row["id"]), None)
+            if op == "delete" or row.get("reminder_sent"):
+                self.drop(table, row["id"])
+                continue
+            if row.get("user_id") not in self.timezones:
+                # Unknown timezone; the next refresh picks it up
+                continue
+            due = due_at(table, row, self.timezones[row["user_id"]])
+            if due is None or due > until:
+                self.drop(table, row["id"])
+            elif due <= now:
+                # Overdue rows (including released failures) wait for the next refresh
+                continue
+            else:
+                self.push(Reminder(table, row, due))
+
+    # --- Delivery ---
+
+    def _client(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=httpx.Timeout(10, connect=5))
+        return self._http
+
+    async def deliver(self, batch):
+        users, workflows = await get_reminder_recipients(
+            {r.row.get("user_id") for r in batch if r.row.get("user_id")},
+            {r.row.get("workflow_id") for r in batch if r.row.get("workflow_id")},
+        )
+
+        def targets(reminder):
+            return _targets(reminder.row, users, workflows)
+
+        # Rows nobody can receive stay unsent, as with the cron job, and are
+        # not re-queued by later refreshes
+        deliverable = []
+        for reminder in batch:
+            if any(targets(reminder)):
+                deliverable.append(reminder)
+            elif reminder.key not in self.undeliverable:
+                self.undeliverable[reminder.key] = reminder.due
+                self.stats["undeliverable"] += 1
+
+        by_table = {}
+        for reminder in deliverable:
+            by_table.setdefault(reminder.table, []).append(reminder)
+        claimed = await asyncio.gather(*(claim_reminders(table, [r.id for r in items]) for table, items in by_table.items()))
+        claimed = {(table, row_id) for table, ids in zip(by_table, claimed) for row_id in ids}
+        deliverable = [r for r in deliverable if r.key in claimed]
+        if not deliverable:
+            return
+
+        slots = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+        delivered = set()
+        by_chat = {}
+        for reminder in deliverable:
+            chat_id, _ = targets(reminder)
+            if chat_id:
+                by_chat.setdefault(chat_id, []).append(reminder)
+
+        async def send_telegram(chat_id, reminders):
+            blocks = []
+            for reminder in reminders:
+                title, message, _ = render(reminder.table, reminder.row)
+                blocks.append(f"<b>{escape(title)}</b>\n{escape(message)}".strip())
+            # Reminders count as delivered chunk by chunk, so a failure part way
+            # only releases (and later re-sends) the chunks that didn't go out
+            sent = 0
+            try:
+                async with slots:
+                    for chunk in _chunks(blocks):
+                        await self.application.bot.send_message(chat_id=chat_id, text="\n\n".join(chunk), parse_mode="HTML")
+                        delivered.update(r.key for r in reminders[sent:sent + len(chunk)])
+                        sent += len(chunk)
+            except Exception as e:
+                logger.warning(f"Telegram reminder to {chat_id} failed after {sent} of {len(reminders)}: {e}")
+
+        async def send_ntfy(reminder, url):
+            title, message, tags = render(reminder.table, reminder.row)
+            params = {"title": title, "priority": "3", "tags": tags, "message": message}
+            try:
+                async with slots:
+                    response = await self._client().post(url, params=params)
+                response.raise_for_status()
+                delivered.add(reminder.key)
+            except Exception as e:
+                logger.warning(f"ntfy reminder for {reminder.table} {reminder.id} failed: {e}")
+
+        sends = [send_telegram(chat_id, reminders) for chat_id, reminders in by_chat.items()]
+        for reminder in deliverable:
+            _, url = targets(reminder)
+            if url:
+                sends.append(send_ntfy(reminder, url))
+        await asyncio.gather(*sends)
+
+        failed = [r for r in deliverable if r.key not in delivered]
+        self.stats["delivered"] += len(deliverable) - len(failed)
+        self.stats["failed"] += len(failed)
+        if failed:
+            # Release so the next refresh retries them
+            by_table = {}
+            for reminder in failed:
+                by_table.setdefault(reminder.table, []).append(reminder.id)
+            await asyncio.gather(*(release_reminders(table, ids) for table, ids in by_table.items()))
+        logger.info(f"Delivered {len(deliverable) - len(failed)} reminders, {len(failed)} failed")
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+_engine = None
+
+def start_reminders(application):
+    """Start the reminder engine on the application's JobQueue (once per process)."""
+    global _engine
+    if not REMINDERS_ENABLED or _engine is not None:
+        return _engine
+    if application.job_queue is None:
+        logger.warning("JobQueue unavailable (install python-telegram-bot[job-queue]); reminders are disabled")
+        return None
+    _engine = ReminderEngine(application)
+    _engine.start()
+    return _engine
+
+async def stop_reminders():
+    if _engine is not None:
+        await _engine.close()
+
+def get_reminder_stats():
+    if _engine is None:
+        return {}
+    return {**_engine.stats, "pending": len(_engine.items), "undeliverable_pending": len(_engine.undeliverable)}
@@ -0,0 +1,225 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from telegram.ext import BaseUpdateProcessor
+from tracing import trace_update
+
+logger = logging.getLogger(__name__)
+
+# Default in-flight limits per external dependency, overridable from env
+# (e.g. BOT_OPENAI_CHAT_CONCURRENCY=8).
+DEPENDENCY_DEFAULTS = {
+    "openai_chat": 16,
+    "whisper": 4,
+    "supabase": 32,
+}
+
+BUSY_MESSAGE = "I'm fucking swamped right now. Give me a minute and try again."
+
+class WaitStats:
+    """Running count / total / max of wait times in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg_wait": self.total / self.count if self.count else 0.0,
+            "max_wait": self.max,
+        }
+
+class DependencyLimiter:
+    """Global semaphore for one external dependency, with wait-time stats."""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+        self.in_flight = 0
+        self.wait_stats = WaitStats()
+
+    def snapshot(self):
+        return {
+            "limit": self.limit,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            **self.wait_stats.snapshot(),
+        }
+
+_limiters = {}
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        logger.warning(f"Invalid value for {name}, using {default}")
+        return default
+
+def get_limiter(name):
+    """Return the limiter for a dependency, creating it from env on first use."""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limit = _env_int(f"BOT_{name.upper()}_CONCURRENCY", DEPENDENCY_DEFAULTS.get(name, 16))
+        limiter = _limiters[name] = DependencyLimiter(name, max(1, limit))
+    return limiter
+
+@asynccontextmanager
+async def limit(name):
+    """Hold one slot of the named dependency's global concurrency limit."""
+    limiter = get_limiter(name)
+    start = time.monotonic()
+    limiter.waiting += 1
+    try:
+        await limiter.semaphore.acquire()
+    finally:
+        limiter.waiting -= 1
+    limiter.wait_stats.record(time.monotonic() - start)
+    limiter.in_flight += 1
+    try:
+        yield
+    finally:
+        limiter.in_flight -= 1
+        limiter.semaphore.release()
+
+def _user_key(update):
+    if update is None or not hasattr(update, "effective_user"):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+class UpdateScheduler(BaseUpdateProcessor):
+    """Process updates concurrently across users but serially per user.
+
+    Updates beyond ``max_backlog`` (or ``max_user_backlog`` for one user) are
+    shed with a short "busy" reply instead of being queued indefinitely.
+
+    process_update is overridden although PTB marks it @final (a typing-only
+    marker; PTB 20.4-22.x call it the same way). The base version takes the
+    concurrency slot first and only then calls do_process_update, so per-user
+    ordering there would have a user's backlog hold slots while it waits on its
+    own lock, and shedding would only happen after waiting for a slot. Here the
+    shed check and the per-user lock come first, then the base class's
+    semaphore, which stays the one concurrency limit (so PTB's
+    current_concurrent_updates keeps reporting correctly). Re-check this
+    method when upgrading python-telegram-bot.
+    """
+
+    def __init__(self, max_concurrent_updates=64, max_backlog=500, max_user_backlog=5):
+        super().__init__(max_concurrent_updates)
+        self.max_backlog = max_backlog
+        self.max_user_backlog = max_user_backlog
+        self._user_queues = {}  # user key -> [lock, queued count]
+        self.pending = 0
+        self.active = 0
+        self.shed = 0
+        self.wait_stats = WaitStats()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_concurrent_updates=max(1, _env_int("BOT_MAX_CONCURRENT_UPDATES", 64)),
+            max_backlog=max(1, _env_int("BOT_MAX_BACKLOG", 500)),
+            max_user_backlog=max(1, _env_int("BOT_MAX_USER_BACKLOG", 5)),
+        )
+
+    async def process_update(self, update, coroutine) -> None:  # overrides a @final method, see class docstring
+        key = _user_key(update)
+        queue = self._user_queues.get(key) if key is not None else None
+
+        if self.pending >= self.max_backlog or (queue and queue[1] >= self.max_user_backlog):
+            coroutine.close()
+            self.shed += 1
+            logger.warning(f"Shedding update for {key}: backlog={self.pending}")
+            await self._reply_busy(update)
+            return
+
+        if key is not None and queue is None:
+            queue = self._user_queues[key] = [asyncio.Lock(), 0]
+
+        self.pending += 1
+        if queue:
+            queue[1] += 1
+        enqueued = time.monotonic()
+        try:
+            if queue:
+                async with queue[0]:
+                    await self._run(update, coroutine, enqueued)
+            else:
+                await self._run(update, coroutine, enqueued)
+        finally:
+            self.pending -= 1
+            if queue:
+                queue[1] -= 1
+                if queue[1] == 0:
+                    self._user_queues.pop(key, None)
+
+    async def _run(self, update, coroutine, enqueued):
+        # The semaphore BaseUpdateProcessor creates from max_concurrent_updates
+        async with self._semaphore:
+            waited = time.monotonic() - enqueued
+            self.wait_stats.record(waited)
+            self.active += 1
+            try:
+                with trace_update(update, queued=waited):
+                    await self.do_process_update(update, coroutine)
+            finally:
+                self.active -= 1
+
+    async def do_process_update(self, update, coroutine) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def _reply_busy(self, update):
+        try:
+            if getattr(update, "callback_query", None):
+                await update.callback_query.answer(BUSY_MESSAGE, show_alert=True)
+            elif getattr(update, "effective_message", None):
+                await update.effective_message.reply_text(BUSY_MESSAGE)
+        except Exception as e:
+            logger.error(f"Failed to send busy reply: {e}")
+
+    def snapshot(self):
+        return {
+            "pending": self.pending,
+            "active": self.active,
+            "shed": self.shed,
+            "queued_users": len(self._user_queues),
+            "max_user_queue": max((q[1] for q in self._user_queues.values()), default=0),
+            **self.wait_stats.snapshot(),
+        }
+
+_scheduler = None
+
+def get_scheduler():
+    """Create (once) and return the update scheduler configured from env."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = UpdateScheduler.from_env()
+    return _scheduler
+
+def get_metrics():
+    """Queue depth and wait-time metrics for updates and each dependency."""
+    return {
+        "updates": _scheduler.snapshot() if _scheduler else {},
+        "dependencies": {name: l.snapshot() for name, l in _limiters.items()},
+    }
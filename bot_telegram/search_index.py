@@ -0,0 +1,232 @@
+import os
+import re
+import time
+import bisect
+import asyncio
+import logging
+import unicodedata
+from collections import defaultdict, Counter
+from cache import TTLCache
+from async_db import iter_rows, add_write_listener
+
+logger = logging.getLogger(__name__)
+
+# In-process fuzzy index for mapping phrases like "read book" to row IDs.
+#
+# One EntityIndex per (user_id, workflow_id) scope, built on first use from
+# projected keyset pages and kept current by the async_db write listener.
+# Scopes are evicted after SEARCH_INDEX_TTL so changes made outside the bot
+# (web app) are picked up by the next rebuild.
+#
+# Matching combines trigram similarity (typos, partial words) with token
+# prefix matches ("jo sm" -> "John Smith").
+
+SEARCH_INDEX_TTL = int(os.environ.get("BOT_SEARCH_INDEX_TTL", "600"))
+SEARCH_INDEX_SCOPES = int(os.environ.get("BOT_SEARCH_INDEX_SCOPES", "256"))
+MIN_SCORE = 0.2
+
+# table -> (kind, label column, other searchable columns)
+INDEXED_TABLES = {
+    "contacts": ("contact", "name", ["company"]),
+    "tasks": ("task", "title", []),
+    "deals": ("deal", "title", []),
+    "debts": ("debt", "borrower_name", []),
+}
+
+def normalize(text):
+    """Lowercase, strip accents, keep letters and digits separated by single spaces."""
+    text = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode()
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class Entry:
+    __slots__ = ("kind", "id", "label", "detail", "text", "tokens", "grams")
+
+    def __init__(self, kind, id, label, detail, text):
+        self.kind = kind
+        self.id = id
+        self.label = label
+        self.detail = detail
+        self.text = text
+        self.tokens = set(text.split())
+        self.grams = trigrams(text)
+
+class EntityIndex:
+    """Trigram + prefix index over the labels of one scope's rows."""
+
+    def __init__(self):
+        self.entries = {}                  # (kind, id) -> Entry
+        self.postings = defaultdict(set)   # trigram -> keys
+        self.token_keys = defaultdict(set) # token -> keys
+        self.sorted_tokens = []            # for prefix lookups with bisect
+        self.loading = False               # bulk load: sort tokens once at the end
+
+    def __len__(self):
+        return len(self.entries)
+
+    def upsert(self, table, row):
+        kind, label_column, extra_columns = INDEXED_TABLES[table]
+        key = (kind, str(row["id"]))
+        if key in self.entries:
+            self.remove(table, row["id"])
+        label = row.get(label_column) or ""
+        detail = " ".join(str(row.get(c) or "") for c in extra_columns).strip()
+        text = normalize(f"{label} {detail}")
+        if not text:
+            return
+        entry = Entry(kind, key[1], label, detail, text)
+        self.entries[key] = entry
+        for gram in entry.grams:
+            self.postings[gram].add(key)
+        for token in entry.tokens:
+            if token not in self.token_keys and not self.loading:
+                bisect.insort(self.sorted_tokens, token)
+            self.token_keys[token].add(key)
+
+    def finish_loading(self):
+        self.sorted_tokens = sorted(self.token_keys)
+        self.loading = False
+
+    def remove(self, table, row_id):
+        kind = INDEXED_TABLES[table][0]
+        entry = self.entries.pop((kind, str(row_id)), None)
+        if entry is None:
+            return
+        key = (kind, entry.id)
+        # Drop postings and tokens that become empty so the index doesn't grow
+        # with every rename and delete
+        for gram in entry.grams:
+            keys = self.postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[gram]
+        for token in entry.tokens:
+            keys = self.token_keys.get(token)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self.token_keys[token]
+                if not self.loading:
+                    i = bisect.bisect_left(self.sorted_tokens, token)
+                    if i < len(self.sorted_tokens) and self.sorted_tokens[i] == token:
+                        del self.sorted_tokens[i]
+
+    def _prefix_keys(self, prefix):
+        keys = set()
+        i = bisect.bisect_left(self.sorted_tokens, prefix)
+        while i < len(self.sorted_tokens) and self.sorted_tokens[i].startswith(prefix):
+            keys |= self.token_keys.get(self.sorted_tokens[i], set())
+            i += 1
+        return keys
+
+    def search(self, query, kinds=None, limit=5):
+        """Ranked [(score, Entry)] for query; only postings of its trigrams are touched."""
+        text = normalize(query)
+        if not text:
+            return []
+        grams = trigrams(text)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        # Entries where every query word starts some word of the label
+        tokens = text.split()
+        prefix_hits = self._prefix_keys(tokens[0])
+        for token in tokens[1:]:
+            prefix_hits &= self._prefix_keys(token)
+
+        results = []
+        for key in set(shared) | prefix_hits:
+            entry = self.entries.get(key)
+            if entry is None or (kinds and entry.kind not in kinds):
+                continue
+            common = shared.get(key, 0)
+            score = common / (len(grams) + len(entry.grams) - common)
+            if key in prefix_hits:
+                score += 0.3
+            if entry.text == text or normalize(entry.label) == text:
+                score += 0.5
+            if score >= MIN_SCORE:
+                results.append((min(score, 1.0), entry))
+        results.sort(key=lambda r: (-r[0], r[1].label))
+        return results[:limit]
+
+def _scope_key(user_id, workflow_id):
+    return (str(user_id) if user_id else None, str(workflow_id) if workflow_id and workflow_id != "None" else None)
+
+_indexes = TTLCache(maxsize=SEARCH_INDEX_SCOPES, ttl=SEARCH_INDEX_TTL)
+_building = {}
+
+async def _build(user_id, workflow_id):
+    index = EntityIndex()
+    index.loading = True
+    started = time.perf_counter()
+
+    async def load(table):
+        _, label_column, extra_columns = INDEXED_TABLES[table]
+        columns = ",".join(["id", label_column, *extra_columns])
+        async for row in iter_rows(table, user_id, workflow_id, columns=columns):
+            index.upsert(table, row)
+
+    await asyncio.gather(*(load(table) for table in INDEXED_TABLES))
+    index.finish_loading()
+    logger.info(f"Built search index for {_scope_key(user_id, workflow_id)}: {len(index)} entries in {time.perf_counter() - started:.2f}s")
+    return index
+
+async def get_index(user_id=None, workflow_id=None):
+    """The scope's index, building it once even if several requests ask at the same time."""
+    key = _scope_key(user_id, workflow_id)
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+    task = _building.get(key)
+    if task is None:
+        task = _building[key] = asyncio.create_task(_build(user_id, workflow_id))
+        task.add_done_callback(lambda _: _building.pop(key, None))
+    # Shielded so a cancelled caller doesn't cancel the build for the others
+    index = await asyncio.shield(task)
+    _indexes.set(key, index)
+    return index
+
+async def find_entities(query, user_id=None, workflow_id=None, kinds=None, limit=5):
+    """Ranked matches as dicts: kind, id, label, detail, score."""
+    index = await get_index(user_id, workflow_id)
+    return [
+        {"kind": e.kind, "id": e.id, "label": e.label, "detail": e.detail, "score": round(score, 2)}
+        for score, e in index.search(query, kinds=kinds, limit=limit)
+    ]
+
+def _in_scope(scope, row):
+    """Whether a row is visible to the list queries of scope (see async_db._scope)."""
+    user_id, workflow_id = scope
+    row_user, row_workflow = _scope_key(row.get("user_id"), row.get("workflow_id"))
+    if user_id and row_user != user_id:
+        return False
+    if workflow_id:
+        return row_workflow == workflow_id
+    return not user_id or row_workflow is None
+
+def _on_write(table, op, rows):
+    if table not in INDEXED_TABLES:
+        return
+    kind = INDEXED_TABLES[table][0]
+    indexes = _indexes.items()
+    for row in rows:
+        if "id" not in row:
+            continue
+        key = (kind, str(row["id"]))
+        scoped = "user_id" in row or "workflow_id" in row
+        # Every built scope is checked, so a row moved to another workflow
+        # leaves its old scope's index as well as joining the new one
+        for scope, index in indexes:
+            if op != "delete" and (_in_scope(scope, row) if scoped else key in index.entries):
+                index.upsert(table, row)
+            elif key in index.entries:
+                index.remove(table, row["id"])
+
+add_write_listener(_on_write)
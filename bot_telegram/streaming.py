@@ -0,0 +1,91 @@
+import os
+import time
+import asyncio
+import logging
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Stream LLM answers into a placeholder message instead of waiting for the
+# whole reply. BOT_STREAMING=0 turns it off for a deployment.
+STREAMING = os.environ.get("BOT_STREAMING", "1") != "0"
+# Telegram allows roughly one edit per second per chat (less in groups)
+EDIT_INTERVAL = float(os.environ.get("BOT_STREAM_EDIT_INTERVAL", "1.0"))
+
+PLACEHOLDER = "…"
+MAX_MESSAGE_LENGTH = 4096
+
+class MessageStreamer:
+    """Progressively edits one placeholder message as text streams in.
+
+    update() is synchronous and cheap: it only records the latest text and,
+    when the throttle allows, schedules a background edit. At most one edit
+    is in flight; intermediate texts are skipped. Partial text is sent
+    without parse_mode since half-streamed markup may not parse.
+    """
+
+    def __init__(self, message, interval=EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self.placeholder = None
+        self._text = ""
+        self._shown = ""
+        self._next_edit = 0.0
+        self._task = None
+
+    async def start(self):
+        self.placeholder = await self.message.reply_text(PLACEHOLDER)
+        self._next_edit = time.monotonic() + self.interval / 2
+
+    def update(self, text):
+        self._text = text
+        if self.placeholder is None or (self._task and not self._task.done()):
+            return
+        if time.monotonic() >= self._next_edit and self._text != self._shown:
+            self._task = asyncio.create_task(self._edit())
+
+    async def _edit(self):
+        text = self._text
+        self._next_edit = time.monotonic() + self.interval
+        try:
+            await self.placeholder.edit_text(self._preview(text))
+            self._shown = text
+        except RetryAfter as e:
+            self._next_edit = time.monotonic() + e.retry_after
+        except BadRequest as e:
+            # "Message is not modified" and friends are harmless here
+            logger.debug(f"Streaming edit skipped: {e}")
+
+    @staticmethod
+    def _preview(text):
+        if len(text) <= MAX_MESSAGE_LENGTH:
+            return text + " " + PLACEHOLDER
+        return PLACEHOLDER + text[-(MAX_MESSAGE_LENGTH - 2):]
+
+    async def _settle(self):
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def finish(self, formatted_text, reply_markup=None):
+        """Replace the placeholder with the final HTML text; replies normally if that fails."""
+        await self._settle()
+        try:
+            await self.placeholder.edit_text(formatted_text, parse_mode=ParseMode.HTML, reply_markup=reply_markup)
+            return
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return
+            logger.warning(f"Final streaming edit failed, sending a new message: {e}")
+        await self.discard()
+        await self.message.reply_text(formatted_text, parse_mode=ParseMode.HTML, reply_markup=reply_markup)
+
+    async def discard(self):
+        """Remove the placeholder (e.g. when the answer is a confirmation card)."""
+        await self._settle()
+        if self.placeholder is not None:
+            try:
+                await self.placeholder.delete()
+            except BadRequest:
+                pass
+            self.placeholder = None
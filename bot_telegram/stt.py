@@ -0,0 +1,270 @@
+import os
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from ai_logic import get_openai_client
+from scheduler import limit
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Speech-to-text backends.
+#
+#   BOT_STT_BACKEND=openai  every note goes to the OpenAI API (default)
+#   BOT_STT_BACKEND=local   every note runs on a local faster-whisper model
+#   BOT_STT_BACKEND=auto    notes up to BOT_STT_LOCAL_MAX_SECONDS run locally,
+#                           longer ones (and local failures) go to OpenAI
+#
+# The local engine is faster-whisper (CTranslate2) with int8 weights. It runs
+# in a process pool so decoding never holds the event loop or the GIL, and
+# each worker loads the model once.
+
+STT_BACKEND = os.environ.get("BOT_STT_BACKEND", "openai").lower()
+OPENAI_STT_MODEL = os.environ.get("BOT_STT_OPENAI_MODEL", "whisper-1")
+LOCAL_MODEL = os.environ.get("BOT_STT_LOCAL_MODEL", "base")
+LOCAL_COMPUTE_TYPE = os.environ.get("BOT_STT_LOCAL_COMPUTE_TYPE", "int8")
+LOCAL_WORKERS = int(os.environ.get("BOT_STT_LOCAL_WORKERS", "1"))
+LOCAL_THREADS = int(os.environ.get("BOT_STT_LOCAL_THREADS", "0"))  # 0 = CTranslate2 default
+LOCAL_MAX_SECONDS = float(os.environ.get("BOT_STT_LOCAL_MAX_SECONDS", "30"))
+MAX_VOICE_SECONDS = int(os.environ.get("BOT_VOICE_MAX_SECONDS", "300"))
+
+class VoiceRejected(ValueError):
+    """The voice note is too big or too long to transcribe."""
+
+def _too_long(seconds):
+    return VoiceRejected(f"Voice note is {int(seconds)}s long, the limit is {MAX_VOICE_SECONDS}s.")
+
+# Containers Whisper accepts as-is; anything else is transcoded with pydub
+WHISPER_MIME_TYPES = {
+    "audio/ogg": "ogg", "audio/oga": "oga", "audio/opus": "ogg",
+    "audio/mpeg": "mp3", "audio/mp3": "mp3", "audio/mp4": "m4a", "audio/m4a": "m4a",
+    "audio/x-m4a": "m4a", "audio/wav": "wav", "audio/x-wav": "wav",
+    "audio/webm": "webm", "audio/flac": "flac", "video/mp4": "mp4",
+}
+
+def _transcode(data):
+    """Convert unsupported audio to 16 kHz mono WAV in memory (needs ffmpeg)."""
+    from pydub import AudioSegment
+
+    segment = AudioSegment.from_file(BytesIO(data))
+    # Telegram's duration is client-supplied; the decoded length is what counts
+    if len(segment) > MAX_VOICE_SECONDS * 1000:
+        raise _too_long(len(segment) / 1000)
+    out = BytesIO()
+    segment.set_channels(1).set_frame_rate(16000).export(out, format="wav")
+    return out.getvalue()
+
+def _opus_seconds(data):
+    """Length of an Ogg/Opus stream from its page granule positions, or None.
+
+    Lets notes that go to the API undecoded still be held to the duration cap
+    without ffmpeg. Opus granules count 48 kHz samples.
+    """
+    if not data.startswith(b"OggS") or b"OpusHead" not in data[:512]:
+        return None
+    # Walk the pages: 27-byte header, segment table, then the lacing-sized body
+    granule, position = 0, 0
+    while position + 27 <= len(data) and data[position:position + 4] == b"OggS":
+        granule = max(granule, int.from_bytes(data[position + 6:position + 14], "little", signed=True))
+        segments = data[position + 26]
+        table = data[position + 27:position + 27 + segments]
+        position += 27 + segments + sum(table)
+    return granule / 48000
+
+class STTBackend(ABC):
+    """Interface for speech-to-text engines."""
+
+    name = "base"
+
+    @abstractmethod
+    async def transcribe(self, data, mime_type=None):
+        """Return the transcript of an in-memory audio payload."""
+
+    async def warm_up(self):
+        """Load models ahead of the first request."""
+
+    async def close(self):
+        pass
+
+class OpenAIWhisperBackend(STTBackend):
+    """Hosted Whisper through the shared AsyncOpenAI client."""
+
+    name = "openai"
+
+    def __init__(self, model=OPENAI_STT_MODEL):
+        self.model = model
+
+    async def transcribe(self, data, mime_type=None):
+        client = get_openai_client()
+        if client is None:
+            raise ValueError("OPENAI_API_KEY not set")
+
+        extension = WHISPER_MIME_TYPES.get((mime_type or "").lower())
+        if extension is not None:
+            seconds = _opus_seconds(data)
+            if seconds is not None and seconds > MAX_VOICE_SECONDS:
+                raise _too_long(seconds)
+        else:
+            # pydub/ffmpeg are blocking; keep them off the event loop
+            data = await asyncio.to_thread(_transcode, data)
+            extension = "wav"
+
+        async with limit("whisper"):
+            transcript = await client.audio.transcriptions.create(
+                model=self.model,
+                file=(f"voice.{extension}", data)
+            )
+        return transcript.text
+
+# Per-process model for LocalWhisperBackend workers
+_worker_model = None
+
+def _load_worker_model(model_name, compute_type, cpu_threads):
+    global _worker_model
+    if _worker_model is None:
+        from faster_whisper import WhisperModel
+        _worker_model = WhisperModel(model_name, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+    return _worker_model
+
+def _worker_warm_up(model_name, compute_type, cpu_threads):
+    started = time.perf_counter()
+    _load_worker_model(model_name, compute_type, cpu_threads)
+    return os.getpid(), time.perf_counter() - started
+
+def _worker_transcribe(data, model_name, compute_type, cpu_threads):
+    model = _load_worker_model(model_name, compute_type, cpu_threads)
+    # faster-whisper decodes OGG/Opus and friends itself through PyAV; segments
+    # are lazy, so the decoded length is known before any transcription runs
+    segments, info = model.transcribe(BytesIO(data), beam_size=1, vad_filter=True)
+    if info.duration > MAX_VOICE_SECONDS:
+        raise _too_long(info.duration)
+    return " ".join(segment.text.strip() for segment in segments).strip()
+
+class LocalWhisperBackend(STTBackend):
+    """faster-whisper on CPU in a process pool."""
+
+    name = "local"
+
+    def __init__(self, model=LOCAL_MODEL, compute_type=LOCAL_COMPUTE_TYPE, workers=LOCAL_WORKERS, cpu_threads=LOCAL_THREADS):
+        self.model = model
+        self.compute_type = compute_type
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self._pool = None
+        # Queue at most one note per worker; the rest wait here, not in the pool
+        self._slots = asyncio.Semaphore(workers)
+
+    @staticmethod
+    def available():
+        try:
+            import faster_whisper  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _args(self):
+        return self.model, self.compute_type, self.cpu_threads
+
+    async def warm_up(self):
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(pool, _worker_warm_up, *self._args()) for _ in range(self.workers)
+        ))
+        for pid, seconds in results:
+            logger.info(f"STT worker {pid} loaded {self.model} ({self.compute_type}) in {seconds:.1f}s")
+
+    async def transcribe(self, data, mime_type=None):
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            return await loop.run_in_executor(self._executor(), _worker_transcribe, bytes(data), *self._args())
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+class STTRouter:
+    """Routes each note to a backend by duration; falls back to remote if local fails."""
+
+    def __init__(self, remote, local=None, local_max_seconds=LOCAL_MAX_SECONDS):
+        self.remote = remote
+        self.local = local
+        self.local_max_seconds = local_max_seconds
+        self.stats = {}
+
+    def pick(self, duration=None):
+        if self.local is None:
+            return self.remote
+        if self.remote is None or (duration is not None and duration <= self.local_max_seconds):
+            return self.local
+        return self.remote
+
+    def _record(self, backend, seconds, error=False):
+        stats = self.stats.setdefault(backend.name, {"calls": 0, "errors": 0, "latency_total": 0.0})
+        stats["calls"] += 1
+        stats["latency_total"] += seconds
+        if error:
+            stats["errors"] += 1
+
+    async def transcribe(self, data, mime_type=None, duration=None):
+        backend = self.pick(duration)
+        started = time.perf_counter()
+        try:
+            async with span("stt", backend.name):
+                text = await backend.transcribe(data, mime_type)
+        except Exception as e:
+            self._record(backend, time.perf_counter() - started, error=True)
+            if isinstance(e, VoiceRejected) or backend is not self.local or self.remote is None:
+                raise
+            logger.warning(f"Local transcription failed, falling back to {self.remote.name}: {e}")
+            backend, started = self.remote, time.perf_counter()
+            async with span("stt", backend.name):
+                text = await backend.transcribe(data, mime_type)
+        self._record(backend, time.perf_counter() - started)
+        return text
+
+    async def warm_up(self):
+        if self.local is not None:
+            await self.local.warm_up()
+
+    async def close(self):
+        for backend in (self.local, self.remote):
+            if backend is not None:
+                await backend.close()
+
+    def snapshot(self):
+        return {
+            name: {**stats, "avg_latency": stats["latency_total"] / stats["calls"] if stats["calls"] else 0.0}
+            for name, stats in self.stats.items()
+        }
+
+def build_router(mode=STT_BACKEND):
+    if mode == "openai":
+        return STTRouter(OpenAIWhisperBackend())
+    if mode not in ("local", "auto"):
+        raise ValueError(f"Unknown BOT_STT_BACKEND: {mode}")
+    if not LocalWhisperBackend.available():
+        logger.warning("faster-whisper is not installed, using the OpenAI STT backend")
+        return STTRouter(OpenAIWhisperBackend())
+    remote = OpenAIWhisperBackend() if mode == "auto" else None
+    return STTRouter(remote, LocalWhisperBackend())
+
+_router = None
+
+def get_stt_router():
+    global _router
+    if _router is None:
+        _router = build_router()
+    return _router
+
+def get_stt_stats():
+    return get_stt_router().snapshot()
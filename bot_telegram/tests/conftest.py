@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The bot's modules import each other by bare name from bot_telegram/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# async_db reads these at import; no test talks to Supabase
+for name, value in (("SUPABASE_URL", "http://localhost:54321"), ("SUPABASE_SERVICE_ROLE_KEY", "test-key")):
+    if not os.environ.get(name):
+        os.environ[name] = value
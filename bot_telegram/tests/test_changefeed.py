@@ -0,0 +1,80 @@
+import pytest
+from changefeed import RowStore, can_serve, scope_key
+
+@pytest.fixture
+def store():
+    store = RowStore("contacts", "u", None)
+    for row in [
+        {"id": 1, "user_id": "u", "workflow_id": None, "name": "Ann", "company": "Acme", "email": None, "score": 5, "vip": True},
+        {"id": 2, "user_id": "u", "workflow_id": None, "name": "bob", "company": None, "email": "b@x.com", "score": 3, "vip": False},
+        {"id": 3, "user_id": "u", "workflow_id": None, "name": "Cy", "company": "acme labs", "email": None, "score": None, "vip": False},
+        {"id": 4, "user_id": "u", "workflow_id": None, "name": "Dee", "company": "Zed", "email": None, "score": 5, "vip": False},
+    ]:
+        store.apply("insert", row)
+    return store
+
+def ids(rows):
+    return [row["id"] for row in rows]
+
+def test_scope_matches_the_list_query_filter():
+    personal, workflow = RowStore("tasks", "u", None), RowStore("tasks", None, "w")
+    assert personal.matches({"user_id": "u", "workflow_id": None})
+    assert not personal.matches({"user_id": "u", "workflow_id": "w"})
+    assert not personal.matches({"user_id": "v", "workflow_id": None})
+    assert workflow.matches({"user_id": "v", "workflow_id": "w"})
+    assert scope_key("u", "None") == ("u", None)
+
+def test_apply_moves_rows_out_of_scope_and_deletes(store):
+    store.apply("update", {"id": 2, "user_id": "u", "workflow_id": "w", "name": "bob"})
+    store.apply("delete", {"id": 3})
+    assert sorted(store.rows) == [1, 4]
+
+@pytest.mark.parametrize("filters, expected", [
+    ([("score", "eq", "5")], [1, 4]),
+    ([("score", "gte", 4)], [1, 4]),
+    ([("score", "neq", 5)], [2]),                  # NULL satisfies no comparison
+    ([("email", "is", "null")], [1, 3, 4]),
+    ([("vip", "is", "true")], [1]),
+    ([("vip", "eq", "false")], [2, 3, 4]),
+    ([("id", "in", ["2", "4"])], [2, 4]),
+    ([("company", "ilike", "ACME%")], [1, 3]),
+    ([("company", "like", "acme%")], [3]),
+    ([("score", "eq", 5), ("company", "neq", "Zed")], [1]),
+])
+def test_filters_follow_postgrest_semantics(store, filters, expected):
+    assert ids(store.query(filters=filters, order_by="id")) == expected
+
+def test_search_is_case_insensitive_over_search_columns(store):
+    assert ids(store.query(search="ACME", order_by="id")) == [1, 3]
+    assert ids(store.query(search="x.com")) == [2]
+
+def test_nulls_sort_last_ascending_and_first_descending(store):
+    assert ids(store.query(order_by="score")) == [2, 1, 4, 3]
+    assert ids(store.query(order_by="score", descending=True))[0] == 3
+
+def test_pages_break_ties_on_id(store):
+    # 1 and 4 share a score; the id tiebreaker keeps pages stable
+    first = store.query(order_by="score", descending=True, limit=2, offset=1)
+    second = store.query(order_by="score", descending=True, limit=2, offset=3)
+    assert ids(first) == [1, 4]
+    assert ids(second) == [2]
+
+def test_keyset_after_cursor(store):
+    assert ids(store.query(order_by="id", after=2)) == [3, 4]
+    assert ids(store.query(order_by="id", descending=True, after=3)) == [2, 1]
+
+def test_projection_returns_copies(store):
+    rows = store.query(columns="id, name", order_by="id", limit=1)
+    assert rows == [{"id": 1, "name": "Ann"}]
+    full = store.query(order_by="id", limit=1)[0]
+    full["name"] = "changed"
+    assert store.rows[1]["name"] == "Ann"
+
+@pytest.mark.parametrize("options, servable", [
+    ({}, True),
+    ({"columns": "id,name", "filters": [("score", "gt", 1)]}, True),
+    ({"columns": "*, workflows(name)"}, False),
+    ({"filters": [("name", "fts", "x")]}, False),
+])
+def test_can_serve(options, servable):
+    assert can_serve(options) is servable
@@ -0,0 +1,58 @@
+import os
+import asyncio
+import zipfile
+import pytest
+import exporter
+from exporter import export_table, ExportTooLarge
+
+@pytest.fixture
+def table(monkeypatch):
+    """iter_rows stand-in; set rows (a list or a generator) and read pulled."""
+    source = {"rows": [], "pulled": 0}
+
+    async def iter_rows(table, user_id=None, workflow_id=None, page_size=None):
+        for row in source["rows"]:
+            source["pulled"] += 1
+            yield row
+
+    monkeypatch.setattr(exporter, "iter_rows", iter_rows)
+    return source
+
+def test_export_writes_csv_without_owner_columns(table):
+    table["rows"] = [{"id": i, "name": f"n,{i}", "user_id": "u", "workflow_id": None} for i in range(3)]
+    spool, name, count = asyncio.run(export_table("contacts"))
+    with spool:
+        data = spool.read()
+    assert name.startswith("contacts-") and name.endswith(".csv")
+    assert count == 3
+    assert data.decode("utf-8-sig").splitlines() == ["id,name", '0,"n,0"', '1,"n,1"', '2,"n,2"']
+
+def test_export_zip_holds_the_same_csv(table):
+    table["rows"] = [{"id": 1, "title": "Deal"}]
+    spool, name, count = asyncio.run(export_table("deals", compress=True))
+    with spool, zipfile.ZipFile(spool) as archive:
+        (member,) = archive.namelist()
+        assert name == member + ".zip"
+        assert archive.read(member).decode("utf-8-sig").splitlines() == ["id,title", "1,Deal"]
+
+def test_unknown_tables_are_refused(table):
+    with pytest.raises(ValueError):
+        asyncio.run(export_table("users"))
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_oversized_exports_stop_early(table, monkeypatch, compress):
+    monkeypatch.setattr(exporter, "EXPORT_MAX_BYTES", 64 * 1024)
+
+    def endless():
+        i = 0
+        while True:
+            i += 1
+            # Random hex, so deflate can at most halve it
+            yield {"id": i, "blob": os.urandom(100).hex()}
+
+    table["rows"] = endless()
+    with pytest.raises(ExportTooLarge):
+        asyncio.run(export_table("contacts", compress=compress))
+    # The table is endless, so raising at all means it stopped early; rows
+    # are ~200 bytes (~100 deflated), so it also stopped near the limit
+    assert table["pulled"] < 3 * 64 * 1024 // 200
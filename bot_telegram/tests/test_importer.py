@@ -0,0 +1,131 @@
+import asyncio
+import pytest
+import importer
+from importer import (
+    parse_csv, parse_vcard, parser_for, import_contacts, redact_token,
+    ImportAborted, ImportTooLarge, _clean,
+)
+
+async def lines_of(text):
+    for line in text.split("\n"):
+        yield line
+
+async def collect(records):
+    return [record async for record in records]
+
+def parse(parser, text):
+    return asyncio.run(collect(parser(lines_of(text))))
+
+def test_parse_csv_maps_header_aliases_and_quoted_newlines():
+    text = 'Full Name,E-mail,Organization,Notes\nAnn Lee,ann@x.com,"Acme, Inc","two\nlines"\nBob,,Foo,'
+    assert parse(parse_csv, text) == [
+        {"name": "Ann Lee", "email": "ann@x.com", "company": "Acme, Inc"},
+        {"name": "Bob", "email": "", "company": "Foo"},
+    ]
+
+def test_parse_csv_joins_first_and_last_name():
+    records = parse(parse_csv, "First Name,Last Name\nAnn,Lee\n,Solo")
+    assert [r["name"] for r in records] == ["Ann Lee", "Solo"]
+
+def test_parse_vcard_reads_folded_lines_and_fallbacks():
+    text = (
+        "BEGIN:VCARD\nVERSION:3.0\nN:Doe;John;;;\nFN:John\n  Doe\nORG:Big Co;Sales\n"
+        "EMAIL;TYPE=work:j@d.com\nitem1.TEL;TYPE=CELL:tel:+1 555\nEND:VCARD\n"
+        "BEGIN:VCARD\nN:Smith;Jane\nEND:VCARD"
+    )
+    assert parse(parse_vcard, text) == [
+        {"name": "John Doe", "company": "Big Co", "email": "j@d.com", "phone": "+1 555"},
+        {"name": "Jane Smith"},
+    ]
+
+def test_clean_falls_back_to_the_email_local_part():
+    assert _clean({"email": " ann@x.com ", "notes": "x"}) == {
+        "name": "ann", "company": None, "role": None, "email": "ann@x.com", "phone": None,
+    }
+    assert _clean({"company": "Acme"}) is None
+
+@pytest.mark.parametrize("name, mime, parser", [
+    ("people.csv", None, parse_csv),
+    ("export", "text/csv", parse_csv),
+    ("card.VCF", None, parse_vcard),
+    ("x", "text/x-vcard", parse_vcard),
+    ("notes.txt", "text/plain", None),
+])
+def test_parser_for(name, mime, parser):
+    assert parser_for(name, mime) is parser
+
+def test_redact_token_masks_file_urls():
+    message = "Client error '404' for url 'https://api.telegram.org/file/bot123:AA-bb_cc/documents/file_1.csv'"
+    redacted = redact_token(message)
+    assert "123:AA-bb_cc" not in redacted
+    assert "/file/bot<token>/documents/file_1.csv" in redacted
+
+@pytest.fixture
+def database(monkeypatch):
+    """Existing contacts plus a record of inserted chunks."""
+    existing = [{"id": 1, "email": "Bob@X.com", "phone": None}, {"id": 2, "email": None, "phone": "+1 (555) 123"}]
+    inserted = []
+
+    async def iter_rows(table, user_id=None, workflow_id=None, **options):
+        for row in existing:
+            yield row
+
+    async def add_contacts(rows, user_id=None, workflow_id=None):
+        await asyncio.sleep(0.01)
+        inserted.append(rows)
+
+    monkeypatch.setattr(importer, "iter_rows", iter_rows)
+    monkeypatch.setattr(importer, "add_contacts", add_contacts)
+    monkeypatch.setattr(importer, "IMPORT_CHUNK_SIZE", 2)
+    return inserted
+
+async def records_of(*records, error=None):
+    for record in records:
+        yield record
+    if error is not None:
+        raise error
+
+def test_import_skips_duplicates_against_the_database_and_the_file(database):
+    records = records_of(
+        {"name": "A", "email": "a@x.com"},
+        {"name": "Bob", "email": "bob@x.com"},        # in the database
+        {"name": "C", "phone": "555-123"},            # different digits: 555123 vs 1555123
+        {"name": "D", "phone": "+1 555 123"},         # in the database
+        {"name": "A again", "email": "A@x.com"},      # earlier in the file
+        {"email": ""},                                # no name
+        {"name": "E"},
+    )
+    stats = asyncio.run(import_contacts(records))
+    assert (stats.read, stats.imported, stats.duplicates, stats.invalid) == (7, 3, 3, 1)
+    assert [len(chunk) for chunk in database] == [2, 1]
+    assert [c["name"] for chunk in database for c in chunk] == ["A", "C", "E"]
+
+def test_failed_chunks_are_counted(database, monkeypatch):
+    async def add_contacts(rows, user_id=None, workflow_id=None):
+        raise RuntimeError("insert failed")
+    monkeypatch.setattr(importer, "add_contacts", add_contacts)
+
+    stats = asyncio.run(import_contacts(records_of({"name": "A"}, {"name": "B"}, {"name": "C"})))
+    assert (stats.imported, stats.failed) == (0, 3)
+    assert stats.summary().endswith(", 3 failed")
+
+def test_read_failure_settles_sent_chunks_and_reports_partial_stats(database):
+    records = records_of(
+        *({"name": f"n{i}"} for i in range(5)),
+        error=ImportTooLarge("the file is larger than 20 MB"),
+    )
+    with pytest.raises(ImportAborted) as raised:
+        asyncio.run(import_contacts(records))
+    # Both full chunks finished inserting before the error surfaced; the
+    # unsent partial chunk was dropped
+    assert str(raised.value) == "the file is larger than 20 MB"
+    assert raised.value.stats.read == 5
+    assert raised.value.stats.imported == 4
+    assert [len(chunk) for chunk in database] == [2, 2]
+
+def test_unexpected_read_errors_get_a_generic_message(database):
+    records = records_of({"name": "A"}, error=RuntimeError("https://api.telegram.org/file/bot1:secret/x"))
+    with pytest.raises(ImportAborted) as raised:
+        asyncio.run(import_contacts(records))
+    assert str(raised.value) == "couldn't read the file"
+    assert "secret" not in str(raised.value)
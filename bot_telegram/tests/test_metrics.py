@@ -0,0 +1,52 @@
+import stt
+import metrics
+import tracing
+from tracing import Histogram, span, trace_update
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("t_seconds", "Test.", ("kind",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, 'db "x"')
+    assert histogram.render().splitlines() == [
+        "# HELP t_seconds Test.",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{kind="db \\"x\\"",le="0.1"} 1',
+        't_seconds_bucket{kind="db \\"x\\"",le="1"} 3',
+        't_seconds_bucket{kind="db \\"x\\"",le="+Inf"} 4',
+        't_seconds_sum{kind="db \\"x\\""} 4.05',
+        't_seconds_count{kind="db \\"x\\""} 4',
+    ]
+
+def test_spans_report_into_the_current_update_trace(monkeypatch):
+    monkeypatch.setattr(tracing, "SPAN_SECONDS", Histogram("s", "", ("kind", "name")))
+    update = type("Update", (), {"update_id": 1, "callback_query": None, "effective_message": None})()
+    with trace_update(update, queued=0.25) as trace:
+        with span("db", "tasks"):
+            pass
+        with span("db", "contacts"):
+            pass
+    assert trace.type == "other"
+    assert trace.stages["queue"] == [0.25, 1]
+    assert trace.stages["db"][1] == 2
+    assert set(tracing.SPAN_SECONDS.series) == {("db", "tasks"), ("db", "contacts")}
+
+def test_collect_flattens_nested_and_labelled_stats():
+    samples = {}
+    metrics._collect(samples, "bot_updates", {"pending": 2, "busy": True, "name": "x", "wait": {"max": 1.5}})
+    metrics._collect(samples, "bot_cache", {"users": {"hits": 3}, "queries": {"hits": 4}}, "cache")
+    assert samples == {
+        "bot_updates_pending": [(None, 2)],
+        "bot_updates_busy": [(None, 1)],
+        "bot_updates_wait_max": [(None, 1.5)],
+        "bot_cache_hits": [(("cache", "users"), 3), (("cache", "queries"), 4)],
+    }
+
+def test_a_failing_source_does_not_fail_the_scrape(monkeypatch):
+    def broken():
+        raise ValueError("Unknown BOT_STT_BACKEND: bogus")
+    monkeypatch.setattr(stt, "get_stt_stats", broken)
+
+    text = metrics.render_metrics()
+    assert "bot_stt_" not in text
+    assert 'bot_cache_hits{cache="queries"}' in text
+    assert "bot_transcript_cache_misses" in text
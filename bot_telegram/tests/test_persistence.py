@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from persistence import UserDataPersistence, SQLiteStore
+
+class CountingStore(SQLiteStore):
+    def __init__(self, path):
+        super().__init__(path)
+        self.loads = 0
+
+    async def load(self, telegram_id, newer_than=None):
+        self.loads += 1
+        return await super().load(telegram_id, newer_than)
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "state.sqlite3")
+
+def test_user_data_is_loaded_once_per_user(path):
+    async def main():
+        writer = UserDataPersistence(SQLiteStore(path))
+        await writer.update_user_data(1, {"workflow_id": "w"})
+        await writer.flush()
+
+        store = CountingStore(path)
+        reader = UserDataPersistence(store)
+        user_data = {"history": ["set before the first load"]}
+        for _ in range(3):
+            await reader.refresh_user_data(1, user_data)
+        # Nothing stored for user 2 is remembered too
+        for _ in range(2):
+            await reader.refresh_user_data(2, {})
+        return store.loads, user_data
+
+    loads, user_data = asyncio.run(main())
+    assert loads == 2
+    assert user_data == {"history": ["set before the first load"], "workflow_id": "w"}
+
+def test_recheck_picks_up_newer_rows_from_other_processes(path):
+    async def main():
+        first = UserDataPersistence(SQLiteStore(path), recheck=True)
+        second = UserDataPersistence(SQLiteStore(path), recheck=True)
+        mine, theirs = {}, {}
+        await first.refresh_user_data(1, mine)
+        await second.refresh_user_data(1, theirs)
+
+        theirs["pending_action"] = "delete_task"
+        await second.update_user_data(1, theirs)
+        await second.flush()
+        await first.refresh_user_data(1, mine)
+        return mine
+
+    assert asyncio.run(main()) == {"pending_action": "delete_task"}
+
+def test_recheck_keeps_an_unflushed_local_write(path):
+    async def main():
+        first = UserDataPersistence(SQLiteStore(path), recheck=True)
+        second = UserDataPersistence(SQLiteStore(path), recheck=True)
+        mine, theirs = {}, {}
+        await first.refresh_user_data(1, mine)
+        await second.refresh_user_data(1, theirs)
+
+        theirs["pending_action"] = "theirs"
+        await second.update_user_data(1, theirs)
+        await second.flush()
+
+        mine["pending_action"] = "mine"
+        first._dirty[1] = dict(mine)  # written this round, not flushed yet
+        await first.refresh_user_data(1, mine)
+        assert mine == {"pending_action": "mine"}
+        await first.flush()
+        return await SQLiteStore(path).load(1)
+
+    data, _ = asyncio.run(main())
+    assert data == {"pending_action": "mine"}
+
+def test_without_recheck_other_processes_writes_are_not_read(path):
+    async def main():
+        first = UserDataPersistence(SQLiteStore(path))
+        second = UserDataPersistence(SQLiteStore(path))
+        mine = {}
+        await first.refresh_user_data(1, mine)
+        await second.update_user_data(1, {"pending_action": "theirs"})
+        await second.flush()
+        await first.refresh_user_data(1, mine)
+        return mine
+
+    assert asyncio.run(main()) == {}
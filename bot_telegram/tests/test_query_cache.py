@@ -0,0 +1,120 @@
+import asyncio
+import pytest
+import async_db
+from cache import TTLCache
+from async_db import _list, invalidate_rows
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("cache.time.monotonic", lambda: clock[0])
+    cache = TTLCache(maxsize=4, ttl=10)
+    cache.set("a", 1)
+    clock[0] += 11
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses, len(cache)) == (0, 1, 0)
+
+def test_ttl_cache_bounds_total_weight():
+    cache = TTLCache(maxsize=10, ttl=60, max_weight=10, weigher=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    cache.set("c", "xxxx")
+    assert "a" not in cache and cache.weight == 8
+    # Larger than the whole budget: not cached, nothing else evicted
+    cache.set("d", "x" * 11)
+    assert "d" not in cache and len(cache) == 2
+
+def test_ttl_cache_discard_where_and_items():
+    cache = TTLCache(maxsize=10, ttl=60)
+    for key in ("t1", "t2", "u1"):
+        cache.set(key, key.upper())
+    cache.discard_where(lambda key, _: key.startswith("t"))
+    assert cache.items() == [("u1", "U1")]
+
+@pytest.fixture
+def database(monkeypatch):
+    """async_db._query stand-in; each user's fetch waits on its own gate."""
+    state = {"calls": [], "gates": {}}
+
+    async def query(table, user_id=None, workflow_id=None, **options):
+        state["calls"].append((table, user_id, workflow_id))
+        gate = state["gates"].get(user_id)
+        if gate is not None:
+            await gate.wait()
+        return [{"id": len(state["calls"]), "user_id": user_id, "workflow_id": workflow_id}]
+
+    monkeypatch.setattr(async_db, "_query", query)
+    monkeypatch.setattr(async_db, "_list_reader", None)
+    monkeypatch.setattr(async_db, "QUERY_CACHE_TTL", 60)
+    monkeypatch.setattr(async_db, "_query_cache", TTLCache(maxsize=64, ttl=60))
+    monkeypatch.setattr(async_db, "_query_flights", {})
+    monkeypatch.setattr(async_db, "_query_generations", {})
+    return state
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_concurrent_misses_share_one_query(database):
+    async def main():
+        database["gates"]["u"] = gate = asyncio.Event()
+        first = asyncio.create_task(_list("tasks", "u"))
+        second = asyncio.create_task(_list("tasks", "u"))
+        await settle()
+        # A cancelled caller must not cancel the shared fetch
+        first.cancel()
+        gate.set()
+        rows = await second
+        assert await _list("tasks", "u") == rows
+        # Callers get copies, never the cached rows
+        rows[0]["title"] = "edited"
+        assert "title" not in (await _list("tasks", "u"))[0]
+
+    asyncio.run(main())
+    assert database["calls"] == [("tasks", "u", None)]
+
+def test_writes_drop_only_the_scopes_they_touch(database):
+    async def main():
+        for user_id in ("u", "v"):
+            await _list("tasks", user_id)
+        await _list("tasks", None, "w")
+        invalidate_rows("tasks", [{"id": 9, "user_id": "u", "workflow_id": None}])
+        for user_id in ("u", "v"):
+            await _list("tasks", user_id)
+        await _list("tasks", None, "w")
+        # Rows without owner columns drop every scope of the table
+        invalidate_rows("tasks", [{"id": 9}])
+        await _list("tasks", "v")
+
+    asyncio.run(main())
+    assert [call[1:] for call in database["calls"]] == [
+        ("u", None), ("v", None), (None, "w"),
+        ("u", None),
+        ("v", None),
+    ]
+
+def test_a_write_mid_fetch_keeps_only_that_scope_uncached(database):
+    async def main():
+        gates = database["gates"]
+        gates["u"], gates["v"] = asyncio.Event(), asyncio.Event()
+        fetches = [asyncio.create_task(_list("tasks", user_id)) for user_id in ("u", "v")]
+        await settle()
+        invalidate_rows("tasks", [{"id": 9, "user_id": "u", "workflow_id": None}])
+        gates["u"].set()
+        gates["v"].set()
+        await asyncio.gather(*fetches)
+        assert async_db._query_generations == {}
+        await _list("tasks", "u")
+        await _list("tasks", "v")
+
+    asyncio.run(main())
+    # u's result may predate the write so it was refetched; v's was cached
+    assert [call[1] for call in database["calls"]] == ["u", "v", "u"]
@@ -0,0 +1,139 @@
+import asyncio
+import datetime
+import pytest
+import reminders
+from reminders import ReminderEngine, Reminder, due_at, render, _chunks
+
+UTC = datetime.timezone.utc
+
+def test_due_at_converts_local_wall_clock_to_utc():
+    row = {"due_date": "2026-01-15", "reminder_time": "09:30:00"}
+    assert due_at("tasks", row, "Europe/Berlin") == datetime.datetime(2026, 1, 15, 8, 30, tzinfo=UTC)
+    # No reminder time means the 09:00 default; unknown zones fall back to UTC
+    assert due_at("tasks", {"due_date": "2026-01-15"}, "Nowhere/Else") == datetime.datetime(2026, 1, 15, 9, tzinfo=UTC)
+
+def test_due_at_reads_debt_timestamps_and_rejects_incomplete_rows():
+    assert due_at("debts", {"reminder_date": "2026-01-15T10:00:00+02:00"}) == datetime.datetime(2026, 1, 15, 8, tzinfo=UTC)
+    assert due_at("calendar_events", {"date": "2026-01-15", "time": None}) is None
+    assert due_at("deals", {"reminder_date": "not a date"}) is None
+
+def test_render_keeps_the_cron_wording():
+    assert render("tasks", {"title": "Ship", "reminder_time": "14:05:00"}) == ("✅ Ship", "Due Today at 14:05", "clipboard")
+    title, message, _ = render("debts", {"borrower_name": "Ann", "amount_lent": 20, "description": None})
+    assert (title, message) == ("💰 Debt Reminder: Ann", "Ann owes you 20")
+
+def test_chunks_pack_blocks_under_the_limit():
+    blocks = ["a" * 30, "b" * 30, "c" * 30, "d" * 100]
+    assert list(_chunks(blocks, limit=64)) == [["a" * 30, "b" * 30], ["c" * 30], ["d" * 100]]
+    assert list(_chunks([], limit=64)) == []
+
+class FakeJobQueue:
+    def __init__(self):
+        self.wakes = []
+
+    def run_once(self, callback, when, name=None):
+        self.wakes.append(when)
+        return type("Job", (), {"schedule_removal": lambda self: None})()
+
+class FakeBot:
+    def __init__(self, fail_after=None):
+        self.sent = []
+        self.fail_after = fail_after
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        if self.fail_after is not None and len(self.sent) >= self.fail_after:
+            raise RuntimeError("Too Many Requests")
+        self.sent.append((chat_id, text))
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Recipients, claims and releases of a fake database."""
+    state = {
+        "users": {"u": {"timezone": "UTC", "telegram_chat_id": 42}, "v": {"timezone": "UTC"}},
+        "rows": {}, "released": [],
+    }
+
+    async def get_reminder_recipients(user_ids, workflow_ids=()):
+        return {u: state["users"][u] for u in user_ids if u in state["users"]}, {}
+
+    async def claim_reminders(table, ids):
+        return list(ids)
+
+    async def release_reminders(table, ids):
+        state["released"].extend(ids)
+
+    async def iter_rows(table, columns="*", filters=None, **options):
+        for row in state["rows"].get(table, []):
+            yield row
+
+    monkeypatch.setattr(reminders, "get_reminder_recipients", get_reminder_recipients)
+    monkeypatch.setattr(reminders, "claim_reminders", claim_reminders)
+    monkeypatch.setattr(reminders, "release_reminders", release_reminders)
+    monkeypatch.setattr(reminders, "iter_rows", iter_rows)
+    monkeypatch.setattr(reminders, "REMINDER_NTFY", False)
+    return state
+
+def engine(bot=None):
+    application = type("Application", (), {"job_queue": FakeJobQueue(), "bot": bot or FakeBot()})()
+    return ReminderEngine(application)
+
+def task_row(row_id, user_id, due):
+    return {"id": row_id, "user_id": user_id, "workflow_id": None, "title": row_id,
+            "due_date": due.date().isoformat(), "reminder_time": due.strftime("%H:%M:%S")}
+
+def test_load_keeps_the_grace_and_horizon_window(backend):
+    now = datetime.datetime.now(UTC).replace(second=0, microsecond=0)
+    backend["rows"]["tasks"] = [
+        task_row("too-old", "u", now - datetime.timedelta(days=3)),
+        task_row("overdue", "u", now - datetime.timedelta(hours=2)),
+        task_row("soon", "u", now + datetime.timedelta(minutes=30)),
+        task_row("later", "u", now + datetime.timedelta(hours=5)),
+    ]
+    reminder_engine = engine()
+    asyncio.run(reminder_engine.load())
+    assert sorted(row_id for _, row_id in reminder_engine.items) == ["overdue", "soon"]
+
+def test_a_failed_chunk_only_releases_its_own_reminders(backend, monkeypatch):
+    monkeypatch.setattr(reminders._chunks, "__defaults__", (60,))
+    bot = FakeBot(fail_after=1)
+    reminder_engine = engine(bot)
+    now = datetime.datetime.now(UTC)
+    batch = [Reminder("tasks", {"id": f"t{i}", "user_id": "u", "title": "x" * 30}, now) for i in range(3)]
+
+    asyncio.run(reminder_engine.deliver(batch))
+    assert len(bot.sent) == 1
+    assert sorted(backend["released"]) == ["t1", "t2"]
+    assert (reminder_engine.stats["delivered"], reminder_engine.stats["failed"]) == (1, 2)
+
+def test_undeliverable_reminders_are_not_requeued_until_a_target_appears(backend):
+    now = datetime.datetime.now(UTC).replace(second=0, microsecond=0)
+    row = task_row("nobody", "v", now)
+    backend["rows"]["tasks"] = [row]
+    reminder_engine = engine()
+
+    asyncio.run(reminder_engine.deliver([Reminder("tasks", row, due_at("tasks", row))]))
+    assert reminder_engine.stats["undeliverable"] == 1
+    assert backend["released"] == []
+
+    asyncio.run(reminder_engine.load())
+    assert reminder_engine.items == {}
+    assert reminder_engine.stats["undeliverable"] == 1
+
+    # The user links a chat: the next refresh queues it again
+    backend["users"]["v"]["telegram_chat_id"] = 7
+    asyncio.run(reminder_engine.load())
+    assert list(reminder_engine.items) == [("tasks", "nobody")]
+    assert reminder_engine.undeliverable == {}
+
+def test_writes_schedule_and_drop_reminders(backend):
+    reminder_engine = engine()
+    reminder_engine.timezones = {"u": "UTC"}
+    soon = datetime.datetime.now(UTC) + datetime.timedelta(minutes=10)
+    row = task_row("t", "u", soon)
+
+    reminder_engine._on_write("tasks", "insert", [row])
+    assert ("tasks", "t") in reminder_engine.items
+    assert reminder_engine.application.job_queue.wakes
+
+    reminder_engine._on_write("tasks", "update", [{**row, "reminder_sent": True}])
+    assert reminder_engine.items == {}
@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+from scheduler import UpdateScheduler
+
+def update(user_id, update_id=0):
+    user = SimpleNamespace(id=user_id)
+    return SimpleNamespace(update_id=update_id, effective_user=user, effective_chat=None,
+                           callback_query=None, effective_message=None)
+
+def test_updates_run_in_order_per_user_within_the_concurrency_limit():
+    async def main():
+        scheduler = UpdateScheduler(max_concurrent_updates=2)
+        order, peak = [], [0]
+
+        async def handle(user_id, n):
+            peak[0] = max(peak[0], scheduler.current_concurrent_updates)
+            await asyncio.sleep(0.01 * (3 - n))
+            order.append((user_id, n))
+
+        await asyncio.gather(*(
+            scheduler.process_update(update(user_id, n), handle(user_id, n))
+            for n in range(3) for user_id in (1, 2, 3)
+        ))
+        return scheduler, order, peak[0]
+
+    scheduler, order, peak = asyncio.run(main())
+    for user_id in (1, 2, 3):
+        assert [n for uid, n in order if uid == user_id] == [0, 1, 2]
+    assert peak == 2
+    assert scheduler.snapshot()["pending"] == 0 and scheduler._user_queues == {}
+
+def test_a_users_backlog_beyond_the_limit_is_shed():
+    async def main():
+        scheduler = UpdateScheduler(max_concurrent_updates=4, max_user_backlog=2)
+        gate = asyncio.Event()
+        ran = []
+
+        async def handle(n):
+            await gate.wait()
+            ran.append(n)
+
+        tasks = [asyncio.create_task(scheduler.process_update(update(1, n), handle(n))) for n in range(2)]
+        await asyncio.sleep(0)
+        await scheduler.process_update(update(1, 2), handle(2))
+        gate.set()
+        await asyncio.gather(*tasks)
+        return scheduler, ran
+
+    scheduler, ran = asyncio.run(main())
+    assert ran == [0, 1]
+    assert scheduler.shed == 1
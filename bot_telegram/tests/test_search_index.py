@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+import search_index
+from search_index import EntityIndex, normalize, _in_scope, _on_write, get_index
+
+def labels(results):
+    return [entry.label for _, entry in results]
+
+@pytest.fixture
+def index():
+    index = EntityIndex()
+    index.upsert("contacts", {"id": 1, "name": "John Smith", "company": "Acme"})
+    index.upsert("contacts", {"id": 2, "name": "Joanna Smythe", "company": None})
+    index.upsert("tasks", {"id": 7, "title": "Read book"})
+    return index
+
+def test_normalize_strips_accents_and_punctuation():
+    assert normalize("  Café-Müller, GmbH! ") == "cafe muller gmbh"
+
+def test_search_matches_prefixes_typos_and_kinds(index):
+    assert set(labels(index.search("jo sm"))) == {"John Smith", "Joanna Smythe"}
+    assert labels(index.search("jhon smith"))[0] == "John Smith"
+    assert labels(index.search("book", kinds={"task"})) == ["Read book"]
+    assert index.search("book", kinds={"contact"}) == []
+
+def test_exact_label_ranks_first(index):
+    score, entry = index.search("read book")[0]
+    assert entry.kind == "task" and entry.id == "7"
+    assert score == 1.0
+
+def test_renames_and_deletes_prune_postings(index):
+    before = (len(index.postings), len(index.token_keys))
+    index.upsert("tasks", {"id": 7, "title": "Write report"})
+    assert index.search("read book") == []
+    assert labels(index.search("report")) == ["Write report"]
+    assert "book" not in index.token_keys and "book" not in index.sorted_tokens
+
+    index.remove("tasks", 7)
+    index.remove("tasks", 7)  # already gone: no-op
+    assert len(index) == 2
+    assert "report" not in index.sorted_tokens
+    assert index.sorted_tokens == sorted(index.token_keys)
+    assert len(index.postings) < before[0] and len(index.token_keys) < before[1]
+
+def test_bulk_loading_sorts_tokens_once():
+    index = EntityIndex()
+    index.loading = True
+    for i, name in enumerate(["zed", "amy", "max"]):
+        index.upsert("contacts", {"id": i, "name": name})
+    assert index.sorted_tokens == []
+    index.finish_loading()
+    assert index.sorted_tokens == ["amy", "max", "zed"]
+    assert labels(index.search("ma")) == ["max"]
+
+@pytest.mark.parametrize("scope, row, visible", [
+    (("u", None), {"user_id": "u", "workflow_id": None}, True),
+    (("u", None), {"user_id": "u", "workflow_id": "w"}, False),
+    (("u", "w"), {"user_id": "u", "workflow_id": "w"}, True),
+    (("u", "w"), {"user_id": "v", "workflow_id": "w"}, False),
+    ((None, "w"), {"user_id": "v", "workflow_id": "w"}, True),
+    ((None, None), {"user_id": "v", "workflow_id": "w"}, True),
+])
+def test_in_scope_follows_the_list_query_scope(scope, row, visible):
+    assert _in_scope(scope, row) is visible
+
+@pytest.fixture
+def scopes(monkeypatch):
+    """Two built scopes of one user: personal and workflow w."""
+    monkeypatch.setattr(search_index, "_indexes", search_index.TTLCache(maxsize=8, ttl=60))
+    personal, workflow = EntityIndex(), EntityIndex()
+    search_index._indexes.set(("u", None), personal)
+    search_index._indexes.set(("u", "w"), workflow)
+    return personal, workflow
+
+def test_writes_move_rows_between_scopes(scopes):
+    personal, workflow = scopes
+    _on_write("tasks", "insert", [{"id": 1, "user_id": "u", "workflow_id": None, "title": "Call Ann"}])
+    assert len(personal) == 1 and len(workflow) == 0
+
+    _on_write("tasks", "update", [{"id": 1, "user_id": "u", "workflow_id": "w", "title": "Call Ann"}])
+    assert len(personal) == 0 and labels(workflow.search("call ann")) == ["Call Ann"]
+    assert personal.postings == {} and personal.sorted_tokens == []
+
+    _on_write("tasks", "delete", [{"id": 1}])
+    assert len(workflow) == 0
+
+def test_unscoped_updates_only_touch_scopes_holding_the_row(scopes):
+    personal, workflow = scopes
+    personal.upsert("tasks", {"id": 1, "title": "Old"})
+    _on_write("tasks", "update", [{"id": 1, "title": "New"}])
+    assert labels(personal.search("new")) == ["New"]
+    assert len(workflow) == 0
+
+def test_concurrent_callers_share_one_build(monkeypatch):
+    monkeypatch.setattr(search_index, "_indexes", search_index.TTLCache(maxsize=8, ttl=60))
+    scans = []
+
+    async def iter_rows(table, user_id=None, workflow_id=None, columns="*"):
+        scans.append(table)
+        await asyncio.sleep(0.01)
+        if table == "contacts":
+            yield {"id": 1, "name": "Ann", "company": None}
+
+    monkeypatch.setattr(search_index, "iter_rows", iter_rows)
+
+    async def main():
+        first = asyncio.create_task(get_index("u"))
+        second = asyncio.create_task(get_index("u"))
+        await asyncio.sleep(0)
+        # One caller giving up must not cancel the shared build
+        first.cancel()
+        index = await second
+        assert await get_index("u") is index
+        return index
+
+    index = asyncio.run(main())
+    assert len(index) == 1
+    assert sorted(scans) == sorted(search_index.INDEXED_TABLES)
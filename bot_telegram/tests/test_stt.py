@@ -0,0 +1,42 @@
+import pytest
+from stt import _opus_seconds, _too_long, STTBackend, VoiceRejected, MAX_VOICE_SECONDS
+
+def ogg_page(granule, body, first=False):
+    """One Ogg page with a single lacing segment table for body."""
+    lacing = [255] * (len(body) // 255) + [len(body) % 255]
+    header = (
+        b"OggS" + bytes([0, 2 if first else 0])
+        + granule.to_bytes(8, "little", signed=True)
+        + b"\0" * 12  # serial, sequence, checksum
+        + bytes([len(lacing)])
+    )
+    return header + bytes(lacing) + body
+
+def opus_stream(*granules):
+    pages = [ogg_page(0, b"OpusHead" + b"\1" * 11, first=True), ogg_page(0, b"OpusTags" + b"\0" * 8)]
+    pages += [ogg_page(g, b"\x55" * 300) for g in granules]
+    return b"".join(pages)
+
+def test_opus_seconds_uses_the_last_granule():
+    assert _opus_seconds(opus_stream(48000, 96000, 144000)) == 3.0
+
+def test_opus_seconds_takes_the_largest_granule():
+    assert _opus_seconds(opus_stream(96000, -1)) == 2.0
+
+def test_opus_seconds_ignores_other_formats():
+    assert _opus_seconds(b"RIFF....WAVEfmt ") is None
+    assert _opus_seconds(ogg_page(0, b"\x01vorbis" + b"\0" * 20, first=True)) is None
+
+def test_opus_seconds_stops_at_a_truncated_page():
+    data = opus_stream(48000, 96000)
+    assert _opus_seconds(data[:-100]) == 2.0
+    assert _opus_seconds(data + b"garbage") == 2.0
+
+def test_too_long_reports_the_cap():
+    error = _too_long(MAX_VOICE_SECONDS + 0.7)
+    assert isinstance(error, VoiceRejected)
+    assert str(error) == f"Voice note is {MAX_VOICE_SECONDS}s long, the limit is {MAX_VOICE_SECONDS}s."
+
+def test_backends_must_implement_transcribe():
+    with pytest.raises(TypeError):
+        STTBackend()
@@ -0,0 +1,19 @@
+import pytest
+from webhook import route_key, worker_for
+
+@pytest.mark.parametrize("update, key", [
+    ({"update_id": 1, "message": {"from": {"id": 42}, "chat": {"id": -5}}}, 42),
+    ({"update_id": 1, "callback_query": {"from": {"id": 43}, "message": {"chat": {"id": 1}}}}, 43),
+    ({"update_id": 1, "channel_post": {"chat": {"id": -100}}}, -100),
+    ({"update_id": 1, "poll": {"id": "5", "question": "?"}}, None),
+    ({"update_id": 1}, None),
+])
+def test_route_key_is_the_sender(update, key):
+    assert route_key(update) == key
+
+def test_a_user_always_lands_on_the_same_worker():
+    message = {"update_id": 1, "message": {"from": {"id": 7}, "chat": {"id": 7}, "text": "hi"}}
+    callback = {"update_id": 2, "callback_query": {"from": {"id": 7}, "data": "confirm"}}
+    assert worker_for(message, 4) == worker_for(callback, 4) == 3
+    # Updates without a sender go to worker 0
+    assert worker_for({"update_id": 3}, 4) == 0
@@ -0,0 +1,238 @@
+import os
+import time
+import bisect
+import logging
+import contextvars
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Lightweight tracing for the update hot path.
+#
+# span(kind, name) times one step: a Supabase query ("db"), a chat completion
+# ("llm"), a transcription ("stt") or a Bot API call ("telegram"). Every span
+# lands in a latency histogram, and when it runs inside an update it is also
+# added to that update's Trace (held in a context variable, so tasks spawned
+# by the handler report into the same trace). When the update finishes its
+# total and per-kind breakdown go into histograms, and slow updates are logged
+# with the breakdown.
+#
+# Histograms are rendered in the Prometheus text format by render_histograms().
+# A span costs two perf_counter() calls and a bisect, so tracing stays on in
+# production. With BOT_OTEL=1 and the OpenTelemetry SDK installed, spans are
+# also exported over OTLP (configured by the usual OTEL_* variables).
+
+SLOW_UPDATE_SECONDS = float(os.environ.get("BOT_TRACE_SLOW_SECONDS", "5"))
+OTEL_ENABLED = os.environ.get("BOT_OTEL", "0").lower() in ("1", "true", "yes", "on")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, in the Prometheus model."""
+
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self.series.items()):
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {series[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return "\n".join(lines)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+SPAN_SECONDS = Histogram("bot_span_seconds", "Latency of one traced step.", ("kind", "name"))
+UPDATE_SECONDS = Histogram("bot_update_seconds", "End-to-end handling time per update.", ("type",))
+UPDATE_STAGE_SECONDS = Histogram("bot_update_stage_seconds", "Time one update spent per kind of step.", ("stage",))
+HISTOGRAMS = (SPAN_SECONDS, UPDATE_SECONDS, UPDATE_STAGE_SECONDS)
+
+def render_histograms():
+    return "\n".join(h.render() for h in HISTOGRAMS)
+
+# --- Optional OpenTelemetry export ---
+
+_tracer = None
+
+def _setup_otel():
+    global _tracer
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        logger.warning("BOT_OTEL is set but the OpenTelemetry SDK / OTLP exporter is not installed")
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": os.environ.get("OTEL_SERVICE_NAME", "crm-telegram-bot")}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("bot_telegram")
+
+if OTEL_ENABLED:
+    _setup_otel()
+
+# --- Spans and per-update traces ---
+
+class Trace:
+    """Per-update accumulator: seconds and call count per kind of step.
+
+    Stages are summed, so steps run concurrently can add up to more than the
+    update's wall time.
+    """
+
+    __slots__ = ("update_id", "type", "started", "stages")
+
+    def __init__(self, update_id, type):
+        self.update_id = update_id
+        self.type = type
+        self.started = time.perf_counter()
+        self.stages = {}  # kind -> [seconds, calls]
+
+    def add(self, kind, seconds):
+        stage = self.stages.get(kind)
+        if stage is None:
+            self.stages[kind] = [seconds, 1]
+        else:
+            stage[0] += seconds
+            stage[1] += 1
+
+    def breakdown(self):
+        return ", ".join(
+            f"{kind} {seconds:.2f}s ({calls})"
+            for kind, (seconds, calls) in sorted(self.stages.items(), key=lambda s: -s[1][0])
+        )
+
+_current = contextvars.ContextVar("trace", default=None)
+
+def current_trace():
+    return _current.get()
+
+class span:
+    """Time a step: ``async with span("db", "tasks"):`` or ``with span(...)``."""
+
+    __slots__ = ("kind", "name", "started", "_otel")
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self._otel = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self._otel = _tracer.start_as_current_span(f"{self.kind} {self.name}", attributes={"bot.kind": self.kind})
+            self._otel.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        SPAN_SECONDS.observe(elapsed, self.kind, self.name)
+        trace = _current.get()
+        if trace is not None:
+            trace.add(self.kind, elapsed)
+        if self._otel is not None:
+            self._otel.__exit__(exc_type, exc, tb)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+def update_type(update):
+    """Coarse update label for metrics: callback, voice, document, command or message."""
+    if getattr(update, "callback_query", None):
+        return "callback"
+    message = getattr(update, "effective_message", None)
+    if message is None:
+        return "other"
+    if message.voice:
+        return "voice"
+    if message.document:
+        return "document"
+    if message.text and message.text.startswith("/"):
+        return "command"
+    return "message"
+
+class trace_update:
+    """Collect the spans of one update; records its histograms on exit.
+
+    queued: seconds the update waited in the scheduler before it started.
+    """
+
+    __slots__ = ("trace", "queued", "_token", "_otel")
+
+    def __init__(self, update, queued=0.0):
+        self.trace = Trace(getattr(update, "update_id", None), update_type(update))
+        self.queued = queued
+        self._otel = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self._otel = _tracer.start_as_current_span(f"update {self.trace.type}", attributes={
+                "telegram.update_id": self.trace.update_id or 0, "bot.queued_seconds": self.queued,
+            })
+            self._otel.__enter__()
+        if self.queued:
+            self.trace.add("queue", self.queued)
+        self._token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        trace = self.trace
+        total = time.perf_counter() - trace.started + self.queued
+        UPDATE_SECONDS.observe(total, trace.type)
+        for kind, (seconds, _) in trace.stages.items():
+            UPDATE_STAGE_SECONDS.observe(seconds, kind)
+        if total >= SLOW_UPDATE_SECONDS:
+            logger.warning(f"Slow {trace.type} update {trace.update_id}: {total:.2f}s — {trace.breakdown()}")
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"{trace.type} update {trace.update_id}: {total:.2f}s — {trace.breakdown()}")
+        if self._otel is not None:
+            self._otel.__exit__(exc_type, exc, tb)
+        return False
+
+# --- Bot API calls ---
+
+TELEGRAM_POOL_SIZE = int(os.environ.get("BOT_TELEGRAM_POOL_SIZE", "256"))
+
+def _bot_method(url):
+    # .../bot<token>/sendMessage -> sendMessage; file downloads share one name
+    if "/file/bot" in url:
+        return "download"
+    return url.rsplit("/", 1)[-1]
+
+class TracedRequest(HTTPXRequest):
+    """HTTPXRequest that records a "telegram" span per Bot API call."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        async with span("telegram", _bot_method(url)):
+            return await super().do_request(url, method, *args, **kwargs)
+
+def traced_request():
+    return TracedRequest(connection_pool_size=TELEGRAM_POOL_SIZE)
@@ -0,0 +1,159 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Transcription cache. Entries are keyed two ways:
+#   "fuid:<file_unique_id>"  - known before downloading, so forwarded notes
+#                              skip the download as well as Whisper
+#   "sha:<sha256 of audio>"  - catches the same audio re-uploaded under a new id
+#
+# An in-memory LRU sits in front of an optional SQLite file
+# (BOT_TRANSCRIPT_CACHE_PATH; unset keeps the cache memory-only).
+
+MEMORY_SIZE = int(os.environ.get("BOT_TRANSCRIPT_CACHE_SIZE", "1024"))
+TTL = float(os.environ.get("BOT_TRANSCRIPT_CACHE_TTL", str(30 * 24 * 3600)))
+DISK_MAX_ENTRIES = int(os.environ.get("BOT_TRANSCRIPT_CACHE_DISK_ENTRIES", "20000"))
+
+def audio_key(data):
+    return "sha:" + hashlib.sha256(data).hexdigest()
+
+def file_key(file_unique_id):
+    return f"fuid:{file_unique_id}"
+
+class SQLiteTranscriptStore:
+    """Transcripts in a local SQLite file, expired by TTL and capped at max_entries rows."""
+
+    def __init__(self, path, ttl=TTL, max_entries=DISK_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS transcripts_created_at ON transcripts (created_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _get(self, keys):
+        placeholders = ",".join("?" for _ in keys)
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT text FROM transcripts WHERE key IN ({placeholders}) AND created_at > ? LIMIT 1",
+                (*keys, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, keys, text):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO transcripts (key, text, created_at) VALUES (?, ?, ?)",
+                [(key, text, now) for key in keys],
+            )
+            self._writes += 1
+            # Prune now and then rather than on every insert
+            if self._writes % 100 == 1:
+                conn.execute("DELETE FROM transcripts WHERE created_at <= ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM transcripts WHERE key IN ("
+                    "SELECT key FROM transcripts ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    # sqlite3 is blocking, keep it off the event loop
+    async def get(self, keys):
+        return await asyncio.to_thread(self._get, keys)
+
+    async def set(self, keys, text):
+        await asyncio.to_thread(self._set, keys, text)
+
+class TranscriptCache:
+    """Two-tier transcript cache (memory LRU, then optional SQLite) with hit/miss counters."""
+
+    def __init__(self, store=None, maxsize=MEMORY_SIZE, ttl=TTL):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.store = store
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "errors": 0}
+
+    async def get(self, *keys, count_miss=True):
+        """First cached transcript for any of keys.
+
+        Pass count_miss=False for a probe that will be followed by another
+        lookup for the same note, so one cold note counts as one miss.
+        """
+        keys = [k for k in keys if k]
+        for key in keys:
+            text = self.memory.get(key)
+            if text is not None:
+                self.stats["memory_hits"] += 1
+                return text
+
+        if self.store is not None and keys:
+            try:
+                text = await self.store.get(keys)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Transcript cache read failed: {e}")
+                text = None
+            if text is not None:
+                self.stats["disk_hits"] += 1
+                for key in keys:
+                    self.memory.set(key, text)
+                return text
+
+        if count_miss:
+            self.stats["misses"] += 1
+        return None
+
+    async def set(self, keys, text):
+        keys = [k for k in keys if k]
+        for key in keys:
+            self.memory.set(key, text)
+        if self.store is not None and keys:
+            try:
+                await self.store.set(keys, text)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Transcript cache write failed: {e}")
+
+    def snapshot(self):
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory": self.memory.stats(),
+            "disk": self.store is not None,
+        }
+
+_cache = None
+
+def get_transcript_cache():
+    """Module-level cache; SQLite tier enabled by BOT_TRANSCRIPT_CACHE_PATH."""
+    global _cache
+    if _cache is None:
+        path = os.environ.get("BOT_TRANSCRIPT_CACHE_PATH")
+        store = None
+        if path:
+            try:
+                store = SQLiteTranscriptStore(path)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Transcript cache file unavailable, using memory only: {e}")
+        _cache = TranscriptCache(store)
+    return _cache
+
+def get_transcript_stats():
+    return get_transcript_cache().snapshot()
@@ -1,4 +1,5 @@
 import random
+from html import escape
 from datetime import datetime
 
 TREVOR_GREETINGS = [
@@ -34,3 +35,30 @@ def format_date(date_str):
         return date_obj.strftime("%Y-%m-%d %H:%M")
     except:
         return date_str
+
+def _amount(value):
+    # Amounts are stored as display text ("$1,500") in most rows
+    if isinstance(value, str) and value.strip().startswith("$"):
+        return value.strip()
+    return format_currency(value)
+
+# User-facing line templates for list results (models.Row) rendered without the LLM.
+# Values are HTML-escaped; **bold** is converted by handlers.format_text.
+LIST_TEMPLATES = {
+    "contacts": ("👥 Contacts", lambda c: f"• {escape(c.name)}" + (f" — {escape(c.company)}" if c.company else "")),
+    "deals": ("💰 Deals", lambda d: f"• {escape(d.title)} — {_amount(d.amount)} ({escape(d.status or '?')})"),
+    "tasks": ("📝 Tasks", lambda t: f"• {'✅ ' if t.completed else ''}{escape(t.title)}" + (f" — due {format_date(t.due_date)}" if t.due_date else "")),
+    "debts": ("💸 Debts", lambda d: f"• {escape(d.borrower_name)}: {_amount(d.amount_lent)} ({escape(d.status or '?')})"),
+    "events": ("📅 Events", lambda e: f"• {escape(e.title or '')} — {format_date(e.date or '')}" + (f" {escape(e.time)}" if e.time else "")),
+}
+
+def render_list(kind, rows, page=1, page_size=10):
+    """Render one page of rows for the user (no IDs), using LIST_TEMPLATES."""
+    title, line = LIST_TEMPLATES[kind]
+    header = f"**{title}**" + (f" (page {page})" if page > 1 else "")
+    if not rows:
+        return f"{header}\nNothing here. Empty. Nada."
+    lines = [line(r) for r in rows[:page_size]]
+    if len(rows) > page_size:
+        lines.append("…and more. Ask for the next page.")
+    return header + "\n" + "\n".join(lines)
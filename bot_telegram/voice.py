@@ -1,16 +1,59 @@
 import os
-from openai import OpenAI
-
-def transcribe_audio(file_path):
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not set")
-    
-    client = OpenAI(api_key=api_key)
-    
-    with open(file_path, "rb") as audio_file:
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file
-        )
-    return transcript.text
+from io import BytesIO
+from stt import get_stt_router, VoiceRejected, MAX_VOICE_SECONDS, _too_long
+from transcripts import get_transcript_cache, audio_key, file_key
+
+# Voice notes are downloaded into memory and transcribed from there, so
+# nothing touches the filesystem (the bot runs on read-only containers).
+MAX_VOICE_BYTES = int(os.environ.get("BOT_VOICE_MAX_BYTES", str(20 * 1024 * 1024)))
+
+def _too_big(size, limit=MAX_VOICE_BYTES):
+    return VoiceRejected(f"Voice note is {size // 1024} KB, the limit is {limit // 1024} KB.")
+
+def check_limits(file_size=None, duration=None):
+    """Raise VoiceRejected if Telegram's metadata is already over the caps."""
+    if file_size and file_size > MAX_VOICE_BYTES:
+        raise _too_big(file_size)
+    if duration and duration > MAX_VOICE_SECONDS:
+        raise _too_long(duration)
+
+async def transcribe_bytes(data, mime_type="audio/ogg", duration=None):
+    """Transcribe an in-memory audio payload with the configured STT backend."""
+    if len(data) > MAX_VOICE_BYTES:
+        raise _too_big(len(data))
+    return await get_stt_router().transcribe(data, mime_type, duration)
+
+async def download_voice(file, max_bytes=MAX_VOICE_BYTES):
+    """Download a Telegram File into memory and return its bytes."""
+    with BytesIO() as buffer:
+        await file.download_to_memory(buffer)
+        if buffer.tell() > max_bytes:
+            raise _too_big(buffer.tell(), max_bytes)
+        return buffer.getvalue()
+
+async def transcribe_voice(bot, voice):
+    """Transcript for a Telegram Voice, served from the transcript cache when possible.
+
+    A forwarded note hits on file_unique_id before anything is downloaded;
+    re-uploaded audio hits on its content hash before any STT backend runs.
+    """
+    cache = get_transcript_cache()
+    fuid = file_key(voice.file_unique_id) if voice.file_unique_id else None
+    # The content-hash lookup below counts the miss if this one misses
+    text = await cache.get(fuid, count_miss=False)
+    if text is not None:
+        return text
+
+    # Reject oversized notes before downloading anything
+    check_limits(voice.file_size, voice.duration)
+    file = await bot.get_file(voice.file_id)
+    audio = await download_voice(file)
+    sha = audio_key(audio)
+    text = await cache.get(sha)
+    if text is None:
+        text = await transcribe_bytes(audio, voice.mime_type, voice.duration)
+    del audio
+
+    if text:
+        await cache.set([fuid, sha], text)
+    return text
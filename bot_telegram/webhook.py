@@ -0,0 +1,226 @@
+import os
+import signal
+import asyncio
+import logging
+import multiprocessing
+from contextlib import asynccontextmanager
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, PlainTextResponse
+from starlette.routing import Route
+from telegram import Bot, Update
+from main import load_env, build_application, post_shutdown, ALLOWED_UPDATES, BOT_COMMANDS
+from stt import get_stt_router
+from reminders import start_reminders
+from changefeed import start_changefeed
+from metrics import metrics_endpoint, start_metrics_server, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Webhook mode (BOT_MODE=webhook).
+#
+# Telegram POSTs updates to BOT_WEBHOOK_URL; nginx forwards BOT_WEBHOOK_PATH to
+# this Starlette app (the nginx location must match BOT_WEBHOOK_PATH, which
+# defaults to /telegram).
+#
+# With BOT_WEBHOOK_WORKERS=1 (the default) the app hands each update to the
+# Application in its own process. With N > 1 it only dispatches: each update
+# goes to one of N worker processes, each running its own Application, picked
+# from the sender's user id. A user always lands on the same worker, so their
+# user_data (pending actions, history) and the scheduler's per-user ordering
+# stay in one process, and the persistence store is what they share across
+# workers and restarts. Reminders run in worker 0 only. Set BOT_METRICS_PORT
+# to have worker i serve /metrics on BOT_METRICS_PORT + i.
+
+WEBHOOK_WORKERS = int(os.environ.get("BOT_WEBHOOK_WORKERS", "1"))
+
+def _webhook_path():
+    return os.environ.get("BOT_WEBHOOK_PATH", "/telegram")
+
+def route_key(data):
+    """User (or chat) id of a raw update, the same key the scheduler orders by."""
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        owner = value.get("from") or value.get("user") or value.get("chat") or (value.get("message") or {}).get("chat")
+        if isinstance(owner, dict) and isinstance(owner.get("id"), int):
+            return owner["id"]
+        return None
+    return None
+
+def worker_for(data, workers):
+    key = route_key(data)
+    return key % workers if key is not None else 0
+
+def _build_app(dispatch, lifespan, healthy=lambda: True, metrics=True):
+    secret = os.environ.get("BOT_WEBHOOK_SECRET")
+
+    async def telegram_webhook(request: Request) -> Response:
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return Response(status_code=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return Response(status_code=400)
+        # Ack immediately; the scheduler processes the update in the background
+        return Response(status_code=await dispatch(data))
+
+    async def healthz(request: Request) -> Response:
+        if not healthy():
+            return PlainTextResponse("worker down", status_code=503)
+        return PlainTextResponse("ok")
+
+    routes = [
+        Route(_webhook_path(), telegram_webhook, methods=["POST"]),
+        Route("/healthz", healthz, methods=["GET"]),
+    ]
+    if metrics:
+        # Not public: nginx only forwards the webhook path
+        routes.append(Route("/metrics", metrics_endpoint, methods=["GET"]))
+    return Starlette(routes=routes, lifespan=lifespan)
+
+def create_app() -> Starlette:
+    """uvicorn factory: the bot itself, or a dispatcher to BOT_WEBHOOK_WORKERS processes."""
+    load_env()
+    if WEBHOOK_WORKERS > 1:
+        return _dispatcher_app(WEBHOOK_WORKERS)
+
+    application = build_application(os.environ["TELEGRAM_BOT_TOKEN"], updater=False)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await application.initialize()
+        await application.start()
+        # Load local STT models before taking updates
+        await get_stt_router().warm_up()
+        start_changefeed()
+        start_reminders(application)
+        try:
+            yield
+        finally:
+            await application.stop()
+            await application.shutdown()
+            await post_shutdown(application)
+
+    async def dispatch(data):
+        try:
+            update = Update.de_json(data, application.bot)
+        except Exception as e:
+            logger.warning(f"Rejected malformed webhook body: {e}")
+            return 400
+        if update is None:
+            return 400
+        await application.update_queue.put(update)
+        return 200
+
+    return _build_app(dispatch, lifespan)
+
+# --- Worker processes (BOT_WEBHOOK_WORKERS > 1) ---
+
+def _dispatcher_app(workers):
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue() for _ in range(workers)]
+    # Not daemonic: the local STT backend starts a process pool of its own
+    processes = [
+        context.Process(target=_worker_main, args=(index, queue), name=f"bot-worker-{index}")
+        for index, queue in enumerate(queues)
+    ]
+
+    @asynccontextmanager
+    async def lifespan(app):
+        for process in processes:
+            process.start()
+        logger.info(f"Started {workers} webhook workers")
+        try:
+            yield
+        finally:
+            for queue in queues:
+                queue.put(None)
+            # Workers flush persistence on the way out, so wait for them
+            await asyncio.to_thread(_join, processes)
+
+    async def dispatch(data):
+        if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+            return 400
+        index = worker_for(data, workers)
+        if not processes[index].is_alive():
+            # Telegram retries on errors, so the update isn't lost
+            logger.error(f"Webhook worker {index} is down (exit code {processes[index].exitcode})")
+            return 503
+        queues[index].put(data)
+        return 200
+
+    # The dispatcher has no Application; each worker serves its own metrics
+    return _build_app(dispatch, lifespan, healthy=lambda: all(p.is_alive() for p in processes), metrics=False)
+
+def _join(processes, timeout=30):
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            logger.warning(f"{process.name} did not stop in {timeout}s, terminating it")
+            process.terminate()
+
+def _worker_main(index, queue):
+    # The dispatcher stops workers through their queue; Ctrl-C reaches the
+    # whole process group and would otherwise skip the persistence flush
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_serve_worker(index, queue))
+
+async def _serve_worker(index, queue):
+    load_env()
+    application = build_application(os.environ["TELEGRAM_BOT_TOKEN"], updater=False)
+    await application.initialize()
+    await application.start()
+    await get_stt_router().warm_up()
+    start_changefeed()
+    if index == 0:
+        start_reminders(application)
+    if METRICS_PORT:
+        start_metrics_server(port=METRICS_PORT + index)
+    logger.info(f"Webhook worker {index} ready")
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:
+                break
+            try:
+                update = Update.de_json(data, application.bot)
+            except Exception as e:
+                logger.warning(f"Worker {index} dropped malformed update {data.get('update_id')}: {e}")
+                continue
+            await application.update_queue.put(update)
+    finally:
+        await application.stop()
+        await application.shutdown()
+        await post_shutdown(application)
+
+async def register_webhook(token: str) -> None:
+    """Point Telegram at our webhook URL (done once, before the server starts)."""
+    url = os.environ.get("BOT_WEBHOOK_URL")
+    if not url:
+        raise ValueError("BOT_WEBHOOK_URL must be set in webhook mode")
+
+    async with Bot(token) as bot:
+        await bot.set_webhook(
+            url=url,
+            allowed_updates=ALLOWED_UPDATES,
+            secret_token=os.environ.get("BOT_WEBHOOK_SECRET"),
+            max_connections=int(os.environ.get("BOT_WEBHOOK_MAX_CONNECTIONS", "40")),
+        )
+        await bot.set_my_commands(BOT_COMMANDS)
+
+def run_webhook(token: str) -> None:
+    """Register the webhook and serve it with uvicorn."""
+    asyncio.run(register_webhook(token))
+
+    print("Trevor Philips Bot is listening for webhooks... Don't fuck it up.")
+    uvicorn.run(
+        "webhook:create_app",
+        factory=True,
+        host=os.environ.get("BOT_WEBHOOK_HOST", "0.0.0.0"),
+        port=int(os.environ.get("BOT_WEBHOOK_PORT", "8080")),
+        log_level="info",
+    )
@@ -0,0 +1,23 @@
+-- Persistent Telegram bot state (context.user_data), one row per Telegram user.
+-- Used by the bot when BOT_PERSISTENCE=supabase. Only the service role touches it.
+CREATE TABLE IF NOT EXISTS public.bot_user_data (
+    telegram_id BIGINT PRIMARY KEY,
+    data JSONB NOT NULL DEFAULT '{}'::jsonb,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- RLS on with no policies: not readable through the anon/authenticated keys
+ALTER TABLE public.bot_user_data ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.touch_bot_user_data()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS touch_bot_user_data ON public.bot_user_data;
+CREATE TRIGGER touch_bot_user_data
+    BEFORE UPDATE ON public.bot_user_data
+    FOR EACH ROW EXECUTE FUNCTION public.touch_bot_user_data();
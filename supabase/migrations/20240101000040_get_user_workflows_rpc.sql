@@ -0,0 +1,21 @@
+-- Single round-trip workflow listing for the Telegram bot.
+-- Returns every workflow the user created or is a member of, creator's own first.
+-- Runs as the caller (no SECURITY DEFINER), so RLS still applies to non-service keys.
+CREATE OR REPLACE FUNCTION public.get_user_workflows(p_user_id UUID)
+RETURNS SETOF public.workflows
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+  SELECT w.*
+  FROM public.workflows w
+  WHERE w.creator_id = p_user_id
+     OR EXISTS (
+       SELECT 1 FROM public.workflow_members wm
+       WHERE wm.workflow_id = w.id AND wm.user_id = p_user_id
+     )
+  ORDER BY (w.creator_id = p_user_id) DESC, w.created_at;
+$$;
+
+-- Supports the EXISTS lookup above
+CREATE INDEX IF NOT EXISTS idx_workflow_members_user_id ON public.workflow_members(user_id);
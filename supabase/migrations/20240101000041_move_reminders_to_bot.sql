@@ -0,0 +1,17 @@
+-- Reminders are now delivered by the Telegram bot (bot_telegram/reminders.py).
+-- It keeps unsent reminders in a due-time heap and only wakes when one is due,
+-- so stop the per-minute process_reminders() scan to avoid sending twice.
+-- The function is kept for manual runs; set BOT_REMINDERS=0 and reschedule
+-- the job to go back to cron delivery.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM cron.job WHERE jobname = 'process-reminders') THEN
+        PERFORM cron.unschedule('process-reminders');
+    END IF;
+END $$;
+
+-- The bot's refresh only reads unsent reminders up to a cutoff date
+CREATE INDEX IF NOT EXISTS idx_calendar_events_pending_reminder ON public.calendar_events(date) WHERE reminder_sent = FALSE;
+CREATE INDEX IF NOT EXISTS idx_tasks_pending_reminder ON public.tasks(due_date) WHERE reminder_sent = FALSE;
+CREATE INDEX IF NOT EXISTS idx_deals_pending_reminder ON public.deals(reminder_date) WHERE reminder_sent = FALSE;
+CREATE INDEX IF NOT EXISTS idx_debts_pending_reminder ON public.debts(reminder_date) WHERE reminder_sent = FALSE;
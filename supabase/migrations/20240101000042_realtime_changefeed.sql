@@ -0,0 +1,25 @@
+-- The Telegram bot keeps in-memory copies of these tables current through
+-- Supabase Realtime (bot_telegram/changefeed.py). Publish their changes, and
+-- log full old rows so DELETEs and workflow moves carry user_id / workflow_id.
+ALTER TABLE public.contacts REPLICA IDENTITY FULL;
+ALTER TABLE public.deals REPLICA IDENTITY FULL;
+ALTER TABLE public.tasks REPLICA IDENTITY FULL;
+ALTER TABLE public.debts REPLICA IDENTITY FULL;
+ALTER TABLE public.calendar_events REPLICA IDENTITY FULL;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_publication WHERE pubname = 'supabase_realtime') THEN
+        CREATE PUBLICATION supabase_realtime;
+    END IF;
+    FOREACH t IN ARRAY ARRAY['contacts', 'deals', 'tasks', 'debts', 'calendar_events'] LOOP
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_publication_tables
+            WHERE pubname = 'supabase_realtime' AND schemaname = 'public' AND tablename = t
+        ) THEN
+            EXECUTE format('ALTER PUBLICATION supabase_realtime ADD TABLE public.%I', t);
+        END IF;
+    END LOOP;
+END $$;